@@ -1,7 +1,10 @@
-from .protocol import HTTP2CommonProtocol, HANDSHAKE_CODE
-from .frame import Frame, SettingsFrame, DataFrame, FrameHeader
+from .protocol import HTTP2CommonProtocol, HTTP2DirectProtocolMixin, HANDSHAKE_CODE
+from .frame import Frame, SettingsFrame, DataFrame, ErrorCode
+from .codec import unpack_header
+from .exceptions import StreamReset
 import asyncio
 import collections
+import itertools
 
 import logging
 import sys
@@ -10,35 +13,70 @@ logger = logging.getLogger('http2')
 logger.setLevel(logging.INFO)
 
 class HTTP2ClientConnection(HTTP2CommonProtocol):
+    # Times a request refused by the server is sent again.
+    max_refused_retries = 3
+
     def __init__(self, client_settings):
         super().__init__(is_client=True)
         self._client_settings = client_settings
 
     @asyncio.coroutine
     def request(self, method, resource, body=None, headers={}):
+        """
+        Send a request, returning the response once its headers arrive. The
+        body may be bytes-like, a str, an async iterable of those, or a file
+        object, the last two being streamed as the server makes room for it.
+        """
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+
+        # A refused request was never processed by the server, so it's
+        # safe to send it again. Unless part of a streamed body was used up.
+        replayable = body is None or isinstance(body, (bytes, bytearray, memoryview))
+        for attempt in itertools.count():
+            try:
+                return (yield from self._request(method, resource, body, headers))
+            except StreamReset as e:
+                if (e.error_code != ErrorCode.REFUSED_STREAM or not replayable or
+                        attempt >= self.max_refused_retries):
+                    raise
+                logger.debug('Request was refused, retrying (attempt %s)', attempt + 1)
+                # The server is at capacity, give it until one of our other
+                # requests is done.
+                if self._slot_streams:
+                    yield from self._stream_slot_released.wait()
+
+    @asyncio.coroutine
+    def _request(self, method, resource, body, headers):
+        # Requests over the server's MAX_CONCURRENT_STREAMS wait their turn
+        # here, rather than being refused by the server.
+        yield from self._acquire_stream_slot()
+
         logger.info('Creating request stream.')
         stream = self._new_stream()
-        stream.add_header(':method', method.upper(), is_request_header=True)
-        stream.add_header(':path', resource, is_request_header=True)
-        stream.add_header(':scheme', 'http', is_request_header=True)  # TODO(roasbeef): Need to add HTTPS support
-        stream.add_header(':authority', self._host, is_request_header=True)
+        self._slot_streams.add(stream.stream_id)
+        try:
+            stream.add_header(':method', method.upper(), is_request_header=True)
+            stream.add_header(':path', resource, is_request_header=True)
+            stream.add_header(':scheme', 'http', is_request_header=True)  # TODO(roasbeef): Need to add HTTPS support
+            stream.add_header(':authority', self._host, is_request_header=True)
 
-        for header_key, header_val in headers.items():
-            stream.add_header(header_key, header_val, is_request_header=True)
+            for header_key, header_val in headers.items():
+                stream.add_header(header_key, header_val, is_request_header=True)
 
-        if isinstance(body, str):
-            body = body.encode('utf-8')
+            logger.debug('Opening request stream: %s', stream.stream_id)
+            # Officially 'open' the stream, by sendin over our HEADERS.
+            yield from stream.open_request(body=body, end_stream=True)
 
-        logger.info('Opening request stream: %s' % stream.stream_id)
-        # Officially 'open' the stream, by sendin over our HEADERS.
-        yield from stream.open_request(body=body, end_stream=True)
+            logger.debug('Waiting for the response stream: %s', stream.stream_id)
+            return (yield from stream.consume_response())
+        except BaseException:
+            # The slot is normally given back once the response ends.
+            self._release_stream_slot(stream.stream_id)
+            raise
 
-        logger.info('Waiting for the response stream: %s' % stream.stream_id)
-        return (yield from stream.consume_response())
 
-
-    @asyncio.coroutine
-    def settings_handshake(self, host):
+    def _send_preface(self, host):
         self._host = host
 
         logger.info('Creating our settings handshake')
@@ -49,24 +87,58 @@ class HTTP2ClientConnection(HTTP2CommonProtocol):
         logger.info('Client sending settings frame')
         self.writer.write(our_settings.serialize())
 
+    def _complete_handshake(self, settings_frame):
+        logger.info('Updating our settings')
+        self.update_settings(settings_frame)
+        logger.info('CLIENT HANDSHAKE DONE')
+        self._connection_header_exchanged.set_result(True)
+
+    @asyncio.coroutine
+    def settings_handshake(self, host):
+        self._send_preface(host)
+
         logger.info('Getting the server settings frame header')
-        header_bytes = yield from self.reader.read(8)
-        frame_header = FrameHeader.from_raw_bytes(header_bytes)
+        header_bytes = yield from self.reader.readexactly(8)
+        length, raw_type, raw_flags, stream_id = unpack_header(header_bytes)
 
         logger.info('Getting the payload from the server')
-        payload_bytes = yield from self.reader.read(frame_header.length)
-        frame = Frame.from_frame_header(frame_header)
+        payload_bytes = yield from self.reader.readexactly(length)
+        frame = Frame.from_raw_header(raw_type, raw_flags, stream_id)
 
         frame.deserialize(payload_bytes)
-        logger.info('Updating our settings')
-        self.update_settings(frame)
-        logger.info('CLIENT HANDSHAKE DONE')
-        self._connection_header_exchanged.set_result(True)
+        self._complete_handshake(frame)
+
+
+
+class HTTP2DirectClientConnection(HTTP2DirectProtocolMixin, HTTP2ClientConnection):
+    """ HTTP2ClientConnection which reads frames straight off the transport. """
+    pass
 
 
+def select_connection(connections):
+    """
+    Pick the connection a new request is likely to get its response back on
+    the soonest: the lowest smoothed RTT, scaled by the number of streams
+    already sharing the connection. Connections without an RTT sample yet are
+    tried first, so that they get one. Returns None if all of them are closed.
+    """
+    def expected_latency(connection):
+        if connection.rtt.srtt is None:
+            return 0.0
+        return connection.rtt.srtt * (1 + len(connection._streams))
+
+    open_connections = [connection for connection in connections
+                        if not connection._connection_closed.done()]
+    if not open_connections:
+        return None
+    return min(open_connections, key=expected_latency)
+
 
 @asyncio.coroutine
-def connect(uri, options={}, *, klass=HTTP2ClientConnection, **kwargs):
+def connect(uri, options={}, *, klass=None, direct=False, **kwargs):
+    if klass is None:
+        klass = HTTP2DirectClientConnection if direct else HTTP2ClientConnection
+
     logger.info('Connecting to server')
     host, port = uri.split(':')
     transport, protocol = yield from asyncio.get_event_loop().create_connection(
@@ -0,0 +1,184 @@
+"""
+Precompiled wire layouts and the raw type byte dispatch table used by the
+frame (de)serialization hot path.
+"""
+from .exceptions import ProtocolError
+
+import struct
+
+FRAME_HEADER_LENGTH = 8
+
+# Frame header: length (with the 2 reserved bits), type, flags, stream id.
+HEADER_STRUCT = struct.Struct('!HBBL')
+# Pad High + Pad Low fields that prefix DATA, HEADERS and CONTINUATION frames.
+PADDING_STRUCT = struct.Struct('!BB')
+# A single 32-bit field, used for priorities, error codes, stream ids and
+# window increments.
+UINT32_STRUCT = struct.Struct('!L')
+# Opaque data of a PING frame, when it's used as a counter.
+UINT64_STRUCT = struct.Struct('!Q')
+# Single SETTINGS entry, identifier followed by its value.
+SETTING_STRUCT = struct.Struct('!BL')
+# Last-Stream-ID and Error Code of a GOAWAY frame.
+GO_AWAY_STRUCT = struct.Struct('!LL')
+
+# Indexed by the raw frame type byte, filled in by `register_frame_class` as
+# the frame module is imported. Unknown type bytes map to None.
+FRAME_DISPATCH = [None] * 256
+
+
+def register_frame_class(frame_klass):
+    FRAME_DISPATCH[frame_klass.frame_type.value] = frame_klass
+    return frame_klass
+
+
+def unpack_header(buf, offset=0):
+    """
+    Decode the 8 byte frame header found at `offset` within `buf`. Returns a
+    tuple of (payload_length, raw_type, raw_flags, stream_id), no Enum members
+    are created.
+    """
+    length, raw_type, raw_flags, stream_id = HEADER_STRUCT.unpack_from(buf, offset)
+    # Knock off the reserved bits of both the length, and the stream id.
+    return length & 0x3FFF, raw_type, raw_flags, stream_id & 0x7FFFFFFF
+
+
+def pack_header(length, raw_type, raw_flags, stream_id):
+    return HEADER_STRUCT.pack(length & 0x3FFF, raw_type, raw_flags,
+                              stream_id & 0x7FFFFFFF)
+
+
+def frame_class(raw_type):
+    frame_klass = FRAME_DISPATCH[raw_type]
+    if frame_klass is None:
+        raise ProtocolError()
+    return frame_klass
+
+
+def decode_frame(buf, offset=0, lazy=False):
+    """
+    Decode a complete frame starting at `offset` within `buf`. Returns the
+    parsed frame along with the offset just past its payload. Lazy frames only
+    have their header decoded, the payload is parsed on first access.
+    """
+    length, raw_type, raw_flags, stream_id = unpack_header(buf, offset)
+    payload_start = offset + FRAME_HEADER_LENGTH
+    payload_end = payload_start + length
+
+    if lazy:
+        frame = frame_class(raw_type).lazy_from_raw(raw_type, raw_flags, stream_id,
+                                                    buf[payload_start:payload_end])
+    else:
+        frame = frame_class(raw_type)(stream_id)
+        frame.parse_flags(raw_flags)
+        frame.deserialize(buf[payload_start:payload_end])
+
+    return frame, payload_end
+
+
+class FrameEncoder(object):
+    """
+    Encodes any number of frames into a single reusable output buffer, which
+    is then sent off with one transport write. Payloads of at least
+    `copy_threshold` bytes aren't copied into the buffer, the views from
+    `Frame.serialize_parts` are passed through to `writelines` alongside it.
+    """
+
+    def __init__(self, initial_size=16384, copy_threshold=4096):
+        self._buffer = bytearray(initial_size)
+        self._offset = 0
+        self._copy_threshold = copy_threshold
+
+        # Sections of the pending output, as (start, end) regions of the
+        # buffer, or payload views which weren't copied in.
+        self._segments = []
+        self._segment_start = 0
+        self._pending_frames = 0
+        self._pending_bytes = 0
+
+        self.frames_encoded = 0
+        self.bytes_flushed = 0
+        self.flush_count = 0
+        self.last_flush_frames = 0
+        self.last_flush_bytes = 0
+
+    def __len__(self):
+        """ Number of frames waiting to be flushed. """
+        return self._pending_frames
+
+    @property
+    def pending_bytes(self):
+        return self._pending_bytes
+
+    @property
+    def frames_per_flush(self):
+        return self.frames_encoded / self.flush_count if self.flush_count else 0.0
+
+    @property
+    def bytes_per_flush(self):
+        return self.bytes_flushed / self.flush_count if self.flush_count else 0.0
+
+    def _append(self, data):
+        data_length = len(data)
+        if not data_length:
+            return
+
+        end = self._offset + data_length
+        if end > len(self._buffer):
+            # Grow geometrically, so a burst of frames only resizes a couple
+            # of times.
+            self._buffer.extend(bytes(max(end, 2 * len(self._buffer)) - len(self._buffer)))
+        self._buffer[self._offset:end] = data
+        self._offset = end
+
+    def _close_segment(self):
+        if self._offset > self._segment_start:
+            self._segments.append((self._segment_start, self._offset))
+        self._segment_start = self._offset
+
+    def encode(self, frame):
+        header_bytes, payload, padding = frame.serialize_parts()
+
+        self._append(header_bytes)
+        if len(payload) >= self._copy_threshold:
+            self._close_segment()
+            self._segments.append(payload)
+        else:
+            self._append(payload)
+        self._append(padding)
+
+        self._pending_frames += 1
+        self._pending_bytes += len(header_bytes) + len(payload) + len(padding)
+
+    def flush(self, transport):
+        """ Write all the encoded frames to `transport`, in a single call. """
+        if not self._pending_frames:
+            return
+
+        self._close_segment()
+        buffer_view = memoryview(self._buffer)
+        output = [buffer_view[segment[0]:segment[1]] if isinstance(segment, tuple) else segment
+                  for segment in self._segments]
+        if len(output) == 1:
+            transport.write(output[0])
+        else:
+            transport.writelines(output)
+        del output, buffer_view
+
+        # Some transports keep views of what couldn't be sent right away. If
+        # anything is still queued, leave the old buffer to the transport
+        # rather than overwriting it.
+        if transport.get_write_buffer_size():
+            self._buffer = bytearray(len(self._buffer))
+
+        self.frames_encoded += self._pending_frames
+        self.bytes_flushed += self._pending_bytes
+        self.flush_count += 1
+        self.last_flush_frames = self._pending_frames
+        self.last_flush_bytes = self._pending_bytes
+
+        self._segments = []
+        self._offset = 0
+        self._segment_start = 0
+        self._pending_frames = 0
+        self._pending_bytes = 0
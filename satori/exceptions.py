@@ -20,3 +20,18 @@ class FrameSizeError(ConnectionError):
 
 class FlowControlError(ConnectionError):
     pass
+
+
+class StreamReset(StreamError):
+    """ The peer reset the stream, with `error_code`. """
+    def __init__(self, error_code):
+        super().__init__(error_code)
+        self.error_code = error_code
+
+
+class CompressionError(ConnectionError):
+    """ A header block couldn't be decoded, the HPACK context is lost. """
+
+
+class HeaderListTooLarge(StreamError):
+    """ A header block decoded into more than the max header list size. """
@@ -0,0 +1,101 @@
+"""
+Receive side flow control. Each stream, and the connection as a whole, keeps a
+`ReceiveWindow` which tracks the credit handed to the peer, and grows itself
+to match the measured bandwidth-delay product of the link.
+"""
+from .exceptions import FlowControlError
+
+DEFAULT_WINDOW_SIZE = 65535
+# Largest window allowed by the spec.
+MAX_WINDOW_SIZE = 2 ** 31 - 1
+
+
+class ReceiveWindow(object):
+    """
+    Credit for DATA the peer may send us. Received bytes use up credit, which
+    is only handed back with a WINDOW_UPDATE once `update_threshold` of the
+    window has been consumed by the application, rather than frame by frame.
+
+    The window is auto-tuned: between a PING and its ACK, the number of bytes
+    the application consumed is a sample of the bandwidth-delay product. If a
+    sample uses up most of the window, the window is what's holding back
+    throughput, so it's grown to twice the sample, up to `max_size`. Since
+    growth is driven by consumption, a reader which can't keep up never causes
+    more to be buffered.
+    """
+    __slots__ = ('size', 'max_size', 'update_threshold', 'available', 'pending_update',
+                 '_advertised_size', 'bytes_received', 'bytes_consumed', '_sample_start',
+                 'last_sample', 'consumption_rate')
+
+    def __init__(self, initial_size=DEFAULT_WINDOW_SIZE, max_size=16 * 2 ** 20,
+                 update_threshold=0.5):
+        self.size = initial_size
+        self.max_size = min(max(max_size, initial_size), MAX_WINDOW_SIZE)
+        self.update_threshold = update_threshold
+
+        # Credit the peer has left, bytes consumed but not yet credited, and
+        # the window size the peer was last told about.
+        self.available = initial_size
+        self.pending_update = 0
+        self._advertised_size = initial_size
+
+        self.bytes_received = 0
+        self.bytes_consumed = 0
+
+        self._sample_start = None
+        self.last_sample = 0
+        self.consumption_rate = 0.0
+
+    def data_received(self, size):
+        """ Account for a received DATA frame, of `size` flow controlled bytes. """
+        if size > self.available:
+            raise FlowControlError()
+        self.available -= size
+        self.bytes_received += size
+
+    def data_consumed(self, size):
+        """
+        Account for `size` bytes handed over to the application. Returns the
+        WINDOW_UPDATE increment which should be sent, or 0 if it's not yet
+        worth sending one.
+        """
+        self.bytes_consumed += size
+        self.pending_update += size
+        return self.window_update()
+
+    def window_update(self):
+        # Hand back the consumed credit, along with any growth of the window
+        # since the last update. Growth is advertised right away.
+        growth = self.size - self._advertised_size
+        if growth <= 0 and self.pending_update < self.size * self.update_threshold:
+            return 0
+
+        increment = self.pending_update + growth
+        self.available += increment
+        self.pending_update = 0
+        self._advertised_size = self.size
+        return increment
+
+    def start_sample(self):
+        self._sample_start = self.bytes_consumed
+
+    def end_sample(self, rtt):
+        """ Finish a bandwidth-delay product sample, taken over `rtt` seconds. """
+        if self._sample_start is None:
+            return
+
+        sample = self.bytes_consumed - self._sample_start
+        self._sample_start = None
+        self.last_sample = sample
+        if rtt > 0:
+            self.consumption_rate = sample / rtt
+
+        if sample * 3 >= self.size * 2:
+            self.grow(2 * sample)
+
+    def grow(self, size):
+        """
+        Grow the window to `size`, within `max_size`. The extra credit goes
+        out with the next WINDOW_UPDATE.
+        """
+        self.size = int(min(max(size, self.size), self.max_size))
@@ -2,13 +2,18 @@
 """
 from enum import IntEnum, Enum
 from .exceptions import ProtocolError, FrameSizeError, FlowControlError
-
-import struct
+from .codec import (HEADER_STRUCT, PADDING_STRUCT, UINT32_STRUCT, SETTING_STRUCT,
+                    GO_AWAY_STRUCT, FRAME_DISPATCH, register_frame_class,
+                    unpack_header, frame_class)
 
 MAX_FRAME_SIZE = (2 ** 14) - 1
 MAX_WINDOW_UPDATE = (2 ** 31) - 1
 DEFAULT_PRIORITY = (2 ** 30)
 
+# Shared source of padding bytes, large enough for the maximum Pad High and
+# Pad Low values. Slicing it never copies.
+ZERO_PADDING = memoryview(bytes(256 * 256))
+
 
 class ConnectionSetting(Enum):
     HEADER_TABLE_SIZE = 0x01
@@ -67,6 +72,24 @@ class FrameFlag(Enum):
         return {FrameFlag[flag_name] for flag_name in flag_names}
 
 
+# Raw bit values of the flags above. Frames store their flags as a plain int,
+# so the hot paths test against these rather than going through the Enums.
+FLAG_END_STREAM = FrameFlag.END_STREAM.value
+FLAG_END_HEADERS = FrameFlag.END_HEADERS.value
+FLAG_PRIORITY = FrameFlag.PRIORITY.value
+FLAG_PAD_LOW = FrameFlag.PAD_LOW.value
+FLAG_PAD_HIGH = FrameFlag.PAD_HIGH.value
+FLAG_ACK = SpecialFrameFlag.ACK.value
+FLAG_END_PUSH_PROMISE = SpecialFrameFlag.END_PUSH_PROMISE.value
+
+
+def flag_bits_from_set(flags):
+    raw_flags = 0
+    for flag_type in flags:
+        raw_flags |= flag_type.value
+    return raw_flags
+
+
 class FrameHeader(object):
     """
      0                   1                   2                   3
@@ -93,32 +116,21 @@ class FrameHeader(object):
         return '<FrameHeader length:{}, frame_type:{}, flags:{}, stream_id:{}>'.format(
             self.length,
             FRAME_TYPE_TO_FRAME[self.frame_type].__name__,
-            '<{}>'.format(','.join(str(flag_type.name) for flag_type in FrameFlag if self.flags & flag_type.value)),
+            '<{}>'.format(','.join(str(flag_type.name) for flag_type in FrameFlag if self.raw_flag_bits & flag_type.value)),
             self.stream_id
         )
 
     @classmethod
-    def from_raw_bytes(cls, frame_bytes):
-        header_fields = struct.unpack('!HBBL', frame_bytes)
-        # Knock off the first 2 bits, they are reserved, and currently unused.
-        payload_length = header_fields[0] & 0x3FFF
-        frame_type = header_fields[1]
-        raw_flags = header_fields[2]
-        stream_id = header_fields[3]
-
-        return cls(payload_length, FrameType(frame_type), raw_flags, stream_id)
+    def from_raw_bytes(cls, frame_bytes, offset=0):
+        payload_length, raw_type, raw_flags, stream_id = unpack_header(frame_bytes, offset)
+        return cls(payload_length, frame_class(raw_type).frame_type, raw_flags, stream_id)
 
     @classmethod
     def from_frame(cls, frame):
-        raw_flags = 0
-        for flag_type in frame.flags:
-            raw_flags |= flag_type.value
-
-        return cls(len(frame), frame.frame_type, raw_flags, frame.stream_id)
+        return cls(len(frame), frame.frame_type, frame.flag_bits, frame.stream_id)
 
     def serialize(self):
-        return struct.pack(
-            '!HBBL',
+        return HEADER_STRUCT.pack(
             self.length & 0x3FFF,  # Knock off first two bits.
             self.frame_type.value,
             self.raw_flag_bits,
@@ -127,40 +139,146 @@ class FrameHeader(object):
 
 
 class Frame(object):
+    __slots__ = ('stream_id', 'flag_bits', 'length', '_raw_payload')
 
     frame_type = None
     defined_flags = set()
+    # Bitmask of `defined_flags`, filled in for each class at import time.
+    defined_flag_bits = 0
+    # Frames which are only valid on a stream, or only on the connection
+    # (stream 0). Checked off the frame header, ahead of the payload.
+    stream_only = False
+    connection_only = False
 
     def __init__(self, stream_id, flags=None, length=0):
         self.stream_id = stream_id
-        self.flags = flags if flags is not None else set()
+        # Flags may be given as either a raw bitmask, or a set of flag Enums.
+        if flags is None:
+            self.flag_bits = 0
+        elif isinstance(flags, int):
+            self.flag_bits = flags
+        else:
+            self.flag_bits = flag_bits_from_set(flags)
         self.length = length
+        # Only set for lazily parsed frames which haven't been decoded yet.
+        self._raw_payload = None
+
+    def __getattr__(self, name):
+        # Only reached when a slot hasn't been set, which for a lazy frame means
+        # one of its payload fields is being accessed for the first time.
+        if name == '_raw_payload' or self._raw_payload is None:
+            raise AttributeError(name)
+
+        self.decode_payload()
+        return getattr(self, name)
 
     def __len__(self):
         # TODO(roasbeef): Delete this method?
         return self.length
 
     def __repr__(self):
+        if not self.is_decoded:
+            return '<{}| length: {}, flags: {}, stream_id: {}, lazy>'.format(
+                FRAME_TYPE_TO_FRAME[self.frame_type].__name__,
+                self.length,
+                '<{}>'.format(','.join(str(flag_type.name) for flag_type in self.flags)),
+                self.stream_id,
+            )
+
         return '<{}| length: {}, flags: {}, stream_id: {}, data: {}>'.format(
             FRAME_TYPE_TO_FRAME[self.frame_type].__name__,
             len(self),
-            '<{}>'.format(','.join(str(flag_type.name) for flag_type in self.defined_flags if flag_type in self.flags)),
+            '<{}>'.format(','.join(str(flag_type.name) for flag_type in self.flags)),
             self.stream_id,
-            (self.data if isinstance(self, DataFrame) else b''),
+            (bytes(self.data) if isinstance(self, DataFrame) else b''),
         )
 
     @staticmethod
     def from_frame_header(frame_header):
-        frame_klass = FRAME_TYPE_TO_FRAME[frame_header.frame_type]
+        frame_klass = FRAME_DISPATCH[frame_header.frame_type.value]
 
         parsed_frame = frame_klass(frame_header.stream_id)
         parsed_frame.parse_flags(frame_header.raw_flag_bits)
         return parsed_frame
 
+    @staticmethod
+    def from_raw_header(raw_type, raw_flags, stream_id):
+        """ Like `from_frame_header`, but skips the FrameHeader entirely. """
+        parsed_frame = frame_class(raw_type)(stream_id)
+        parsed_frame.parse_flags(raw_flags)
+        return parsed_frame
+
+    @staticmethod
+    def lazy_from_raw(raw_type, raw_flags, stream_id, payload):
+        """
+        Create a frame from its header fields, holding on to the raw payload
+        without decoding it. The payload is only deserialized the first time
+        one of its fields is accessed, the stream id, type, flags and length
+        are available right away.
+        """
+        frame_klass = frame_class(raw_type)
+        # The constructor isn't run until the payload is decoded, but a frame
+        # on the wrong kind of stream is an error right away.
+        if ((frame_klass.stream_only and stream_id == 0) or
+                (frame_klass.connection_only and stream_id != 0)):
+            raise ProtocolError()
+
+        lazy_frame = frame_klass.__new__(frame_klass)
+        lazy_frame.stream_id = stream_id
+        lazy_frame.flag_bits = raw_flags & frame_klass.defined_flag_bits
+        lazy_frame.length = len(payload)
+        lazy_frame._raw_payload = payload
+        return lazy_frame
+
+    @property
+    def is_decoded(self):
+        return self._raw_payload is None
+
+    def decode_payload(self):
+        """ Deserialize the held payload of a lazy frame, if not done already. """
+        raw_payload = self._raw_payload
+        if raw_payload is None:
+            return
+
+        # Run the regular constructor to fill in the defaults of all the
+        # payload fields, then parse over them.
+        type(self).__init__(self, self.stream_id, flags=self.flag_bits,
+                            length=self.length)
+        self.deserialize(raw_payload)
+
+    @property
+    def flags(self):
+        """
+        The flag Enums which are set on this frame. Built on each access, so
+        the hot paths should stick to `flag_bits` and the properties below.
+        It's a frozenset, flags are changed with `set_flag` and `clear_flag`.
+        """
+        if not self.defined_flags:
+            return frozenset()
+        return frozenset(flag_type for flag_type in self.defined_flags
+                         if self.flag_bits & flag_type.value)
+
+    def set_flag(self, flag_type):
+        self.flag_bits |= flag_type.value
+
+    def clear_flag(self, flag_type):
+        self.flag_bits &= ~flag_type.value
+
+    @property
+    def end_stream(self):
+        return bool(self.flag_bits & FLAG_END_STREAM)
+
+    @property
+    def end_headers(self):
+        return bool(self.flag_bits & FLAG_END_HEADERS)
+
+    @property
+    def has_priority(self):
+        return bool(self.flag_bits & FLAG_PRIORITY)
+
     def parse_flags(self, flag_byte):
-        for flag_type in self.defined_flags:
-            if flag_byte & flag_type.value:
-                self.flags.add(flag_type)
+        # Drop any bits which aren't defined for this frame type.
+        self.flag_bits = flag_byte & self.defined_flag_bits
 
     def deserialize(self, frame_payload):
         raise NotImplementedError
@@ -168,6 +286,14 @@ class Frame(object):
     def serialize(self):
         raise NotImplementedError
 
+    def serialize_parts(self):
+        """
+        Serialize the frame as a (header_bytes, payload, padding) triple which
+        can be handed straight to `writelines`. Frames without a variable length
+        payload put everything into the header bytes.
+        """
+        return (self.serialize(), b'', b'')
+
 
 class DataFrame(Frame):
     """
@@ -181,8 +307,10 @@ class DataFrame(Frame):
     |                           Padding (*)                       ...
     +---------------------------------------------------------------+
     """
+    __slots__ = ('data', 'pad_high', 'pad_low', 'total_padding')
 
     frame_type = FrameType.DATA
+    stream_only = True
     defined_flags = FrameFlag.create_flag_set('END_STREAM', 'END_SEGMENT',
                                               'PAD_LOW', 'PAD_HIGH')
 
@@ -201,23 +329,32 @@ class DataFrame(Frame):
         return 2 + len(self.data) + self.total_padding
 
     def deserialize(self, frame_payload):
-        self.pad_high = frame_payload[0] if FrameFlag.PAD_HIGH in self.flags else 0
-        self.pad_low = frame_payload[1] if FrameFlag.PAD_LOW in self.flags else 0
+        self._deserialize_padded(memoryview(frame_payload), data_start=2)
+
+    def _deserialize_padded(self, payload, data_start):
+        # The data is kept as a view into the received payload, nothing is
+        # copied here.
+        self.pad_high = payload[0] if self.flag_bits & FLAG_PAD_HIGH else 0
+        self.pad_low = payload[1] if self.flag_bits & FLAG_PAD_LOW else 0
 
         self.total_padding = (self.pad_high * 256) + self.pad_low
-        if self.total_padding > len(frame_payload[2:]):
+        if self.total_padding > len(payload) - data_start:
             raise ProtocolError()
 
         # TODO(roasbeef): Enforce max frame size, tests and such.
-        self.data = frame_payload[2:len(frame_payload) - self.total_padding]
+        self.data = payload[data_start:len(payload) - self.total_padding]
 
     def serialize(self, pad_low=0, pad_high=0):
-        frame_header = FrameHeader.from_frame(self).serialize()
+        return b''.join(self.serialize_parts(pad_low, pad_high))
 
-        padding_bytes = ((pad_high * 256) + pad_low) * struct.pack('!x')
-        pad_low_and_high = struct.pack('!BB', pad_high, pad_low)
+    def serialize_parts(self, pad_low=0, pad_high=0):
+        # The data itself is never copied, only viewed.
+        frame_header = FrameHeader.from_frame(self).serialize()
+        pad_low_and_high = PADDING_STRUCT.pack(pad_high, pad_low)
 
-        return frame_header + pad_low_and_high + self.data + padding_bytes
+        return (frame_header + pad_low_and_high,
+                memoryview(self.data),
+                ZERO_PADDING[:(pad_high * 256) + pad_low])
 
 
 class HeadersFrame(DataFrame):
@@ -234,6 +371,10 @@ class HeadersFrame(DataFrame):
     |                           Padding (*)                       ...
     +---------------------------------------------------------------+
     """
+    # The decoded header list is filled in by the connection, once the whole
+    # header block has been received. None if it was too large.
+    __slots__ = ('priority', 'headers')
+
     frame_type = FrameType.HEADERS
     defined_flags = FrameFlag.create_flag_set('END_STREAM', 'END_SEGMENT',
                                               'END_HEADERS', 'PRIORITY',
@@ -244,27 +385,29 @@ class HeadersFrame(DataFrame):
 
         #self.priority = DEFAULT_PRIORITY if priority is None else priority
         self.priority = None
+        self.headers = None
 
     def __len__(self):
         return 2 + (4 if self.priority is not None else 0) + len(self.data) + self.total_padding
 
     def deserialize(self, frame_payload):
-        if FrameFlag.PRIORITY in self.flags:
+        if self.flag_bits & FLAG_PRIORITY:
             # Grab the priority, snip off the reserved bit.
-            self.priority = struct.unpack('!L', frame_payload[2:6])[0] & 0x7FFFFFFF
-            # Slice off the 4 priority bytes, at this point it's like a regular
+            self.priority = UINT32_STRUCT.unpack_from(frame_payload, 2)[0] & 0x7FFFFFFF
+            # Skip over the 4 priority bytes, past them it's like a regular
             # DataFrame payload.
-            frame_payload = frame_payload[:2] + frame_payload[6:]
-
-        super().deserialize(frame_payload)
+            self._deserialize_padded(memoryview(frame_payload), data_start=6)
+        else:
+            self._deserialize_padded(memoryview(frame_payload), data_start=2)
 
-    def serialize(self, pad_low=0, pad_high=0):
-        serialized_frame = super().serialize(pad_low, pad_high)
-        if FrameFlag.PRIORITY not in self.flags:
-            return serialized_frame
+    def serialize_parts(self, pad_low=0, pad_high=0):
+        header_bytes, data, padding = super().serialize_parts(pad_low, pad_high)
+        if not self.flag_bits & FLAG_PRIORITY:
+            return header_bytes, data, padding
         else:
-            priority_bytes = struct.pack('!L', self.priority)
-            return serialized_frame[:10] + (priority_bytes) + serialized_frame[10:]
+            # The priority sits right after the Pad High and Pad Low fields.
+            priority_bytes = UINT32_STRUCT.pack(self.priority)
+            return header_bytes + priority_bytes, data, padding
 
 
 class PriorityFrame(Frame):
@@ -275,7 +418,10 @@ class PriorityFrame(Frame):
     |X|                        Priority (31)                        |
     +-+-------------------------------------------------------------+
     """
+    __slots__ = ('priority',)
+
     frame_type = FrameType.PRIORITY
+    stream_only = True
     defined_flags = None
 
     def __init__(self, stream_id, **kwargs):
@@ -293,11 +439,11 @@ class PriorityFrame(Frame):
         if len(frame_payload) != 4:
             raise ProtocolError()
 
-        self.priority = struct.unpack('!L', frame_payload)[0] & 0x7FFFFFFF
+        self.priority = UINT32_STRUCT.unpack(frame_payload)[0] & 0x7FFFFFFF
 
     def serialize(self):
         frame_header = FrameHeader.from_frame(self).serialize()
-        return frame_header + struct.pack('!L', self.priority & 0x7FFFFFFF)
+        return frame_header + UINT32_STRUCT.pack(self.priority & 0x7FFFFFFF)
 
 
 class RstStreamFrame(Frame):
@@ -308,7 +454,10 @@ class RstStreamFrame(Frame):
     |                        Error Code (32)                        |
     +---------------------------------------------------------------+
     """
+    __slots__ = ('error_code',)
+
     frame_type = FrameType.RST_STREAM
+    stream_only = True
     defined_flags = None
 
     def __init__(self, stream_id, error_code=ErrorCode.NO_ERROR, **kwargs):
@@ -324,14 +473,14 @@ class RstStreamFrame(Frame):
             raise ProtocolError()
 
         try:
-            self.error_code = ErrorCode(struct.unpack('!L', frame_payload)[0])
+            self.error_code = ErrorCode(UINT32_STRUCT.unpack(frame_payload)[0])
         except ValueError:
             # Not valid code, yatata...
             raise ProtocolError()
 
     def serialize(self):
         frame_header = FrameHeader.from_frame(self).serialize()
-        return frame_header + struct.pack('!L', self.error_code.value)
+        return frame_header + UINT32_STRUCT.pack(self.error_code.value)
 
 
 class SettingsFrame(Frame):
@@ -345,7 +494,10 @@ class SettingsFrame(Frame):
     +---------------+
 
     """
+    __slots__ = ('settings',)
+
     frame_type = FrameType.SETTINGS
+    connection_only = True
     defined_flags = {SpecialFrameFlag.ACK}
 
     def __init__(self, stream_id=0, settings=None, **kwargs):
@@ -356,7 +508,7 @@ class SettingsFrame(Frame):
         super().__init__(stream_id, **kwargs)
 
     def __len__(self):
-        if SpecialFrameFlag.ACK in self.flags:
+        if self.flag_bits & FLAG_ACK:
             return 0
         else:
             # 5 bytes per setting.
@@ -364,20 +516,20 @@ class SettingsFrame(Frame):
 
     @property
     def is_ack(self):
-        return SpecialFrameFlag.ACK in self.flags
+        return bool(self.flag_bits & FLAG_ACK)
 
     def deserialize(self, frame_payload):
         # A settings ACK frame must have no data.
-        if SpecialFrameFlag.ACK in self.flags and len(frame_payload):
+        if self.flag_bits & FLAG_ACK and len(frame_payload):
+            raise FrameSizeError()
+
+        if len(frame_payload) % SETTING_STRUCT.size:
             raise FrameSizeError()
 
-        # Process a frame at a time by splitting up into 5 byte chunks.
-        settings_chunks = (frame_payload[i:i + 5] for i in range(0, len(frame_payload), 5))
-        for setting_chunk in settings_chunks:
+        # Process a setting at a time, each one is a 5 byte chunk.
+        for setting_key, setting_value in SETTING_STRUCT.iter_unpack(frame_payload):
             # TODO(roasbeef): Make sure flow control size value isn't above
             # 2^31-1
-            setting_key = setting_chunk[0]
-            setting_value = struct.unpack('!L', setting_chunk[1:])[0]
 
             try:
                 self.settings[ConnectionSetting(setting_key)] = setting_value
@@ -392,7 +544,7 @@ class SettingsFrame(Frame):
         settings.append(settings_header)
 
         for setting_key, setting_value in self.settings.items():
-            settings.append(struct.pack('!BL', setting_key.value, setting_value))
+            settings.append(SETTING_STRUCT.pack(setting_key.value, setting_value))
 
         return b''.join(settings)
 
@@ -407,7 +559,11 @@ class PushPromise(Frame):
     |                 Header Block Fragment (*)                   ...
     +---------------------------------------------------------------+
     """
+    # See HeadersFrame for `headers`.
+    __slots__ = ('promised_stream_id', 'data', 'headers')
+
     frame_type = FrameType.PUSH_PROMISE
+    stream_only = True
     # TODO(roasbeef): If this is NOT set, then the next frame on the
     # promised_stream_id MUST be a ContinuationFrame.
     defined_flags = {SpecialFrameFlag.END_PUSH_PROMISE}
@@ -422,19 +578,23 @@ class PushPromise(Frame):
 
         self.promised_stream_id = 0
         self.data = b''
+        self.headers = None
 
     def __len__(self):
         return 4 + len(self.data)
 
     def deserialize(self, frame_payload):
-        self.promised_stream_id = struct.unpack('!L', frame_payload[:4])[0] & 0x7FFFFFFF
-        self.data = frame_payload[4:]
+        self.promised_stream_id = UINT32_STRUCT.unpack_from(frame_payload)[0] & 0x7FFFFFFF
+        self.data = memoryview(frame_payload)[4:]
 
     def serialize(self):
+        return b''.join(self.serialize_parts())
+
+    def serialize_parts(self):
         frame_header = FrameHeader.from_frame(self).serialize()
-        payload = struct.pack('!L', self.promised_stream_id & 0x7FFFFFFF) + self.data
+        promised_stream_id = UINT32_STRUCT.pack(self.promised_stream_id & 0x7FFFFFFF)
 
-        return frame_header + payload
+        return frame_header + promised_stream_id, memoryview(self.data), b''
 
 
 class PingFrame(Frame):
@@ -447,7 +607,10 @@ class PingFrame(Frame):
     |                                                               |
     +---------------------------------------------------------------+
     """
+    __slots__ = ('opaque_data',)
+
     frame_type = FrameType.PING
+    connection_only = True
     defined_flags = {SpecialFrameFlag.ACK}
 
     @classmethod
@@ -472,7 +635,8 @@ class PingFrame(Frame):
         if len(frame_payload) != 8:
             raise FrameSizeError()
 
-        self.opaque_data = frame_payload
+        # Small enough that holding on to the receive buffer isn't worth it.
+        self.opaque_data = bytes(frame_payload)
 
     def serialize(self):
         frame_header = FrameHeader.from_frame(self).serialize()
@@ -491,38 +655,45 @@ class GoAwayFrame(Frame):
     |                  Additional Debug Data (*)                    |
     +---------------------------------------------------------------+
     """
+    __slots__ = ('last_stream_id', 'error_code', 'debug_data')
 
     frame_type = FrameType.GO_AWAY
+    connection_only = True
     defined_flags = set()
 
-    def __init__(self, stream_id=0, **kwargs):
+    def __init__(self, stream_id=0, last_stream_id=0, error_code=ErrorCode.NO_ERROR,
+                 debug_data=b'', **kwargs):
         if stream_id != 0:
             raise ProtocolError()
 
         super().__init__(stream_id, **kwargs)
 
-        # TODO(roasbeef): Make something like this consistent with all other
-        # framing data structures.
-        self.last_stream_id = kwargs.get('last_stream_id', 0)
-        self.error_code = kwargs.get('error_code', 0)
-        self.debug_data = kwargs.get('debug_data', b'')
+        self.last_stream_id = last_stream_id
+        self.error_code = error_code
+        self.debug_data = debug_data
 
     def __len__(self):
         return 8 + len(self.debug_data)
 
     def deserialize(self, frame_payload):
-        self.last_stream_id = struct.unpack('!L', frame_payload[:4])[0] & 0x7FFFFFFF
+        last_stream_id, error_code = GO_AWAY_STRUCT.unpack_from(frame_payload)
+        self.last_stream_id = last_stream_id & 0x7FFFFFFF
 
         try:
-            self.error_code = ErrorCode(struct.unpack('!L', frame_payload[4:8])[0])
+            self.error_code = ErrorCode(error_code)
         except ValueError:
             raise ProtocolError()
 
-        self.debug_data = frame_payload[8:]
+        self.debug_data = memoryview(frame_payload)[8:]
 
     def serialize(self):
+        return b''.join(self.serialize_parts())
+
+    def serialize_parts(self):
         frame_header = FrameHeader.from_frame(self).serialize()
-        return frame_header + struct.pack('!LL', self.last_stream_id & 0x7FFFFFFF, self.error_code.value) + self.debug_data
+        fixed_fields = GO_AWAY_STRUCT.pack(self.last_stream_id & 0x7FFFFFFF, self.error_code.value)
+
+        return frame_header + fixed_fields, memoryview(self.debug_data), b''
 
 
 class WindowUpdateFrame(Frame):
@@ -533,6 +704,7 @@ class WindowUpdateFrame(Frame):
     |X|              Window Size Increment (31)                     |
     +-+-------------------------------------------------------------+
     """
+    __slots__ = ('connection_update', 'window_size_increment')
 
     frame_type = FrameType.WINDOW_UPDATE
     defined_flags = set()
@@ -552,7 +724,7 @@ class WindowUpdateFrame(Frame):
         if len(frame_payload) != 4:
             raise ProtocolError()
         else:
-            window_increment = struct.unpack('!L', frame_payload)[0]
+            window_increment = UINT32_STRUCT.unpack(frame_payload)[0]
             if window_increment > MAX_WINDOW_UPDATE:
                 raise FlowControlError()
 
@@ -560,7 +732,7 @@ class WindowUpdateFrame(Frame):
 
     def serialize(self):
         frame_header = FrameHeader.from_frame(self).serialize()
-        return frame_header + struct.pack('!L', self.window_size_increment)
+        return frame_header + UINT32_STRUCT.pack(self.window_size_increment)
 
 
 class ContinuationFrame(DataFrame):
@@ -575,6 +747,8 @@ class ContinuationFrame(DataFrame):
     |                           Padding (*)                       ...
     +---------------------------------------------------------------+
     """
+    __slots__ = ()
+
     frame_type = FrameType.CONTINUATION
     defined_flags = FrameFlag.create_flag_set('PAD_LOW', 'PAD_HIGH',
                                               'END_HEADERS')
@@ -592,3 +766,9 @@ FRAME_TYPE_TO_FRAME = {
     FrameType.WINDOW_UPDATE: WindowUpdateFrame,
     FrameType.CONTINUATION: ContinuationFrame
 }
+
+# Fill in the codec's raw type byte dispatch table, and the flag mask of each
+# frame class.
+for frame_klass in FRAME_TYPE_TO_FRAME.values():
+    frame_klass.defined_flag_bits = flag_bits_from_set(frame_klass.defined_flags or ())
+    register_frame_class(frame_klass)
@@ -27,6 +27,15 @@
 
 from struct import pack, unpack
 from .huffman import *
+from .exceptions import CompressionError, HeaderListTooLarge
+
+
+class HeaderBlockTruncated(Exception):
+  """
+  The header block fragment ends part way through a representation.
+  """
+
+
 class HeaderEntry(object):
   """
   Object representing an entry in the header table.
@@ -53,6 +62,7 @@ class HTTP2Codec(object):
     self.max_decoder_size = buffer_size
     self.huffman_decoder = HuffmanDecoder()
     self.huffman_encoder = HuffmanEncoder()
+    self.max_header_list_size = None
 
     self.init_codec()
 
@@ -113,69 +123,142 @@ class HTTP2Codec(object):
 
 
   def decode_headers(self, stream):
-    self.decoded_stream = stream
+    """Decode a whole header block."""
+    self.begin_header_block()
+    self.decode_fragment(stream)
+    return self.end_header_block()
+
+  def begin_header_block(self, max_header_list_size=None):
+    """
+    Start decoding a header block, which is then fed in as it arrives with
+    decode_fragment. Headers past max_header_list_size (counted the way
+    entries are) are dropped, though the table is still kept up to date.
+    """
+    self.decoded_stream = bytearray()
     self.decoded_stream_index = 0
+    self.retry_size = 0
+    self.max_header_list_size = max_header_list_size
+    self.header_list_size = 0
+    self.header_list_too_large = False
 
     # Initialize variables.
-    headers = []
+    self.decoded_headers = []
     for entry in self.decoder_table:
       entry.emitted = False
 
-    # Decode the headers.
+  def decode_fragment(self, fragment):
+    """
+    Decode the headers of a fragment of the header block. A representation
+    cut off at the end of it is kept, and finished with a later fragment.
+    """
+    self.decoded_stream += fragment
+    too_large = (self.max_header_list_size is not None and
+                 len(self.decoded_stream) > self.max_header_list_size)
+
+    # A representation is only tried again once what's buffered of it has
+    # doubled, so one sent in many small fragments costs linear time.
+    if len(self.decoded_stream) >= self.retry_size or too_large:
+      self.decode_buffered()
+
+    # Only a single representation is ever left over. If it's larger than
+    # the whole header list may be, it's never going to fit.
+    if (self.max_header_list_size is not None and
+        len(self.decoded_stream) > self.max_header_list_size):
+      raise CompressionError()
+
+  def decode_buffered(self):
+    """Decode every complete representation buffered up."""
     stream_length = len(self.decoded_stream)
     while self.decoded_stream_index < stream_length:
-      byte = self.read_next_byte()
-
-      # Indexed header.
-      if byte & 0x80:
-        index = self.read_integer(byte, 7)
-        if index == 0:
-            for entry in self.decoder_table:
-                entry.referenced = false
-            for entry in self.encoder_table:
-                entry.referenced = false
-        else:
-            entry = self.get_decoder_index_space_entry(index)
-            # Check if this is a deletion.
-            if entry.referenced:
-                entry.referenced = False
-                entry.emitted = False
-            # Otherwise, this is an addition.
-            else:
-                entry.referenced = True
-                entry.emitted = True
-                headers.append(entry.header)
-
-      # Literal
-      else:
-        if byte & 0xC0 == 0x40:
-          mode = LITERAL_NOT_INDEXED
-          name_index = self.read_integer(byte, 6)
-        elif byte & 0xC0 == 0X00:
-          mode = LITERAL_INCREMENTAL
-          name_index = self.read_integer(byte, 6)
-
-        # Decode header.
-        if name_index == 0:
-          name = self.read_literal_string()
-        else:
-          name = self.get_decoder_index_space_entry(name_index).header[0]
-        value = self.read_literal_string()
+      start = self.decoded_stream_index
+      try:
+        self.decode_representation()
+      except HeaderBlockTruncated:
+        self.decoded_stream_index = start
+        break
+
+    del self.decoded_stream[:self.decoded_stream_index]
+    self.decoded_stream_index = 0
+    self.retry_size = 2 * len(self.decoded_stream)
 
-        # Update header table and working set.
-        if mode == LITERAL_INCREMENTAL:
-          self.prepend_decoded_header(HeaderEntry((name, value), referenced=True, emitted=True))
-        headers.append((name, value))
+  def end_header_block(self):
+    """Finish decoding the header block, and return its headers."""
+    self.decode_buffered()
+    if self.decoded_stream:
+      raise CompressionError()
 
     # Emit remaining headers.
     for entry in self.decoder_table:
       if entry.referenced and not entry.emitted:
-        headers.append(entry.header)
+        self.emit_header(entry.header)
 
+    headers, self.decoded_headers = self.decoded_headers, []
+    if self.header_list_too_large:
+      raise HeaderListTooLarge()
     return dict(headers)
 
+  def emit_header(self, header):
+    """Add a header to the decoded header list, if it's within its limit."""
+    self.header_list_size += self.entry_len(header)
+    if (self.max_header_list_size is not None and
+        self.header_list_size > self.max_header_list_size):
+      self.header_list_too_large = True
+      self.decoded_headers = []
+    if not self.header_list_too_large:
+      self.decoded_headers.append(header)
+
+  def decode_representation(self):
+    """
+    Decode a single header representation. Raises HeaderBlockTruncated
+    before touching any state, if it isn't all there.
+    """
+    byte = self.read_next_byte()
+
+    # Indexed header.
+    if byte & 0x80:
+      index = self.read_integer(byte, 7)
+      if index == 0:
+          for entry in self.decoder_table:
+              entry.referenced = False
+          for entry in self.encoder_table:
+              entry.referenced = False
+      else:
+          entry = self.get_decoder_index_space_entry(index)
+          # Check if this is a deletion.
+          if entry.referenced:
+              entry.referenced = False
+              entry.emitted = False
+          # Otherwise, this is an addition.
+          else:
+              entry.referenced = True
+              entry.emitted = True
+              self.emit_header(entry.header)
+
+    # Literal
+    else:
+      if byte & 0xC0 == 0x40:
+        mode = LITERAL_NOT_INDEXED
+        name_index = self.read_integer(byte, 6)
+      elif byte & 0xC0 == 0X00:
+        mode = LITERAL_INCREMENTAL
+        name_index = self.read_integer(byte, 6)
+
+      # Decode header.
+      if name_index == 0:
+        name = self.read_literal_string()
+      else:
+        name = self.get_decoder_index_space_entry(name_index).header[0]
+      value = self.read_literal_string()
+
+      # Update header table and working set.
+      if mode == LITERAL_INCREMENTAL:
+        self.prepend_decoded_header(HeaderEntry((name, value), referenced=True, emitted=True))
+      self.emit_header((name, value))
+
   def read_next_byte(self):
     """Read a byte from the encoded stream."""
+    if self.decoded_stream_index >= len(self.decoded_stream):
+      raise HeaderBlockTruncated()
     (byte, ) = unpack("!B", self.decoded_stream[self.decoded_stream_index:self.decoded_stream_index + 1])
     self.decoded_stream_index += 1
     return byte
@@ -205,6 +288,8 @@ class HTTP2Codec(object):
     value = ''
     byte = self.read_next_byte()
     length = self.read_integer(byte,7)
+    if self.max_header_list_size is not None and length > self.max_header_list_size:
+      raise CompressionError()
     if byte & 0x80:
       i = 0
       self.huffman_decoder.begin_decoding()
@@ -222,7 +307,9 @@ class HTTP2Codec(object):
             self.huffman_decoder.begin_decoding()
         last_path = result_set[1]
     else:
-      value = self.decoded_stream[self.decoded_stream_index:self.decoded_stream_index + length]
+      if self.decoded_stream_index + length > len(self.decoded_stream):
+        raise HeaderBlockTruncated()
+      value = bytes(self.decoded_stream[self.decoded_stream_index:self.decoded_stream_index + length])
       self.decoded_stream_index += length
     return value
 
@@ -0,0 +1,190 @@
+"""
+Counters kept by every connection and stream. Recording is a handful of
+integer additions, everything derived from them is only worked out when a
+snapshot is taken.
+"""
+from .frame import FrameType
+from .codec import FRAME_HEADER_LENGTH
+
+NUM_FRAME_TYPES = max(frame_type.value for frame_type in FrameType) + 1
+# Frames which make up the response on a stream.
+RESPONSE_FRAME_TYPES = frozenset([FrameType.HEADERS, FrameType.CONTINUATION, FrameType.DATA])
+
+
+def headers_size(headers):
+    """ Size of a header list before compression, as names plus values. """
+    return sum(len(str(name)) + len(str(value)) for name, value in headers.items())
+
+
+def _by_frame_type(counts):
+    return {frame_type.name: counts[frame_type.value] for frame_type in FrameType
+            if counts[frame_type.value]}
+
+
+class StreamMetrics(object):
+    """
+    Per stream counters. Time to first and last byte are measured from the
+    stream being opened, to the first frame and the END_STREAM of the response
+    (sent by a server, received by a client). Timestamps are only taken for
+    those two frames, from the `clock` passed in.
+    """
+    __slots__ = ('opened_at', 'first_byte_at', 'last_byte_at', 'frames_in',
+                 'bytes_in', 'frames_out', 'bytes_out', 'stall_time', '_response_inbound')
+
+    def __init__(self, opened_at, response_inbound):
+        self.opened_at = opened_at
+        self.first_byte_at = None
+        self.last_byte_at = None
+        self.frames_in = 0
+        self.bytes_in = 0
+        self.frames_out = 0
+        self.bytes_out = 0
+        self.stall_time = 0.0
+        self._response_inbound = response_inbound
+
+    def _response_frame(self, frame, clock):
+        if frame.frame_type not in RESPONSE_FRAME_TYPES:
+            return
+        if self.first_byte_at is None:
+            self.first_byte_at = clock()
+        if frame.end_stream:
+            self.last_byte_at = clock()
+
+    def frame_received(self, frame, clock):
+        self.frames_in += 1
+        self.bytes_in += frame.length
+        if self._response_inbound:
+            self._response_frame(frame, clock)
+
+    def frame_sent(self, frame, clock):
+        self.frames_out += 1
+        self.bytes_out += len(frame)
+        if not self._response_inbound:
+            self._response_frame(frame, clock)
+
+    def snapshot(self):
+        return {'frames_in': self.frames_in,
+                'bytes_in': self.bytes_in,
+                'frames_out': self.frames_out,
+                'bytes_out': self.bytes_out,
+                'flow_control_stall_seconds': self.stall_time,
+                'time_to_first_byte': (self.first_byte_at - self.opened_at
+                                       if self.first_byte_at is not None else None),
+                'time_to_last_byte': (self.last_byte_at - self.opened_at
+                                      if self.last_byte_at is not None else None)}
+
+
+class ConnectionMetrics(object):
+    """ Frame, byte, flow control and HPACK counters of a whole connection. """
+
+    def __init__(self):
+        self.frames_in = [0] * NUM_FRAME_TYPES
+        self.bytes_in = [0] * NUM_FRAME_TYPES
+        self.frames_out = [0] * NUM_FRAME_TYPES
+        self.bytes_out = [0] * NUM_FRAME_TYPES
+
+        self.flow_control_stalls = 0
+        self.stall_time = 0.0
+        # New streams turned away with REFUSED_STREAM.
+        self.streams_refused = 0
+        # Times reading was paused, for having too much buffered up.
+        self.read_pauses = 0
+
+        # Header list sizes before and after HPACK, in both directions.
+        self.header_bytes_encoded = 0
+        self.header_bytes_encoded_raw = 0
+        self.header_bytes_decoded = 0
+        self.header_bytes_decoded_raw = 0
+
+    def frame_received(self, frame):
+        frame_type = frame.frame_type.value
+        self.frames_in[frame_type] += 1
+        self.bytes_in[frame_type] += FRAME_HEADER_LENGTH + frame.length
+
+    def frame_sent(self, frame):
+        frame_type = frame.frame_type.value
+        self.frames_out[frame_type] += 1
+        self.bytes_out[frame_type] += FRAME_HEADER_LENGTH + len(frame)
+
+    def flow_control_stall(self, duration):
+        self.flow_control_stalls += 1
+        self.stall_time += duration
+
+    def headers_encoded(self, raw_size, encoded_size):
+        self.header_bytes_encoded_raw += raw_size
+        self.header_bytes_encoded += encoded_size
+
+    def headers_decoded(self, raw_size, encoded_size):
+        self.header_bytes_decoded_raw += raw_size
+        self.header_bytes_decoded += encoded_size
+
+    def snapshot(self):
+        raw_header_bytes = self.header_bytes_encoded_raw + self.header_bytes_decoded_raw
+        encoded_header_bytes = self.header_bytes_encoded + self.header_bytes_decoded
+        return {'frames_in': _by_frame_type(self.frames_in),
+                'bytes_in': _by_frame_type(self.bytes_in),
+                'frames_out': _by_frame_type(self.frames_out),
+                'bytes_out': _by_frame_type(self.bytes_out),
+                'flow_control_stalls': self.flow_control_stalls,
+                'flow_control_stall_seconds': self.stall_time,
+                'streams_refused': self.streams_refused,
+                'read_pauses': self.read_pauses,
+                # Uncompressed size over the size on the wire.
+                'hpack_compression_ratio': (raw_header_bytes / encoded_header_bytes
+                                            if encoded_header_bytes else None)}
+
+
+def _prometheus_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for name, value in sorted(labels.items())) + '}'
+
+
+def prometheus_text(snapshot, prefix='satori_', labels=None):
+    """
+    Render a connection's `metrics_snapshot()` in the Prometheus text
+    exposition format. `labels` are added to every sample, to tell multiple
+    connections apart.
+    """
+    labels = labels or {}
+    lines = []
+
+    def metric(name, metric_type, samples):
+        lines.append('# TYPE {}{} {}'.format(prefix, name, metric_type))
+        for sample_labels, value in samples:
+            if value is None:
+                continue
+            lines.append('{}{}{} {}'.format(prefix, name,
+                                            _prometheus_labels(dict(labels, **sample_labels)),
+                                            value))
+
+    for key in ('frames_in', 'bytes_in', 'frames_out', 'bytes_out'):
+        metric(key + '_total', 'counter',
+               [({'type': frame_type}, count) for frame_type, count in sorted(snapshot[key].items())])
+
+    metric('flow_control_stalls_total', 'counter', [({}, snapshot['flow_control_stalls'])])
+    metric('flow_control_stall_seconds_total', 'counter',
+           [({}, snapshot['flow_control_stall_seconds'])])
+    metric('streams_refused_total', 'counter', [({}, snapshot['streams_refused'])])
+    metric('hpack_compression_ratio', 'gauge', [({}, snapshot['hpack_compression_ratio'])])
+    metric('outgoing_queue_depth', 'gauge', [({}, snapshot['outgoing_queue_depth'])])
+    metric('inbound_queue_depth', 'gauge', [({}, snapshot['inbound_queue_depth'])])
+    metric('inbound_buffered_bytes', 'gauge', [({}, snapshot['inbound_buffered_bytes'])])
+    metric('outgoing_buffered_bytes', 'gauge', [({}, snapshot['outgoing_buffered_bytes'])])
+    metric('read_pauses_total', 'counter', [({}, snapshot['read_pauses'])])
+    metric('rtt_seconds', 'gauge', [({}, snapshot['rtt']['srtt'])])
+    metric('rtt_variance_seconds', 'gauge', [({}, snapshot['rtt']['rttvar'])])
+    metric('streams', 'gauge', [({}, len(snapshot['streams']))])
+
+    streams = sorted(snapshot['streams'].items())
+    metric('stream_queue_depth', 'gauge',
+           [({'stream': stream_id}, stream['queue_depth']) for stream_id, stream in streams])
+    metric('stream_buffered_bytes', 'gauge',
+           [({'stream': stream_id}, stream['buffered_bytes']) for stream_id, stream in streams])
+    metric('stream_time_to_first_byte_seconds', 'gauge',
+           [({'stream': stream_id}, stream['time_to_first_byte']) for stream_id, stream in streams])
+    metric('stream_time_to_last_byte_seconds', 'gauge',
+           [({'stream': stream_id}, stream['time_to_last_byte']) for stream_id, stream in streams])
+
+    return '\n'.join(lines) + '\n'
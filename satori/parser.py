@@ -1,5 +1,7 @@
-from .frame import (FrameHeader, Frame, DataFrame, DEFAULT_PRIORITY,
-                    HeadersFrame)
+from .frame import Frame, DataFrame, HeadersFrame
+from .codec import unpack_header, FRAME_HEADER_LENGTH
+from .exceptions import ConnectionError
+from .trace import trace_point
 
 import asyncio
 import itertools
@@ -10,76 +12,273 @@ import logging
 logger = logging.getLogger('http2')
 logger.setLevel(logging.INFO)
 
-FrameEntry = collections.namedtuple('FrameEntry', ['priority', 'count', 'frame'])
+TRACE_SOCKET_READ = trace_point('connection.read')
+
+# Priority of frames on the connection stream, ahead of any actual stream.
+CONNECTION_PRIORITY = -1
+# Priority of frames for streams which don't exist yet, behind every actual
+# stream. They can't overtake the frame which creates their stream.
+UNKNOWN_STREAM_PRIORITY = 2 ** 31
 
 
 class PriorityFrameQueue(object):
+    """
+    Frames bucketed per stream, with the streams kept in a heap keyed on their
+    priority (lowest number first, ties going to whichever stream was queued
+    first). Frames of a single stream always come out in the order they were
+    pushed.
+
+    Re-keying a stream pushes a fresh heap entry and marks the old one as
+    removed, so it's O(log n). Removed entries are skipped when they reach the
+    top, and the heap is compacted once they make up most of it.
+    """
     REMOVED = '<gone>'
 
-    def __init__(self):
-        # List to be 'heapified'.
-        self._frame_queue = []
-        self._frame_index = {}
+    def __init__(self, compact_threshold=32):
+        # List to be 'heapified', of [priority, count, stream_id] entries.
+        self._stream_heap = []
+        # Maps a stream id to its live heap entry, and its queued frames.
+        self._stream_entries = {}
+        self._stream_frames = {}
         self._entry_counter = itertools.count()
 
-    def push_pop_frame(self, frame, priority):
-        """ Push a new frame into the heap, return the new min priority frame."""
-        frame_entry = FrameEntry(priority, next(self._entry_counter), frame)
-        return heapq.heappushpop(self._frame_queue, frame_entry).frame
+        self._removed_entries = 0
+        self._compact_threshold = compact_threshold
+        self._num_frames = 0
 
-    def pop_frame(self):
-        while self._frame_queue:
-            frame_entry = heapq.heappop(self._frame_queue)
-            if frame_entry.frame is not self.REMOVED:
-                del self._frame_index[frame_entry.frame]
-                return frame_entry.frame
+    def __len__(self):
+        return self._num_frames
+
+    def _push_entry(self, stream_id, priority):
+        stream_entry = [priority, next(self._entry_counter), stream_id]
+        self._stream_entries[stream_id] = stream_entry
+        heapq.heappush(self._stream_heap, stream_entry)
+
+    def _remove_entry(self, stream_id):
+        stream_entry = self._stream_entries.pop(stream_id)
+        stream_entry[-1] = self.REMOVED
+        self._removed_entries += 1
+
+        # Keep the top of the heap live, so peeking is O(1).
+        while self._stream_heap and self._stream_heap[0][-1] is self.REMOVED:
+            heapq.heappop(self._stream_heap)
+            self._removed_entries -= 1
+
+        if (self._removed_entries > self._compact_threshold and
+                self._removed_entries > len(self._stream_heap) // 2):
+            self.compact()
+
+    def compact(self):
+        """ Rebuild the heap with only the live entries. """
+        self._stream_heap = [stream_entry for stream_entry in self._stream_heap
+                             if stream_entry[-1] is not self.REMOVED]
+        heapq.heapify(self._stream_heap)
+        self._removed_entries = 0
 
     def push_frame(self, frame, priority):
-        frame_entry = FrameEntry(priority, next(self._entry_counter), frame)
-        if frame_entry.frame in self._frame_index:
-            self.delete_frame(frame_entry.frame)
+        stream_id = frame.stream_id
+        stream_frames = self._stream_frames.get(stream_id)
+        if stream_frames is None:
+            stream_frames = self._stream_frames[stream_id] = collections.deque()
+            self._push_entry(stream_id, priority)
+        elif self._stream_entries[stream_id][0] != priority:
+            self.reprioritize_stream(stream_id, priority)
+
+        stream_frames.append(frame)
+        self._num_frames += 1
 
-        self._frame_index[frame] = frame_entry
+    def peek_frame(self):
+        if not self._stream_heap:
+            return None
+        return self._stream_frames[self._stream_heap[0][-1]][0]
 
-        heapq.heappush(self._frame_queue, frame_entry)
+    def peek_priority(self):
+        return self._stream_heap[0][0] if self._stream_heap else None
+
+    def pop_frame(self):
+        if not self._stream_heap:
+            return None
+
+        stream_id = self._stream_heap[0][-1]
+        stream_frames = self._stream_frames[stream_id]
+        frame = stream_frames.popleft()
+        self._num_frames -= 1
+
+        if not stream_frames:
+            del self._stream_frames[stream_id]
+            self._remove_entry(stream_id)
+
+        return frame
+
+    def push_pop_frame(self, frame, priority):
+        """ Push a new frame into the heap, return the new min priority frame."""
+        self.push_frame(frame, priority)
+        return self.pop_frame()
 
     def delete_frame(self, frame):
-        frame_entry = self._frame_index.pop(frame)
-        frame_entry[-1] = self.REMOVED
+        stream_frames = self._stream_frames[frame.stream_id]
+        stream_frames.remove(frame)
+        self._num_frames -= 1
 
-    def reprioritize_stream(self, stream_id):
-        pass
+        if not stream_frames:
+            del self._stream_frames[frame.stream_id]
+            self._remove_entry(frame.stream_id)
 
+    def delete_stream(self, stream_id):
+        """ Drop every frame queued up for `stream_id`, returning them. """
+        stream_frames = self._stream_frames.pop(stream_id, None)
+        if stream_frames is None:
+            return []
+        self._num_frames -= len(stream_frames)
+        self._remove_entry(stream_id)
+        return list(stream_frames)
+
+    def reprioritize_stream(self, stream_id, priority):
+        """ Re-key all the queued frames of `stream_id`, in O(log n). """
+        stream_entry = self._stream_entries.get(stream_id)
+        if stream_entry is None or stream_entry[0] == priority:
+            return
+
+        self._remove_entry(stream_id)
+        self._push_entry(stream_id, priority)
+
+
+class FrameBuffer(object):
+    """
+    Sans-IO frame parser. Bytes are fed in as they come off the wire, and every
+    complete frame within them is sliced out in a single synchronous pass. The
+    frames are lazy, with their payloads being views into the fed data.
+    """
+
+    def __init__(self):
+        self._buffer = b''
+        self._offset = 0
+
+    def __len__(self):
+        """ Number of bytes held, belonging to a frame that's not yet complete. """
+        return len(self._buffer) - self._offset
+
+    def feed(self, data):
+        frames = []
+        if len(self):
+            data = memoryview(data)
+        while len(self) and data:
+            # A partial frame was left over from the last chunk. Only the bytes
+            # it's missing are copied over to complete it, its header first, if
+            # that's not complete either, then its payload.
+            pending = memoryview(self._buffer)[self._offset:]
+            frame_end = FRAME_HEADER_LENGTH
+            if len(pending) >= FRAME_HEADER_LENGTH:
+                frame_end += unpack_header(pending)[0]
+            needed = frame_end - len(pending)
+            self._buffer = b''.join((pending, data[:needed]))
+            self._offset = 0
+            data = data[needed:]
+            frames.extend(self._parse_frames())
+
+        if data:
+            # The rest of the chunk is parsed in place.
+            self._buffer = data
+            self._offset = 0
+            frames.extend(self._parse_frames())
+        return iter(frames)
+
+    def _parse_frames(self):
+        frames = []
+
+        buf_view = memoryview(self._buffer)
+        buf_length = len(buf_view)
+        offset = self._offset
+        while buf_length - offset >= FRAME_HEADER_LENGTH:
+            length, raw_type, raw_flags, stream_id = unpack_header(buf_view, offset)
+            payload_start = offset + FRAME_HEADER_LENGTH
+            payload_end = payload_start + length
+            if payload_end > buf_length:
+                break
+
+            frames.append(Frame.lazy_from_raw(raw_type, raw_flags, stream_id,
+                                              buf_view[payload_start:payload_end]))
+            offset = payload_end
+
+        if offset == buf_length:
+            # Nothing left over, don't keep the fed data alive any longer.
+            self._buffer = b''
+            offset = 0
+        self._offset = offset
+        return frames
+
+
+class InboundFrameScheduler(object):
+    """
+    Scheduling stage between the frame parser and the streams. When several
+    streams have frames waiting, the ones belonging to higher priority streams
+    are delivered first. Frames of a single stream are never reordered, and at
+    most `depth` frames are up for reordering at any time, anything past that
+    waits its turn in arrival order.
+
+    `arrived`, if given, sees every frame in arrival order before it's
+    scheduled, and returns the frame to schedule in its place (None to hold
+    it back).
+    """
+
+    def __init__(self, priority_of, depth=64, arrived=None):
+        self._priority_of = priority_of
+        self._depth = depth
+        self._arrived = arrived
 
-class FrameParser(object):
-    def __init__(self, reader, conn):
-        self.reader = reader
         self._frame_queue = PriorityFrameQueue()
-        self._conn = conn
+        self._overflow = collections.deque()
 
-    @asyncio.coroutine
-    def read_frame(self, header_length=8):
-        logging.info('Reading a frame')
-        # Need to be wrapped in some try/accept
+    def __len__(self):
+        return len(self._frame_queue) + len(self._overflow)
+
+    def push_frames(self, frames):
+        for frame in frames:
+            if self._arrived is not None:
+                frame = self._arrived(frame)
+                if frame is None:
+                    continue
+            if self._overflow or len(self._frame_queue) >= self._depth:
+                self._overflow.append(frame)
+            else:
+                self._frame_queue.push_frame(frame, self._priority_of(frame))
+
+    def pop_frame(self):
+        frame = self._frame_queue.pop_frame()
 
-        # Grab the header first.
-        header_bytes = yield from self.reader.read(header_length)
-        frame_header = FrameHeader.from_raw_bytes(header_bytes)
+        # Let the next frame in line up for scheduling.
+        if self._overflow:
+            next_frame = self._overflow.popleft()
+            self._frame_queue.push_frame(next_frame, self._priority_of(next_frame))
 
-        # Read the remainder of the frame payload.
-        payload_bytes = yield from self.reader.read(frame_header.length)
-        frame = Frame.from_frame_header(frame_header)
-        frame.deserialize(payload_bytes)
+        return frame
 
-        logging.info('READ FRAME FROM SOCKET: %s' % frame)
+    def reprioritize_stream(self, stream_id, priority):
+        self._frame_queue.reprioritize_stream(stream_id, priority)
 
-        try:
-            stream_priority = self._conn._streams[frame.stream_id].priority
-        except KeyError:
-            stream_priority = DEFAULT_PRIORITY
 
-        logging.info('Frame has priority: %s' % stream_priority)
-        prioritized_frame = self._frame_queue.push_pop_frame(frame, stream_priority)
+class FrameParser(object):
+    def __init__(self, reader, inbound_frames, read_size=65536):
+        self.reader = reader
+        self._inbound_frames = inbound_frames
+
+        self._read_size = read_size
+        self._frame_buffer = FrameBuffer()
+
+    @asyncio.coroutine
+    def read_frame(self):
+        # Grab as much as is available off the socket in a single read, and
+        # slice out every complete frame. Only go back to the socket once all
+        # of those have been handed out, so nothing is ever left behind when
+        # the connection goes idle.
+        while not self._inbound_frames:
+            data = yield from self.reader.read(self._read_size)
+            if not data:
+                raise ConnectionError()
+            if TRACE_SOCKET_READ.enabled:
+                TRACE_SOCKET_READ.emit(bytes=len(data))
+            self._inbound_frames.push_frames(self._frame_buffer.feed(data))
+
+        frame = self._inbound_frames.pop_frame()
 
-        logging.info('Passing up frame: %s' % frame)
-        return prioritized_frame
+        return frame
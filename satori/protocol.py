@@ -1,11 +1,21 @@
 from .frame import (GoAwayFrame, WindowUpdateFrame, SettingsFrame,
-                    FrameFlag, MAX_FRAME_SIZE, SpecialFrameFlag, DEFAULT_PRIORITY,
-                    ConnectionSetting, DataFrame, PushPromise, FrameType, HeadersFrame)
-from .parser import FrameParser, PriorityFrameQueue
+                    FLAG_ACK, FLAG_END_HEADERS, MAX_FRAME_SIZE, DEFAULT_PRIORITY,
+                    ConnectionSetting, DataFrame, PushPromise, FrameType,
+                    PingFrame, RstStreamFrame, ErrorCode)
+from .parser import (FrameParser, FrameBuffer, InboundFrameScheduler,
+                     CONNECTION_PRIORITY, UNKNOWN_STREAM_PRIORITY)
+from .codec import FrameEncoder, UINT64_STRUCT, FRAME_HEADER_LENGTH
+from .scheduler import (DeficitRoundRobinScheduler, is_control_frame,
+                        SCHEDULED_FRAME_TYPES)
+from .flow import ReceiveWindow
+from .rtt import RttEstimator
+from .trace import trace_point
+from .metrics import ConnectionMetrics, StreamMetrics, headers_size
 from .stream import Stream, StreamState
 from .hpack import HTTP2Codec
 from .stream import MAX_STREAM_ID
-from .exceptions import ProtocolError
+from .exceptions import (ConnectionError, ProtocolError, FrameSizeError, FlowControlError,
+                         CompressionError, SettingsTimeout, HeaderListTooLarge)
 
 from enum import Enum
 
@@ -17,6 +27,26 @@ import logging
 logger = logging.getLogger('http2')
 logger.setLevel(logging.INFO)
 
+# Error code of the GOAWAY sent when a connection error is raised.
+CONNECTION_ERROR_CODES = {
+    ProtocolError: ErrorCode.PROTOCOL_ERROR,
+    FrameSizeError: ErrorCode.FRAME_SIZE_ERROR,
+    FlowControlError: ErrorCode.FLOW_CONTROL_ERROR,
+    CompressionError: ErrorCode.COMPRESSION_ERROR,
+    SettingsTimeout: ErrorCode.SETTINGS_TIMEOUT,
+}
+
+TRACE_STREAM_OPENED = trace_point('stream.opened')
+TRACE_FRAME_RECEIVED = trace_point('frame.received')
+TRACE_FRAME_QUEUED = trace_point('frame.queued')
+TRACE_WRITE = trace_point('connection.write')
+TRACE_RTT = trace_point('connection.rtt')
+TRACE_PEER_DEAD = trace_point('connection.peer_dead')
+TRACE_READ_PAUSED = trace_point('connection.read_paused')
+TRACE_READ_RESUMED = trace_point('connection.read_resumed')
+TRACE_WINDOW_UPDATE_RECEIVED = trace_point('flow.window_update_received')
+TRACE_WINDOW_UPDATE_SENT = trace_point('flow.window_update_sent')
+
 
 
 
@@ -33,11 +63,39 @@ def stream_id_generator(is_client):
         if next_id > MAX_STREAM_ID:
             raise ProtocolError
         else:
-            logger.info('GIVING THIS STREAM ID GEN: %s' % next_id)
+            logger.info('GIVING THIS STREAM ID GEN: %s', next_id)
             yield next_id
 
 
 class HTTP2CommonProtocol(asyncio.StreamReaderProtocol):
+    # Max number of received frames which may be reordered by stream priority.
+    inbound_queue_depth = 64
+    # Soft cap on the number of bytes coalesced into a single transport write.
+    write_batch_bytes = 65536
+    # Decides how the streams share the connection, see `satori.scheduler`.
+    write_scheduler_class = DeficitRoundRobinScheduler
+    # Caps on how far the receive windows may be auto-tuned, which bounds the
+    # memory the peer can make us buffer.
+    max_receive_window = 16 * 2 ** 20
+    max_stream_receive_window = 4 * 2 ** 20
+    # Seconds a closed stream is kept around for, before it's evicted.
+    closed_stream_timeout = 1.0
+    # Seconds between keepalive PINGs, None to not send any. A peer which
+    # doesn't ACK one within `keepalive_timeout` (or the RTT based timeout,
+    # if that's longer) is considered dead, and the connection closed.
+    keepalive_interval = None
+    keepalive_timeout = 20.0
+    # Bytes a received header list may decode into (counted the way HPACK
+    # sizes table entries), None for no limit. Anything larger is turned
+    # away without being held in memory.
+    max_header_list_size = 64 * 1024
+    # Bytes of frames which may be buffered up, received on a stream and
+    # not consumed yet, and across the connection, where frames waiting to
+    # be written count too. Reading off the connection is paused while
+    # either is over budget, until it's back under half of it. A peer which
+    # keeps to the flow control windows never gets near these.
+    max_stream_buffer = 8 * 2 ** 20
+    max_connection_buffer = 32 * 2 ** 20
 
     def __init__(self, is_client, loop=None):
         # Is the neccesary?
@@ -53,26 +111,96 @@ class HTTP2CommonProtocol(asyncio.StreamReaderProtocol):
         self._last_stream_id = None
 
         self._streams = {}
+        # Closed streams are evicted from `_streams` after a short while, in
+        # the order they closed. All that's kept of them is the highest stream
+        # id the peer has opened, anything below it which we don't know about
+        # is closed.
+        self._closed_streams = collections.deque()
+        self._evict_handle = None
+        self._last_peer_stream_id = 0
         self._settings = {ConnectionSetting.INITIAL_WINDOW_SIZE: 65535}
 
-        logging.info('waiting for connectino to be open')
+        logger.info('waiting for connectino to be open')
 
 
         self._reader_task = asyncio.async(self.start_reader_task())
         self._writer_task = asyncio.async(self.start_writer_task())
 
-        # Make this a p-queue?
-        self._outgoing_frames = asyncio.Queue()
-        self._priority_write_frame = PriorityFrameQueue()
+        # Control frames skip the line, everything else is handed to the
+        # scheduler. The writer is woken up whenever either gains a frame.
+        self._outgoing_control_frames = collections.deque()
+        self._write_scheduler = self.write_scheduler_class()
+        self._outgoing_frames_ready = asyncio.Event()
+        # Reusable output buffer, queued frames are batched into it.
+        self._frame_encoder = FrameEncoder()
+        # Number of times the writer had to wait for the transport to drain.
+        self._drain_waits = 0
 
         self._connection_header_exchanged = asyncio.Future()
         self._connection_closed = asyncio.Future()
 
+        # Credit for DATA frames across all streams. Streams take their share
+        # of it as they queue up each frame.
         self._out_flow_control_window = 65535
+        # Credit for DATA the peer may send us, across all streams.
+        self._receive_window = ReceiveWindow(max_size=self.max_receive_window)
+        # PINGs waiting for an ACK, as opaque_data: (sent_at, waiter). The
+        # opaque data is the send time, in microseconds of the loop's clock.
+        self._outstanding_pings = {}
+        self._last_ping_data = 0
+        # Opaque data of the PING the windows are taking a BDP sample over.
+        self._rtt_ping = None
+        self.rtt = RttEstimator()
+        self._keepalive_handle = None
+        # WINDOW_UPDATE increments by stream id, sent at the end of the loop
+        # cycle they were scheduled in.
+        self._pending_window_updates = {}
+        self._window_update_handle = None
+
+        # Server side admission: requests being handled right now, limited by
+        # the MAX_CONCURRENT_STREAMS we advertised and by a budget shared with
+        # other connections (anything with `acquire` and `release`).
+        self._max_concurrent_streams = None
+        self._stream_budget = None
+        self._streams_in_flight = 0
+        # The tasks handling those requests.
+        self._request_tasks = set()
+        # Client side: our streams which count against the peer's
+        # MAX_CONCURRENT_STREAMS, and requests waiting for one of them to end.
+        self._slot_streams = set()
+        self._stream_slots_held = 0
+        self._stream_slot_waiters = collections.deque()
+        # Set whenever one of those streams ends.
+        self._stream_slot_released = asyncio.Event()
 
-        self._outgoing_window_update = asyncio.Event()
+        self.metrics = ConnectionMetrics()
+
+        self._data_bytes_received = 0
+        self._data_bytes_sent = 0
+        self._control_bytes_sent = 0
+        self._window_updates_sent = 0
 
         self._header_codec = HTTP2Codec()
+        # First frame of the header block being received, while it's being
+        # continued in CONTINUATION frames, and the size of the block so far.
+        self._header_block = None
+        self._header_block_length = 0
+
+        # Bytes of received frames waiting in the streams' queues, and of
+        # frames waiting to be written out.
+        self._inbound_buffered = 0
+        self._outgoing_buffered = 0
+        # Streams over their budget, which keep reading paused.
+        self._overbuffered_streams = set()
+        self._reading_paused = False
+        self._reading_resumed = asyncio.Event()
+        self._reading_resumed.set()
+
+        # Set once the connection is made, by `stream_open`.
+        self._frame_parser = None
+        self._inbound_frames = InboundFrameScheduler(self._inbound_frame_priority,
+                                                     depth=self.inbound_queue_depth,
+                                                     arrived=self._frame_arrived)
 
 
     def _get_next_stream_id(self):
@@ -89,8 +217,17 @@ class HTTP2CommonProtocol(asyncio.StreamReaderProtocol):
         # TODO(roasbeef): Add an assertion that the stream ID should be
         # positive or negative depending on if client or not?
         new_stream_id = self._get_next_stream_id() if stream_id is None else stream_id
-        logger.info('CREATING STREAM IN CONN created id: %s' % new_stream_id)
-        stream = Stream(new_stream_id, self, self._header_codec, priority)
+        if TRACE_STREAM_OPENED.enabled:
+            TRACE_STREAM_OPENED.emit(stream_id=new_stream_id, priority=priority)
+        receive_window = ReceiveWindow(max_size=self.max_stream_receive_window)
+        # Rather than working its way up from the default, start the window at
+        # what the connection's throughput needs over a round trip.
+        if self.rtt.srtt is not None:
+            receive_window.grow(self._receive_window.consumption_rate * self.rtt.srtt)
+        # The response is what's received, for streams opened by a client.
+        metrics = StreamMetrics(self._ev_loop.time(), response_inbound=self._is_client)
+        stream = Stream(new_stream_id, self, self._header_codec, priority,
+                        receive_window=receive_window, metrics=metrics)
 
         stream._outgoing_flow_control_window = self._settings[ConnectionSetting.INITIAL_WINDOW_SIZE]
 
@@ -98,130 +235,277 @@ class HTTP2CommonProtocol(asyncio.StreamReaderProtocol):
         return stream
 
     def update_settings(self, settings_frame):
-        logger.info('SETTINGS: %s' % settings_frame.settings)
+        logger.info('SETTINGS: %s', settings_frame.settings)
         if ConnectionSetting.HEADER_TABLE_SIZE in settings_frame.settings:
-            self._header_codec.change_max_size(settings.settings[ConnectionSetting.HEADER_TABLE_SIZE])
+            self._header_codec.change_max_size(settings_frame.settings[ConnectionSetting.HEADER_TABLE_SIZE])
         if ConnectionSetting.INITIAL_WINDOW_SIZE in settings_frame.settings:
             logger.info('processing initial window size')
             current_size = self._settings[ConnectionSetting.INITIAL_WINDOW_SIZE]
             updated_size = settings_frame.settings[ConnectionSetting.INITIAL_WINDOW_SIZE]
             size_diff = updated_size - current_size
 
-            self._update_flow_control_all_streams(size_update)
+            self._update_flow_control_all_streams(size_diff)
 
-            self._settings[ConnectionSetting.INITIAL_WINDOW_SIZE] = size_diff
+            self._settings[ConnectionSetting.INITIAL_WINDOW_SIZE] = updated_size
         if ConnectionSetting.ENABLE_PUSH in settings_frame.settings:
             self._settings[ConnectionSetting.ENABLE_PUSH] = settings_frame.settings[ConnectionSetting.ENABLE_PUSH]
         if ConnectionSetting.MAX_CONCURRENT_STREAMS in settings_frame.settings:
             self._settings[ConnectionSetting.MAX_CONCURRENT_STREAMS] = settings_frame.settings[ConnectionSetting.MAX_CONCURRENT_STREAMS]
+            # The limit may have gone up, let queued requests through.
+            self._wake_stream_slot_waiters()
 
-    def _update_flow_control_all_streams(size_update):
-        logger.info('updating flow control for all streams, size update: ' % size_update)
+    def _update_flow_control_all_streams(self, size_update):
+        logger.info('updating flow control for all streams, size update: %s', size_update)
         for stream in self._streams.values():
-            stream._out_flow_control_window += size_update
+            stream._outgoing_flow_control_window += size_update
 
-            # Notify any tasks that we've received a window update.
-            logger.info('notify stream that is has a new window update')
-            stream._outgoing_window_update.set()
-            stream._outgoing_window_update.clear()
+        self._notify_window_update()
+
+    def _notify_window_update(self):
+        # Streams hold off sending until both their own window and the
+        # connection's have room, so any of them may be waiting on this.
+        for stream in self._streams.values():
+            stream._window_updated()
 
-    @asyncio.coroutine
     def handle_connection_frame(self, frame):
-        logger.info('GOT CONNECTION FRAME')
-        if isinstance(frame, PingFrame):
-            pong_frame = frame.pong_from_ping(frame)
-            yield from self.write_frame(pong_frame)
-        elif isinstance(frame, RstStreamFrame):
-            pass
-        elif isinstance(frame, GoAwayFrame):
-            logger.info('got go away frame')
-            # Let the reader and writer coroutines know that the connection is
-            # being closed.
-            yield from self.close_connection(frame)
-            self._connection_closed.set_result(True)
-            # TODO(roasbeef): Do something with the last stream_id
-            # and the error code...
-        elif isinstance(frame, WindowUpdateFrame):
-            # Window update frame for the entire connection, let all the
-            # streams know they can send sum mo'.
-            logger.info('got connection wide window update')
-            self._out_flow_control_window += frame.window_size_increment
-
-            logger.info('notify writer that we have new connection window update')
-            self._outgoing_window_update.set()
-            self._outgoing_window_update.clear()
-
-            self._update_flow_control_all_streams(frame.window_size_increment)
-        elif isinstance(frame, SettingsFrame):
-            logger.info('Got a connection settings frame')
-            # If it isn't just a settings ACK, then ya know, do something.
-            if not frame.is_ack:
-                # Do that something.
-                self.update_settings(frame)
-
-                # Fling over a Settings ACK frame.
-                settings_ack = SettingsFrame(stream_id=0, flags={SpecialFrameFlag.ACK})
-                yield from self.write_frame(settings_ack)
-            # TODO(roasbeef): Need to handle an ACK somehow?
+        """ Run the handler for a frame received on the connection stream. """
+        handler = self._connection_frame_handlers.get(frame.frame_type)
+        if handler is not None:
+            handler(self, frame)
+
+    def _handle_ping(self, frame):
+        if frame.flag_bits & FLAG_ACK:
+            self._handle_pong(frame)
+        else:
+            self._queue_frame(PingFrame.pong_from_ping(frame))
+
+    def _handle_go_away(self, frame):
+        logger.info('got go away frame')
+        # Let the reader and writer coroutines know that the connection is
+        # being closed. This is the one handler which needs a task.
+        asyncio.async(self._close_on_go_away(frame))
+
+    @asyncio.coroutine
+    def _close_on_go_away(self, frame):
+        yield from self.close_connection(frame)
+        self._connection_closed.set_result(True)
+        # TODO(roasbeef): Do something with the last stream_id
+        # and the error code...
+
+    def _handle_window_update(self, frame):
+        # Window update frame for the entire connection, let all the
+        # streams know they can send sum mo'.
+        if TRACE_WINDOW_UPDATE_RECEIVED.enabled:
+            TRACE_WINDOW_UPDATE_RECEIVED.emit(stream_id=0, increment=frame.window_size_increment)
+        self._out_flow_control_window += frame.window_size_increment
+        self._notify_window_update()
+
+    def _handle_settings(self, frame):
+        logger.info('Got a connection settings frame')
+        # If it isn't just a settings ACK, then ya know, do something.
+        if not frame.is_ack:
+            # Do that something.
+            self.update_settings(frame)
+
+            # Fling over a Settings ACK frame.
+            self._queue_frame(SettingsFrame(stream_id=0, flags=FLAG_ACK))
+        # TODO(roasbeef): Need to handle an ACK somehow?
+
+    # Handlers for frames received on stream 0, keyed by frame type. They're
+    # all synchronous, and run inline as the frames are read.
+    _connection_frame_handlers = {
+        FrameType.PING: _handle_ping,
+        FrameType.GO_AWAY: _handle_go_away,
+        FrameType.WINDOW_UPDATE: _handle_window_update,
+        FrameType.SETTINGS: _handle_settings,
+    }
+
+    def reprioritize_stream(self, stream_id, priority):
+        """
+        Apply a new priority to a stream, along with any of its frames which
+        are already queued up in either direction.
+        """
+        stream = self._streams.get(stream_id)
+        if stream is not None:
+            stream.priority = priority
+
+        self._write_scheduler.reprioritize_stream(stream_id, priority)
+        self._inbound_frames.reprioritize_stream(stream_id, priority)
+
+    def _inbound_frame_priority(self, frame):
+        if frame.stream_id == 0:
+            return CONNECTION_PRIORITY
+
+        stream = self._streams.get(frame.stream_id)
+        return stream.priority if stream is not None else UNKNOWN_STREAM_PRIORITY
 
     @asyncio.coroutine
     def write_frame(self, frame):
-        logger.info('Putting frame into pq: %s' % frame)
-        frame_priority = self._streams[frame.stream_id]
-        next_frame_to_write = self._priority_write_frame.push_pop_frame(frame,
-                                                                        frame_priority)
-        logging.info('Putting frame unto queue, stream: %s' % frame.stream_id)
-        self._outgoing_frames.put_nowait(next_frame_to_write)
+        self._queue_frame(frame)
+
+    def _queue_frame(self, frame, behind_stream=False):
+        """
+        Queue up a frame to be written. With `behind_stream`, a control frame
+        of a stream waits in the scheduler until everything already queued on
+        the stream has gone out, rather than overtaking it.
+        """
+        if TRACE_FRAME_QUEUED.enabled:
+            TRACE_FRAME_QUEUED.emit(frame_type=frame.frame_type.name, stream_id=frame.stream_id,
+                                    length=len(frame))
+        if frame.frame_type == FrameType.RST_STREAM and not behind_stream:
+            # Nothing may be sent on the stream after it's reset.
+            self._purge_stream(frame.stream_id)
+        frame_size = FRAME_HEADER_LENGTH + len(frame)
+        self._outgoing_buffered += frame_size
+        if (self._outgoing_buffered + self._inbound_buffered > self.max_connection_buffer and
+                not self._reading_paused):
+            self._pause_reading()
+
+        if is_control_frame(frame):
+            self._control_bytes_sent += frame_size
+        elif frame.frame_type == FrameType.DATA:
+            self._data_bytes_sent += len(frame)
+
+        if frame.frame_type not in SCHEDULED_FRAME_TYPES and not behind_stream:
+            # Control frames, and header blocks. Those go out in the order
+            # they're queued, which is the order they were HPACK encoded in,
+            # and are only ever sent ahead of a stream's body, so they don't
+            # need to wait behind it in the scheduler.
+            self._outgoing_control_frames.append(frame)
+        else:
+            stream = self._streams.get(frame.stream_id)
+            frame_priority = stream.priority if stream is not None else DEFAULT_PRIORITY
+            self._write_scheduler.push_frame(frame, frame_priority)
+        self._outgoing_frames_ready.set()
+
+    def _purge_stream(self, stream_id):
+        """
+        Drop whatever is still queued up to be sent on a reset stream. The
+        connection window the dropped DATA took is handed back to the other
+        streams.
+        """
+        purged_frames = self._write_scheduler.delete_stream(stream_id)
+        if not purged_frames:
+            return
+        for frame in purged_frames:
+            self._outgoing_buffered -= FRAME_HEADER_LENGTH + len(frame)
+            if frame.frame_type == FrameType.DATA:
+                self._data_bytes_sent -= len(frame)
+                self._out_flow_control_window += len(frame)
+        self._notify_window_update()
+        if self._reading_paused:
+            self._check_buffers()
+
+    def _next_outgoing_frame(self):
+        if self._outgoing_control_frames:
+            return self._outgoing_control_frames.popleft()
+        return self._write_scheduler.pop_frame()
+
+    def _prepare_frame(self, frame):
+        """ Handle the bookkeeping needed right before a frame goes out. """
+        self.metrics.frame_sent(frame)
+        if frame.stream_id:
+            stream = self._streams.get(frame.stream_id)
+            if stream is not None:
+                stream.metrics.frame_sent(frame, self._ev_loop.time)
+
+        if isinstance(frame, PushPromise):
+            logger.info('Got a push promise.')
+            # Locally create and reserve the promised frame.
+            promised_stream = self._new_stream(stream_id=frame.promised_stream_id)
+            promised_stream.state = StreamState.RESERVED_LOCAL
+            self._streams[frame.promised_stream_id] = promised_stream
+
+            # Let the stream which is promising a new stream know that it is
+            # available (via a Future).
+            self._streams[frame.stream_id].receive_promised_stream(promised_stream)
+
+        # Flow control isn't handled here, DATA frames are only queued up once
+        # the stream has reserved both stream and connection credit for them.
+
+    def metrics_snapshot(self):
+        """
+        Everything there is to know about the connection and its streams, as
+        a dict. See `satori.metrics.prometheus_text` to export it.
+        """
+        snapshot = self.metrics.snapshot()
+        snapshot['outgoing_queue_depth'] = (len(self._outgoing_control_frames) +
+                                            len(self._write_scheduler))
+        snapshot['inbound_queue_depth'] = len(self._inbound_frames)
+        snapshot['inbound_buffered_bytes'] = self._inbound_buffered
+        snapshot['outgoing_buffered_bytes'] = self._outgoing_buffered
+        snapshot['reading_paused'] = self._reading_paused
+        snapshot['writes'] = self.write_stats()
+        snapshot['flow_control'] = self.flow_control_stats()
+        snapshot['rtt'] = self.rtt.snapshot()
+        snapshot['streams'] = {stream_id: dict(stream.metrics.snapshot(),
+                                               **self._stream_queue_snapshot(stream))
+                               for stream_id, stream in self._streams.items()}
+        return snapshot
+
+    @staticmethod
+    def _stream_queue_snapshot(stream):
+        if stream._frames is None:
+            return {'queue_depth': 0, 'buffered_bytes': 0}
+        return {'queue_depth': stream._frames.qsize(),
+                'buffered_bytes': stream._frames.buffered_bytes}
+
+    def write_stats(self):
+        """ Counters describing how well outgoing frames are being coalesced. """
+        encoder = self._frame_encoder
+        return {'frames_written': encoder.frames_encoded,
+                'bytes_written': encoder.bytes_flushed,
+                'writes': encoder.flush_count,
+                'frames_per_write': encoder.frames_per_flush,
+                'bytes_per_write': encoder.bytes_per_flush,
+                'drain_waits': self._drain_waits}
 
     @asyncio.coroutine
     def start_writer_task(self):
         # Pause until the connection header has been exchanged by both sides.
-        logging.info('Writing task waiting for connection header.')
+        logger.info('Writing task waiting for connection header.')
         yield from self._connection_header_exchanged
-        logging.info('Connection header exchanged.')
+        logger.info('Connection header exchanged.')
 
         # pop off the heapq
         # break larger frames into smaller chunks
         # put chunks back into the heapq?
-        logging.info('Starting main loop, in writer.')
+        logger.info('Starting main loop, in writer.')
         while not self._connection_closed.done():
-            try:
-                frame = yield from self._outgoing_frames.get()
-            except:
-                break
-            logging.info('Writer popped frame off queue: %s' % frame)
-
-            if isinstance(frame, PushPromise):
-                logging.info('Got a push promise.')
-                # Locally create and reserve the promised frame.
-                promised_stream = self._new_stream(stream_id=frame.promised_stream_id)
-                promised_stream.state = StreamState.RESERVED_LOCAL
-                self._streams[frame.promised_stream_id] = promised_stream
-
-                # Let the stream which is promising a new stream know that it is
-                # available (via a Future).
-                self._streams[frame.stream_id].receive_promised_stream(promised_stream)
-
-            # TODO(roasbeef): Do we need to handle flow control here on the
-            # connection level? Only DataFrames are flow controled, data frames
-            # can't be sent on the connection stream_id. In this implementation
-            # WindowUpdate frames are applied to ALL stream.
-            if frame.frame_type == FrameType.DATA:
-                # Wait to be notified that we've received a window update
-                # frame. Or should we pop it back unto the heap queue and get a
-                # new frame?
-                logging.info('Sending a data frame.')
-                while len(frame) > self._out_flow_control_window:
-                    logging.info('Flow control window not large enough, waiting for more.')
-                    yield from self._outgoing_window_update.wait()
-
-               # Reduce our outgoing window.
-                self._out_flow_control_window -= len(frame)
-
-            frame_bytes = frame.serialize()
-            self.writer.write(frame_bytes)
-            logging.info('Sending off frame, stream_id: %s' % frame.stream_id)
-            yield from self.writer.drain()
+            frame = self._next_outgoing_frame()
+            if frame is None:
+                self._outgoing_frames_ready.clear()
+                try:
+                    yield from self._outgoing_frames_ready.wait()
+                except:
+                    break
+                continue
+
+            # Encode this frame, along with every other frame that's already
+            # queued up, into the connection's output buffer. They all go out
+            # in a single write, once the byte budget is used up or the queue
+            # runs dry.
+            while frame is not None:
+                self._prepare_frame(frame)
+                self._frame_encoder.encode(frame)
+                self._outgoing_buffered -= FRAME_HEADER_LENGTH + len(frame)
+
+                if self._frame_encoder.pending_bytes >= self.write_batch_bytes:
+                    break
+                frame = self._next_outgoing_frame()
+
+            if TRACE_WRITE.enabled:
+                TRACE_WRITE.emit(frames=len(self._frame_encoder),
+                                 bytes=self._frame_encoder.pending_bytes)
+            self._frame_encoder.flush(self.writer.transport)
+            if self._reading_paused:
+                self._check_buffers()
+
+            # The transport pauses us once its buffer passes the high-water
+            # mark, only then is it worth yielding until it has drained.
+            if self._paused:
+                self._drain_waits += 1
+                yield from self.writer.drain()
 
         yield from self.close_connection()
 
@@ -229,63 +513,297 @@ class HTTP2CommonProtocol(asyncio.StreamReaderProtocol):
     @asyncio.coroutine
     def start_reader_task(self):
         # Pause until the connection header has been exchanged by both sides.
-        logging.info('Reader task waiting for connection exchange')
+        logger.info('Reader task waiting for connection exchange')
         yield from self._connection_header_exchanged
-        logging.info('Connection header done in reader task.')
+        logger.info('Connection header done in reader task.')
 
         # Can also set a value to the connection closed future, like the last
         # frame that was processed or the reason we're closing the connection?
-        logging.info('starting main reader task loop')
+        logger.info('starting main reader task loop')
         while not self._connection_closed.done():
+            # Hold off on reading while too much is buffered up. Once the
+            # StreamReader's own buffer fills, it pauses the transport.
+            if self._reading_paused:
+                yield from self._reading_resumed.wait()
             # Parse a single frame from the connection.
             try:
                 frame = yield from self._frame_parser.read_frame()
+                # Frame payloads are only decoded as they're dispatched, so
+                # a malformed one is only found out about here.
+                self._dispatch_frame(frame)
+            except asyncio.CancelledError:
+                break
             # TODO(roasbeef): Need to properly handle this within FrameParser.
-            except:
+            except Exception as e:
+                # Nothing to tell the peer if it simply went away.
+                if not self.reader.at_eof():
+                    self._send_go_away(e)
                 break
-            logging.info('Reader popped frame from queue: %s' % frame)
-
-            logging.info('STREAM IDS: %s' % self._streams.keys())
-            # Connection specific frame. Handle it, async style!
-            if frame.stream_id == 0:
-                logging.info('Handling connection frame.')
-                asyncio.async(self.handle_connection_frame(frame))
-            # Frame for streams we're already aware of.
-            elif frame.stream_id in self._streams:
-                logging.info('got frame from an already known stream')
-                # The other side is promising a push on a new steam id.
-                if isinstance(frame, PushPromise):
-                    asyncio.async(self.process_push_promise(frame))
-                # Otherwise, it's business as usual.
-                else:
-                    logging.info('Feeding frame to stream_id: %s' % frame.stream_id)
-                    self._streams[frame.stream_id].process_frame(frame)
-            # Should be a new headers or pushpromise frame at this point.
-            elif not self._is_client:
-                logging.info('Entering server specific code path.')
-                # We've received a new request. So create a new stream, and
-                # assign it the received stream id from the frame.
-                if isinstance(frame, HeadersFrame):
-                    logging.info('Got a new request header frame')
-                    if FrameFlag.PRIORITY in frame.flags:
-                        new_request_stream = self._new_stream(stream_id=frame.stream_id,
-                                                              priority=frame.priority)
-                    else:
-                        new_request_stream = self._new_stream(stream_id=frame.stream_id)
-                    logging.info('Giving frame to new stream')
-                    new_request_stream.process_frame(frame)
-                    # Create new task which will wait for all the neccessary
-                    # frames to be sent on this stream, and then process the
-                    # request.
-                    logging.info('Creating new task to handle request.')
-                    response_task = asyncio.async(new_request_stream.consume_request())
-                    # Close off the stream after the response is sent.
-                    #response_task.add_done_callback(new_request_stream.close())
+
         yield from self.close_connection()
 
+    def _frame_arrived(self, frame):
+        """
+        Sees every frame in the order it was received, ahead of the inbound
+        scheduler. Header blocks are decoded here, fragment by fragment, as
+        the peer encoded them in that order. A block continued in
+        CONTINUATION frames is only passed on once it's complete, as its first
+        frame.
+        """
+        frame_type = frame.frame_type
+        if self._header_block is not None:
+            # Nothing may come in between the frames of a header block.
+            if (frame_type != FrameType.CONTINUATION or
+                    frame.stream_id != self._header_block.stream_id):
+                raise ProtocolError()
+            self.metrics.frame_received(frame)
+            first_frame = self._header_block
+        elif frame_type == FrameType.HEADERS or frame_type == FrameType.PUSH_PROMISE:
+            self._header_codec.begin_header_block(self.max_header_list_size)
+            self._header_block_length = 0
+            first_frame = frame
+        elif frame_type == FrameType.CONTINUATION:
+            raise ProtocolError()
+        else:
+            return frame
+
+        self._header_block_length += len(frame.data)
+        self._header_codec.decode_fragment(frame.data)
+        if not frame.end_headers:
+            self._header_block = first_frame
+            return None
+
+        self._header_block = None
+        first_frame.flag_bits |= FLAG_END_HEADERS
+        try:
+            first_frame.headers = self._header_codec.end_header_block()
+        except HeaderListTooLarge:
+            logger.info('Header list too large on stream %s', frame.stream_id)
+            first_frame.headers = None
+        else:
+            self.metrics.headers_decoded(headers_size(first_frame.headers),
+                                         self._header_block_length)
+        return first_frame
+
+    def _dispatch_frame(self, frame):
+        """ Route a single received frame to the connection or its stream. """
+        if TRACE_FRAME_RECEIVED.enabled:
+            TRACE_FRAME_RECEIVED.emit(frame_type=frame.frame_type.name, stream_id=frame.stream_id,
+                                      length=frame.length, flags=frame.flag_bits)
+        self.metrics.frame_received(frame)
+
+        # DATA counts against the connection's window, whichever stream it's
+        # for.
+        if frame.frame_type == FrameType.DATA:
+            self._data_received(frame)
+
+        # Connection specific frame, handled right away.
+        if frame.stream_id == 0:
+            self.handle_connection_frame(frame)
+            return
+
+        stream = self._streams.get(frame.stream_id)
+        # Frame for streams we're already aware of.
+        if stream is not None:
+            # Streams we closed early can still get the tail of their body
+            # for a while, it's dropped.
+            if stream.state == StreamState.CLOSED and frame.frame_type == FrameType.DATA:
+                return
+            stream.metrics.frame_received(frame, self._ev_loop.time)
+            if frame.stream_id in self._slot_streams and self._ends_stream(frame):
+                self._release_stream_slot(frame.stream_id)
+            # The other side is promising a push on a new steam id.
+            if frame.frame_type == FrameType.PUSH_PROMISE:
+                self.process_push_promise(frame)
+            # Otherwise, it's business as usual.
+            else:
+                stream.process_frame(frame)
+        # Should be a new headers or pushpromise frame at this point.
+        elif not self._is_client:
+            # We've received a new request. So create a new stream, and
+            # assign it the received stream id from the frame.
+            if frame.frame_type == FrameType.HEADERS:
+                # Stream ids only ever go up, so anything at or below the last
+                # one the client opened is a stream which was closed since.
+                if frame.stream_id <= self._last_peer_stream_id:
+                    self._reset_closed_stream(frame)
+                    return
+                self._last_peer_stream_id = frame.stream_id
+                if not self._admit_stream():
+                    self._refuse_stream(frame)
+                    return
+                if frame.has_priority:
+                    new_request_stream = self._new_stream(stream_id=frame.stream_id,
+                                                          priority=frame.priority)
+                else:
+                    new_request_stream = self._new_stream(stream_id=frame.stream_id)
+                new_request_stream.process_frame(frame)
+                # Create new task which will wait for all the neccessary
+                # frames to be sent on this stream, and then process the
+                # request.
+                response_task = asyncio.async(new_request_stream.consume_request())
+                self._request_tasks.add(response_task)
+                # Close off the stream after the response is sent.
+                #response_task.add_done_callback(new_request_stream.close())
+                response_task.add_done_callback(self._request_done)
+
+    def _reset_closed_stream(self, frame):
+        logger.info('HEADERS on closed stream %s', frame.stream_id)
+        self._queue_frame(RstStreamFrame(frame.stream_id, error_code=ErrorCode.STREAM_CLOSED))
+
+    def _stream_closed(self, stream):
+        """
+        Called by a stream once it's closed. It's kept around for a little
+        while, as frames the peer sent before finding out may still arrive,
+        then forgotten about.
+        """
+        self._closed_streams.append((self._ev_loop.time() + self.closed_stream_timeout,
+                                     stream.stream_id))
+        if self._evict_handle is None:
+            self._evict_handle = self._ev_loop.call_later(self.closed_stream_timeout,
+                                                          self._evict_closed_streams)
+
+    def _evict_closed_streams(self):
+        self._evict_handle = None
+        now = self._ev_loop.time()
+        while self._closed_streams and self._closed_streams[0][0] <= now:
+            _, stream_id = self._closed_streams.popleft()
+            stream = self._streams.pop(stream_id, None)
+            if stream is not None and stream._frames is not None:
+                # Whatever is still queued up on it is left to whoever holds
+                # on to the stream, it no longer counts against the
+                # connection.
+                self._inbound_buffered -= stream._frames.buffered_bytes
+                self._overbuffered_streams.discard(stream_id)
+
+        if self._reading_paused:
+            self._check_buffers()
+
+        if self._closed_streams:
+            self._evict_handle = self._ev_loop.call_at(self._closed_streams[0][0],
+                                                       self._evict_closed_streams)
+
+    def _frame_buffered(self, stream, size):
+        """
+        Called by a stream as a received frame of `size` bytes is queued up
+        on it, or with a negative size as one is taken off its queue.
+        """
+        if size >= 0:
+            self._inbound_buffered += size
+            if stream._frames.buffered_bytes > self.max_stream_buffer:
+                self._overbuffered_streams.add(stream.stream_id)
+            elif self._outgoing_buffered + self._inbound_buffered <= self.max_connection_buffer:
+                return
+            if not self._reading_paused:
+                self._pause_reading()
+        # Evicted streams were already taken off the count.
+        elif self._streams.get(stream.stream_id) is stream:
+            self._inbound_buffered += size
+            if self._reading_paused:
+                if stream._frames.buffered_bytes <= self.max_stream_buffer // 2:
+                    self._overbuffered_streams.discard(stream.stream_id)
+                self._check_buffers()
+
+    def _check_buffers(self):
+        """ Resume reading, once everything is back under half its budget. """
+        if (not self._overbuffered_streams and
+                self._outgoing_buffered + self._inbound_buffered <= self.max_connection_buffer // 2):
+            self._resume_reading()
+
+    def _pause_reading(self):
+        if TRACE_READ_PAUSED.enabled:
+            TRACE_READ_PAUSED.emit(inbound_buffered=self._inbound_buffered,
+                                   outgoing_buffered=self._outgoing_buffered,
+                                   streams=list(self._overbuffered_streams))
+        logger.info('Pausing reads, %s bytes buffered', self._inbound_buffered + self._outgoing_buffered)
+        self.metrics.read_pauses += 1
+        self._reading_paused = True
+        self._reading_resumed.clear()
+
+    def _resume_reading(self):
+        if TRACE_READ_RESUMED.enabled:
+            TRACE_READ_RESUMED.emit(inbound_buffered=self._inbound_buffered,
+                                    outgoing_buffered=self._outgoing_buffered)
+        self._reading_paused = False
+        self._reading_resumed.set()
+
+    def _admit_stream(self):
+        """ Take an in-flight slot for a new request, if there's one left. """
+        if (self._max_concurrent_streams is not None and
+                self._streams_in_flight >= self._max_concurrent_streams):
+            return False
+        if self._stream_budget is not None and not self._stream_budget.acquire():
+            return False
+
+        self._streams_in_flight += 1
+        return True
+
+    def _request_done(self, response_task):
+        self._request_tasks.discard(response_task)
+        self._streams_in_flight -= 1
+        if self._stream_budget is not None:
+            self._stream_budget.release()
+
+    def _refuse_stream(self, frame):
+        """
+        Turn away a new stream before doing any work on it. REFUSED_STREAM
+        tells the client the request wasn't processed, so it's safe to retry.
+        """
+        logger.info('Refusing stream %s, %s requests in flight',
+                    frame.stream_id, self._streams_in_flight)
+        self.metrics.streams_refused += 1
+        self._queue_frame(RstStreamFrame(frame.stream_id, error_code=ErrorCode.REFUSED_STREAM))
+
+    @staticmethod
+    def _ends_stream(frame):
+        if frame.frame_type == FrameType.RST_STREAM:
+            return True
+        return frame.frame_type in (FrameType.DATA, FrameType.HEADERS) and frame.end_stream
+
     @asyncio.coroutine
+    def _acquire_stream_slot(self):
+        """
+        Wait until a new stream fits within the peer's MAX_CONCURRENT_STREAMS.
+        Requests are let through in the order they started waiting. The slot
+        must be handed to a stream right away, with `_slot_streams.add`.
+        """
+        if not self._stream_slot_waiters and self._stream_slot_free():
+            self._stream_slots_held += 1
+            return
+
+        waiter = asyncio.Future(loop=self._ev_loop)
+        self._stream_slot_waiters.append(waiter)
+        try:
+            # The slot is already ours by the time the waiter is woken.
+            yield from waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._stream_slots_held -= 1
+                self._wake_stream_slot_waiters()
+            raise
+
+    def _stream_slot_free(self):
+        limit = self._settings.get(ConnectionSetting.MAX_CONCURRENT_STREAMS)
+        return limit is None or self._stream_slots_held < limit
+
+    def _release_stream_slot(self, stream_id):
+        if stream_id in self._slot_streams:
+            self._slot_streams.remove(stream_id)
+            self._stream_slots_held -= 1
+            self._stream_slot_released.set()
+            self._stream_slot_released.clear()
+            self._wake_stream_slot_waiters()
+
+    def _wake_stream_slot_waiters(self):
+        while self._stream_slot_waiters and self._stream_slot_free():
+            waiter = self._stream_slot_waiters.popleft()
+            # Waiters whose request was cancelled are skipped.
+            if not waiter.done():
+                self._stream_slots_held += 1
+                waiter.set_result(None)
+
     def process_push_promise(self, frame):
-        print('GOT PUSH PROMISE')
+        logger.info('GOT PUSH PROMISE')
         # Server shouldn't receive a push promise. ConnectionError.
         if not self._is_client:
             logger.info("IGNORING SERVER DOESN'T DO PUSH PROMISES")
@@ -301,15 +819,165 @@ class HTTP2CommonProtocol(asyncio.StreamReaderProtocol):
             logger.info('CLIENT ACCEPTING PUSH PROMISE')
             promised_stream = self._new_stream(stream_id=frame.promised_stream_id)
             promised_stream.state = StreamState.RESERVED_REMOTE
+            promised_stream._request_headers = frame.headers or {}
+            self._last_peer_stream_id = max(self._last_peer_stream_id, frame.promised_stream_id)
+
+    def _data_received(self, frame):
+        """ Take the credit used by a received DATA frame, from both windows. """
+        self._receive_window.data_received(frame.length)
+        self._data_bytes_received += frame.length
+
+        stream = self._streams.get(frame.stream_id)
+        if stream is not None and stream.state != StreamState.CLOSED:
+            stream._receive_window.data_received(frame.length)
+        else:
+            # Nobody is going to read it, so it's consumed right away.
+            self.data_consumed(frame.length)
+
+        # Keep a PING in flight while data is coming in, each one gives the
+        # windows a sample of the bandwidth-delay product.
+        if self._rtt_ping is None:
+            self._send_rtt_ping()
+
+    def _send_rtt_ping(self):
+        self._rtt_ping = self._send_ping()
+
+        self._receive_window.start_sample()
+        for stream in self._streams.values():
+            stream._receive_window.start_sample()
+
+    def _send_ping(self, waiter=None):
+        """ Queue a PING stamped with the current time, returns its opaque data. """
+        now = self._ev_loop.time()
+        # Kept unique, even for PINGs sent within the same microsecond.
+        self._last_ping_data = max(int(now * 1000000), self._last_ping_data + 1)
+
+        ping = PingFrame()
+        ping.opaque_data = UINT64_STRUCT.pack(self._last_ping_data)
+        self._outstanding_pings[ping.opaque_data] = (now, waiter)
+        self._queue_frame(ping)
+        return ping.opaque_data
 
     @asyncio.coroutine
-    def update_incoming_flow_control(self, increment, stream_id=0):
-        logging.info('SENDING OUT FLOW CONTROL UPDATE FOR STREAM: %s' % stream_id)
-        window_update = WindowUpdateFrame(stream_id=stream_id,
-                                          window_size_increment=increment)
+    def ping(self):
+        """ Send a PING, and return the round trip time once it's ACKed. """
+        waiter = asyncio.Future(loop=self._ev_loop)
+        self._send_ping(waiter)
+        return (yield from waiter)
+
+    def _handle_pong(self, frame):
+        outstanding = self._outstanding_pings.pop(frame.opaque_data, None)
+        if outstanding is None:
+            # Not one of ours, or it was already given up on.
+            return
+
+        sent_at, waiter = outstanding
+        rtt = self._ev_loop.time() - sent_at
+        self.rtt.sample(rtt)
+        if TRACE_RTT.enabled:
+            TRACE_RTT.emit(rtt=rtt, srtt=self.rtt.srtt, rttvar=self.rtt.rttvar)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(rtt)
+
+        if frame.opaque_data == self._rtt_ping:
+            self._rtt_ping = None
+            self._receive_window.end_sample(rtt)
+            for stream in self._streams.values():
+                stream._receive_window.end_sample(rtt)
+
+    def _start_keepalive(self):
+        if self.keepalive_interval is not None and self._keepalive_handle is None:
+            self._keepalive_handle = self._ev_loop.call_later(self.keepalive_interval,
+                                                              self._keepalive)
+
+    def _stop_keepalive(self):
+        if self._keepalive_handle is not None:
+            self._keepalive_handle.cancel()
+            self._keepalive_handle = None
+
+    def _keepalive(self):
+        self._keepalive_handle = None
+        if self._connection_closed.done():
+            return
+
+        # Give up on the peer once a PING went unanswered for too long.
+        now = self._ev_loop.time()
+        timeout = self.rtt.timeout(self.keepalive_timeout)
+        if any(now - sent_at > timeout for sent_at, _ in self._outstanding_pings.values()):
+            self._peer_dead()
+            return
+
+        # Nothing may be sent before the connection preface, and there's no
+        # need for another PING while one is still in flight.
+        if self._connection_header_exchanged.done() and not self._outstanding_pings:
+            self._send_ping()
+        self._start_keepalive()
+
+    def _peer_dead(self):
+        logger.info('Peer did not answer a PING, closing the connection')
+        if TRACE_PEER_DEAD.enabled:
+            TRACE_PEER_DEAD.emit(outstanding_pings=len(self._outstanding_pings),
+                                 srtt=self.rtt.srtt)
+        self._connection_closed.set_result(True)
+        asyncio.async(self.close_connection())
+
+    def _cancel_pings(self):
+        for _, waiter in self._outstanding_pings.values():
+            if waiter is not None:
+                waiter.cancel()
+        self._outstanding_pings.clear()
+        self._rtt_ping = None
 
-        # Possibly block until there's room in the queue.
-        yield from self.write_frame(window_update)
+    def data_consumed(self, consumed, stream_id=0):
+        """
+        Let the flow control windows know `consumed` bytes of DATA were handed
+        over to the application. WINDOW_UPDATEs are only sent once enough of
+        a window has been consumed, or after it was grown.
+        """
+        # Data received on a stream counts against the connection's window
+        # too, so the connection gets its credit back along with the stream.
+        stream = self._streams.get(stream_id)
+        if stream is not None:
+            self._schedule_window_update(stream_id,
+                                         stream._receive_window.data_consumed(consumed))
+        self._schedule_window_update(0, self._receive_window.data_consumed(consumed))
+
+    def _schedule_window_update(self, stream_id, increment):
+        if not increment:
+            return
+
+        # Updates are held back until the end of this cycle of the event loop,
+        # so that everything consumed in response to a single read goes out
+        # as one batch, with at most one update per window.
+        self._pending_window_updates[stream_id] = (
+            self._pending_window_updates.get(stream_id, 0) + increment)
+        if self._window_update_handle is None:
+            self._window_update_handle = self._ev_loop.call_soon(self._flush_window_updates)
+
+    def _flush_window_updates(self):
+        self._window_update_handle = None
+        pending_window_updates, self._pending_window_updates = self._pending_window_updates, {}
+
+        for stream_id, increment in sorted(pending_window_updates.items()):
+            if TRACE_WINDOW_UPDATE_SENT.enabled:
+                TRACE_WINDOW_UPDATE_SENT.emit(stream_id=stream_id, increment=increment)
+            self._queue_frame(WindowUpdateFrame(stream_id=stream_id,
+                                                window_size_increment=increment))
+            self._window_updates_sent += 1
+
+    def flow_control_stats(self):
+        """
+        Counters for the receive side flow control, including the number of
+        bytes spent on control frames for every byte of DATA sent or received.
+        """
+        body_bytes = self._data_bytes_received + self._data_bytes_sent
+        return {'receive_window': self._receive_window.size,
+                'data_bytes_received': self._data_bytes_received,
+                'data_bytes_sent': self._data_bytes_sent,
+                'window_updates_sent': self._window_updates_sent,
+                'control_bytes_sent': self._control_bytes_sent,
+                'control_bytes_per_body_byte': (self._control_bytes_sent / body_bytes
+                                                if body_bytes else 0.0)}
 
     @asyncio.coroutine
     def settings_handshake(self):
@@ -322,9 +990,29 @@ class HTTP2CommonProtocol(asyncio.StreamReaderProtocol):
         raise NotImplementedError
 
 
+    def _send_go_away(self, exc):
+        """
+        Let the peer know why the connection is about to be closed, ahead of
+        anything still queued up, which won't be sent anymore.
+        """
+        logger.info('Connection error, sending a GOAWAY: %r', exc)
+        if isinstance(exc, ConnectionError):
+            error_code = CONNECTION_ERROR_CODES.get(type(exc), ErrorCode.PROTOCOL_ERROR)
+        else:
+            error_code = ErrorCode.INTERNAL_ERROR
+        go_away = GoAwayFrame(last_stream_id=self._last_peer_stream_id, error_code=error_code)
+        if not self.writer.transport.is_closing():
+            self.writer.write(go_away.serialize())
+
     @asyncio.coroutine
     def close_connection(self, go_away_frame=None):
-        logging.info('Closing connection')
+        logger.info('Closing connection')
+        self._stop_keepalive()
+        if self._evict_handle is not None:
+            self._evict_handle.cancel()
+            self._evict_handle = None
+        self._cancel_pings()
+        self._cancel_requests()
         # some shit with futures for the running tasks.
         self._reader_task.cancel()
         self._writer_task.cancel()
@@ -339,14 +1027,130 @@ class HTTP2CommonProtocol(asyncio.StreamReaderProtocol):
             logger.info('SERVER STREAM HAS BEEN OPENED')
         self.reader = reader
         self.writer = writer
-        self._frame_parser = FrameParser(self.reader, self)
+        self._frame_parser = FrameParser(self.reader, self._inbound_frames)
+        self._start_keepalive()
 
     def connection_lost(self, exc):
         logger.info('Connection has been lost')
+        self._stop_keepalive()
+        self._cancel_pings()
+        self._cancel_requests()
         if not self._connection_closed.done():
             self._connection_closed.set_result(True)
         super().connection_lost(exc)
 
+    def _cancel_requests(self):
+        """
+        Nothing more will arrive for the requests still being handled, nor can
+        their responses be sent. Their slots are released as they finish.
+        """
+        for response_task in self._request_tasks:
+            response_task.cancel()
+
+
+
+class HTTP2DirectProtocolMixin(object):
+    """
+    Reads the connection straight off `data_received` rather than going
+    through the StreamReader and a reader task. Every frame within a read is
+    parsed and dispatched synchronously, so only the streams which got new
+    frames are woken up.
+
+    Mixed in ahead of a client or server connection class, see
+    `HTTP2DirectServer` and `HTTP2DirectClientConnection`.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self._frame_buffer = FrameBuffer()
+        # Set once a connection error was found, anything read after that is
+        # dropped.
+        self._tearing_down = False
+
+        # A server first needs the 24 byte connection preface from the client.
+        self._preface_buffer = None if self._is_client else b''
+
+    @asyncio.coroutine
+    def start_reader_task(self):
+        # Frames are handled as soon as they're read, no reader task needed.
+        return
+
+    def eof_received(self):
+        # The peer is gone, which the reader task would otherwise find out.
+        logger.info('Connection closed by the peer')
+        asyncio.async(self.close_connection())
+        return super().eof_received()
+
+    def _pause_reading(self):
+        super()._pause_reading()
+        # Frames already read are still dispatched, nothing more is read
+        # until reading is resumed.
+        if not self.writer.transport.is_closing():
+            self.writer.transport.pause_reading()
+
+    def _resume_reading(self):
+        super()._resume_reading()
+        if not self.writer.transport.is_closing():
+            self.writer.transport.resume_reading()
+
+    @asyncio.coroutine
+    def settings_handshake(self, *args):
+        # The handshake itself is driven by the incoming data, all that's left
+        # to do is send the client preface, and wait for the SETTINGS frame of
+        # the other side.
+        if self._is_client:
+            self._send_preface(*args)
+        yield from self._connection_header_exchanged
+
+    def _consume_preface(self, data):
+        """
+        Match `data` against the connection preface. Returns whatever comes
+        after the preface, or None if the whole preface hasn't arrived yet.
+        """
+        needed = len(HANDSHAKE_CODE) - len(self._preface_buffer)
+        preface = self._preface_buffer + bytes(data[:needed])
+        if preface != HANDSHAKE_CODE[:len(preface)]:
+            raise ProtocolError()
+        elif len(preface) < len(HANDSHAKE_CODE):
+            self._preface_buffer = preface
+            return None
+
+        logger.info('Server got the client connection header')
+        self._preface_buffer = None
+        return data[needed:]
+
+    def data_received(self, data):
+        if self._tearing_down:
+            return
+        try:
+            if self._preface_buffer is not None:
+                data = self._consume_preface(data)
+                if data is None:
+                    return
+
+            frames = self._frame_buffer.feed(data)
+
+            # The very first frame must be the SETTINGS of the other side.
+            if not self._connection_header_exchanged.done():
+                for frame in frames:
+                    if not isinstance(frame, SettingsFrame):
+                        raise ProtocolError()
+                    self._complete_handshake(frame)
+                    break
+
+            # Everything that was read is dispatched right now, by order of
+            # stream priority.
+            self._inbound_frames.push_frames(frames)
+            while self._inbound_frames:
+                self._dispatch_frame(self._inbound_frames.pop_frame())
+        except Exception as e:
+            logger.info('Invalid data read from the connection, closing it')
+            # The frames left over from this read go along with it.
+            self._tearing_down = True
+            self._send_go_away(e)
+            asyncio.async(self.close_connection())
+
 
 HANDSHAKE_CODE = bytearray.fromhex('505249202a20485454502f322e300d0a0d0a534d0d0a0d0a')
 
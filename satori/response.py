@@ -18,18 +18,40 @@ class BaseResponse(object):
         return 200 <= self.status_code <= 300
 
 
-class ClientResponse(BaseResponse):
-    def __init__(self, headers, stream):
-        super().__init__(headers, stream)
-        self.body = None
+class BodyReader(object):
+    """
+    Reading the body of a stream, as a whole or as it arrives. Flow control
+    credit is only handed back to the peer as the body is read, so a reader
+    which falls behind slows down the sender.
+    """
 
     @asyncio.coroutine
     def read_body(self):
-        logging.info('Reading stream data')
-        self.body = yield from self._stream._read_data()
-        logging.info('Done reading stream data')
+        body_chunks = yield from self.read_body_chunks()
+        self.body = b''.join(body_chunks)
         return self.body
 
+    @asyncio.coroutine
+    def read_body_chunks(self):
+        """ Read the body as a list of memoryviews, without joining them. """
+        body_chunks = yield from self._stream._read_data_chunks()
+        return body_chunks
+
+    @asyncio.coroutine
+    def read(self, num_bytes=-1):
+        """ Read up to `num_bytes` of the body, b'' once it's all been read. """
+        return (yield from self._stream.read(num_bytes))
+
+    def iter_chunks(self):
+        """ `async for` over the body, as memoryviews of the received chunks. """
+        return self._stream.iter_chunks()
+
+
+class ClientResponse(BodyReader, BaseResponse):
+    def __init__(self, headers, stream):
+        super().__init__(headers, stream)
+        self.body = None
+
     @property
     def status_code(self):
         return int(self.headers[':status'])
@@ -41,6 +63,18 @@ class ClientResponse(BaseResponse):
             return json.loads(self.body)
 
 
+class ServerRequest(BodyReader, dict):
+    """
+    The request headers handed to a route handler, along with its body, which
+    is only read if and when the handler asks for it.
+    """
+
+    def __init__(self, headers, stream):
+        super().__init__(headers)
+        self._stream = stream
+        self.body = None
+
+
 class ServerResponse(BaseResponse):
     def __init__(self, headers, stream):
         super().__init__(headers, stream)
@@ -50,25 +84,28 @@ class ServerResponse(BaseResponse):
     @asyncio.coroutine
     def end_headers(self, priority=DEFAULT_PRIORITY):
         # Send off the headers frame(s) via this stream.
-        logging.info('Server sending over response headers')
         self._stream._response_headers = self.headers
         yield from self._stream._send_headers(end_headers=True, end_stream=False,
                                               priority=priority)
 
     @asyncio.coroutine
     def write(self, data, end_stream):
-        logging.info('Server writing data to stream')
-        if end_stream:
-            logging.info('SERVER DONE SENDING DATA')
-        yield from self._stream._send_data(data, end_stream)
+        """
+        Send `data` as (part of) the body: bytes-like, a str, an async
+        iterable of those, or a file object. Iterables and files are pulled
+        from lazily, as the client makes room for more.
+        """
+        yield from self._stream._send_body(data, end_stream)
 
     @asyncio.coroutine
     def write_static_file(self, file_path):
-        pass
+        """ Send the contents of a file as the rest of the body. """
+        with open(file_path, 'rb') as body_file:
+            yield from self._stream._send_body(body_file, end_stream=True)
 
     @asyncio.coroutine
     def init_push(self, push_request_headers):  # TODO(roasbeef): Also allow push response headers here?
-        logging.info('Server is trying to push a promise')
+        logger.info('Server is trying to push a promise')
         # Create a new push promise, sending over the headers.
         # The initial headers need to be as if the server is sending the
         # headers pertaining to an original request for that resource.
@@ -0,0 +1,53 @@
+"""
+Round trip time estimation, from the PINGs sent on a connection. Samples are
+smoothed the way TCP does it (RFC 6298), so a single slow ACK doesn't throw
+off the estimate.
+"""
+
+# Gains of the smoothed RTT and its variance.
+RTT_ALPHA = 1 / 8
+RTT_BETA = 1 / 4
+
+
+class RttEstimator(object):
+    """
+    Smoothed round trip time and its variance, along with the lowest and most
+    recent samples. Everything is in seconds, and None until the first sample.
+    """
+    __slots__ = ('srtt', 'rttvar', 'min_rtt', 'latest_rtt', 'samples')
+
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = None
+        self.min_rtt = None
+        self.latest_rtt = None
+        self.samples = 0
+
+    def sample(self, rtt):
+        self.latest_rtt = rtt
+        self.samples += 1
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+            self.min_rtt = rtt
+            return
+
+        self.rttvar += RTT_BETA * (abs(self.srtt - rtt) - self.rttvar)
+        self.srtt += RTT_ALPHA * (rtt - self.srtt)
+        self.min_rtt = min(self.min_rtt, rtt)
+
+    def timeout(self, floor):
+        """
+        How long to wait for an ACK before giving up on it, never less than
+        `floor`.
+        """
+        if self.srtt is None:
+            return floor
+        return max(floor, self.srtt + 4 * self.rttvar)
+
+    def snapshot(self):
+        return {'srtt': self.srtt,
+                'rttvar': self.rttvar,
+                'min_rtt': self.min_rtt,
+                'latest_rtt': self.latest_rtt,
+                'samples': self.samples}
@@ -0,0 +1,159 @@
+"""
+Outbound write scheduling. DATA frames, which carry a stream's body, are
+handed to a scheduler, which decides how the connection is shared between the
+streams with something to send. Control frames and header blocks are written
+out ahead of it, in the order they were queued. Any scheduler needs
+`push_frame(frame, priority)`, `pop_frame()`, `reprioritize_stream(stream_id,
+priority)`, `delete_stream(stream_id)` and `__len__`, so a
+`PriorityFrameQueue` can be dropped in for strict priority ordering.
+"""
+from .frame import FrameType, DEFAULT_PRIORITY
+from .codec import FRAME_HEADER_LENGTH
+
+import collections
+
+MAX_PRIORITY = 2 ** 31 - 1
+MAX_WEIGHT = 256
+
+# Frames which go through the scheduler.
+SCHEDULED_FRAME_TYPES = frozenset([FrameType.DATA])
+# Frames which make up a header block. They skip the scheduler, as they have
+# to go out in the order they were HPACK encoded in, with the frames of a
+# block back to back.
+HEADER_BLOCK_FRAME_TYPES = frozenset([FrameType.HEADERS, FrameType.PUSH_PROMISE,
+                                      FrameType.CONTINUATION])
+
+
+def is_control_frame(frame):
+    """ Anything other than a stream's headers or body. """
+    return frame.stream_id == 0 or (frame.frame_type not in SCHEDULED_FRAME_TYPES and
+                                    frame.frame_type not in HEADER_BLOCK_FRAME_TYPES)
+
+
+def priority_weight(priority):
+    """
+    Map a 31-bit stream priority (0 being the highest) onto a weight between
+    1 and 256. The default priority lands right in the middle.
+    """
+    priority = min(max(priority, 0), MAX_PRIORITY)
+    return 1 + ((MAX_WEIGHT - 1) * (MAX_PRIORITY - priority)) // MAX_PRIORITY
+
+
+class _StreamQueue(object):
+    __slots__ = ('frames', 'quantum', 'deficit', 'skipped')
+
+    def __init__(self, quantum):
+        self.frames = collections.deque()
+        self.quantum = quantum
+        self.deficit = 0
+        self.skipped = 0
+
+
+class DeficitRoundRobinScheduler(object):
+    """
+    Deficit round robin over per-stream queues. Every time a stream comes up
+    in the round it's credited `quantum * weight` bytes, and sends frames for
+    as long as its credit covers them, so backlogged streams share the
+    connection in proportion to their weight no matter how large their
+    frames are.
+
+    To keep a heavily outweighed stream from sitting idle for too long, a
+    stream which has been passed over `max_skips` times in a row gets to send
+    its next frame regardless of its credit.
+    """
+
+    def __init__(self, quantum=64, max_skips=16):
+        self._quantum = quantum
+        self._max_skips = max_skips
+
+        self._stream_queues = {}
+        # Stream ids with queued frames, the head being the one being served.
+        self._active_streams = collections.deque()
+        self._num_frames = 0
+
+    def __len__(self):
+        return self._num_frames
+
+    def _stream_quantum(self, priority):
+        return self._quantum * priority_weight(priority)
+
+    @staticmethod
+    def _frame_cost(frame):
+        return FRAME_HEADER_LENGTH + len(frame)
+
+    def push_frame(self, frame, priority=DEFAULT_PRIORITY):
+        stream_queue = self._stream_queues.get(frame.stream_id)
+        if stream_queue is None:
+            stream_queue = self._stream_queues[frame.stream_id] = _StreamQueue(
+                self._stream_quantum(priority))
+            self._active_streams.append(frame.stream_id)
+
+        stream_queue.frames.append(frame)
+        self._num_frames += 1
+
+    def pop_frame(self):
+        visited = 0
+        while self._active_streams:
+            stream_id = self._active_streams[0]
+            stream_queue = self._stream_queues[stream_id]
+            frame_cost = self._frame_cost(stream_queue.frames[0])
+
+            if (stream_queue.deficit >= frame_cost or
+                    stream_queue.skipped >= self._max_skips):
+                return self._pop_stream_frame(stream_id, stream_queue, frame_cost)
+
+            # Out of credit, top it up and move on to the next stream.
+            stream_queue.deficit += stream_queue.quantum
+            stream_queue.skipped += 1
+            self._active_streams.rotate(-1)
+
+            visited += 1
+            if visited == len(self._active_streams):
+                # A whole round went by without anything being sent. Rather
+                # than going round and round, hand out the credit of however
+                # many rounds it takes for a stream to be able to send.
+                self._skip_rounds()
+                visited = 0
+
+        return None
+
+    def _skip_rounds(self):
+        rounds = self._max_skips
+        for stream_id in self._active_streams:
+            stream_queue = self._stream_queues[stream_id]
+            shortfall = self._frame_cost(stream_queue.frames[0]) - stream_queue.deficit
+            rounds = min(rounds, -(-shortfall // stream_queue.quantum),
+                         self._max_skips - stream_queue.skipped)
+
+        rounds = max(rounds, 0)
+        for stream_id in self._active_streams:
+            stream_queue = self._stream_queues[stream_id]
+            stream_queue.deficit += rounds * stream_queue.quantum
+            stream_queue.skipped += rounds
+
+    def _pop_stream_frame(self, stream_id, stream_queue, frame_cost):
+        frame = stream_queue.frames.popleft()
+        self._num_frames -= 1
+        stream_queue.deficit = max(stream_queue.deficit - frame_cost, 0)
+        stream_queue.skipped = 0
+
+        if not stream_queue.frames:
+            # Credit isn't banked while a stream has nothing to send.
+            self._active_streams.popleft()
+            del self._stream_queues[stream_id]
+
+        return frame
+
+    def reprioritize_stream(self, stream_id, priority):
+        stream_queue = self._stream_queues.get(stream_id)
+        if stream_queue is not None:
+            stream_queue.quantum = self._stream_quantum(priority)
+
+    def delete_stream(self, stream_id):
+        """ Drop every frame queued up for `stream_id`, returning them. """
+        stream_queue = self._stream_queues.pop(stream_id, None)
+        if stream_queue is None:
+            return []
+        self._num_frames -= len(stream_queue.frames)
+        self._active_streams.remove(stream_id)
+        return list(stream_queue.frames)
@@ -1,6 +1,7 @@
-from .protocol import HTTP2CommonProtocol, HANDSHAKE_CODE
-from .response import ServerResponse
-from .frame import HeadersFrame, SettingsFrame, FrameHeader, Frame
+from .protocol import HTTP2CommonProtocol, HTTP2DirectProtocolMixin, HANDSHAKE_CODE
+from .response import ServerRequest, ServerResponse
+from .frame import HeadersFrame, SettingsFrame, Frame, ConnectionSetting
+from .codec import unpack_header
 import asyncio
 import collections
 import sys
@@ -14,13 +15,40 @@ if not logger.handlers:
     out_hdlr.setLevel(logging.INFO)
     logger.addHandler(out_hdlr)
 
+class StreamBudget(object):
+    """
+    Number of requests which may be in flight at once, across every
+    connection of a server. Once it's used up, new streams are refused up
+    front, rather than piling up tasks on the event loop.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.refused = 0
+
+    def acquire(self):
+        if self.in_flight >= self.limit:
+            self.refused += 1
+            return False
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        self.in_flight -= 1
+
+
 class HTTP2Server(HTTP2CommonProtocol):
-    def __init__(self, route_handler, server_settings):
+    def __init__(self, route_handler, server_settings, stream_budget=None):
         self._server_settings = server_settings
         self._handler = route_handler
         self._routes = {}
         super().__init__(is_client=False)
 
+        # Clients are told about the limit in our SETTINGS, and held to it.
+        self._max_concurrent_streams = server_settings.get(ConnectionSetting.MAX_CONCURRENT_STREAMS)
+        self._stream_budget = stream_budget
+
 
     def connection_made(self, transport):
         logging.info('Connection made for sever')
@@ -31,45 +59,61 @@ class HTTP2Server(HTTP2CommonProtocol):
     @asyncio.coroutine
     def settings_handshake(self):
         logging.info('Trying to read handshake bytes')
-        handshake_bytes = yield from self.reader.read(24)
+        handshake_bytes = yield from self.reader.readexactly(24)
         if handshake_bytes == HANDSHAKE_CODE:
             logging.info('Server got the client connection header')
-            header_bytes = yield from self.reader.read(8)
-            frame_header = FrameHeader.from_raw_bytes(header_bytes)
+            header_bytes = yield from self.reader.readexactly(8)
+            length, raw_type, raw_flags, stream_id = unpack_header(header_bytes)
 
-            payload_bytes = yield from self.reader.read(frame_header.length)
-            frame = Frame.from_frame_header(frame_header)
+            payload_bytes = yield from self.reader.readexactly(length)
+            frame = Frame.from_raw_header(raw_type, raw_flags, stream_id)
 
             frame.deserialize(payload_bytes)
-            logging.info('Server got initial settings frame.')
-            self.update_settings(frame)
-
-            logging.info('Server sending its settings frame.')
-            our_settings = SettingsFrame(stream_id=0, settings=self._server_settings)
-            self.writer.write(our_settings.serialize())
-
-            # Off to the races.
-            logging.info('Server handshake done.')
-            self._connection_header_exchanged.set_result(True)
+            self._complete_handshake(frame)
         else:
             logging.info('Client handshake invalid.')
             yield from self.close_connection()
 
+    def _complete_handshake(self, settings_frame):
+        logging.info('Server got initial settings frame.')
+        self.update_settings(settings_frame)
+
+        logging.info('Server sending its settings frame.')
+        our_settings = SettingsFrame(stream_id=0, settings=self._server_settings)
+        self.writer.write(our_settings.serialize())
+
+        # Off to the races.
+        logging.info('Server handshake done.')
+        self._connection_header_exchanged.set_result(True)
+
     @asyncio.coroutine
-    def dispatch_response(self, request_stream, req_body=None):
+    def dispatch_response(self, request_stream):
         # Look the the request headers of the stream, find the proper coroutine
         # handler from the map. `yield from` it, letting it handle the request
         # and do w/e else it needs to.
         requested_route = request_stream._request_headers[':path']
         server_response = ServerResponse({}, request_stream)
+        request = ServerRequest(request_stream._request_headers, request_stream)
         logger.info('Processing request')
-        yield from self._handler(request_stream._request_headers,
-                                 server_response, {})
+        yield from self._handler(request, server_response, {})
         logger.info('Done with request')
 
+
+class HTTP2DirectServer(HTTP2DirectProtocolMixin, HTTP2Server):
+    """ HTTP2Server which reads frames straight off the transport. """
+    pass
+
+
 @asyncio.coroutine
 def serve(route_handler, http2_settings, port, host=None, *,
-          klass=HTTP2Server, **kwargs):
+          klass=None, direct=False, max_streams_in_flight=None, **kwargs):
+    if klass is None:
+        klass = HTTP2DirectServer if direct else HTTP2Server
+
+    # Shared by every connection of this server.
+    stream_budget = (StreamBudget(max_streams_in_flight)
+                     if max_streams_in_flight is not None else None)
     return (yield from asyncio.get_event_loop().create_server(
-        lambda: klass(route_handler, http2_settings), host, port, **kwargs)
+        lambda: klass(route_handler, http2_settings, stream_budget=stream_budget),
+        host, port, **kwargs)
     )
@@ -1,7 +1,13 @@
-from .frame import (WindowUpdateFrame, HeadersFrame, FrameFlag, DataFrame,
-                    PushPromise, RstStreamFrame, PriorityFrame, DEFAULT_PRIORITY)
+from .frame import (HeadersFrame, DataFrame, PushPromise, ContinuationFrame,
+                    RstStreamFrame, FrameType, ErrorCode, DEFAULT_PRIORITY, MAX_FRAME_SIZE,
+                    FLAG_END_STREAM, FLAG_END_HEADERS)
 from .response import ClientResponse
+from .flow import ReceiveWindow
+from .metrics import StreamMetrics, headers_size
+from .trace import trace_point
+from .exceptions import StreamReset, HeaderListTooLarge
 import asyncio
+import collections
 
 import enum
 
@@ -11,6 +17,13 @@ import logging
 logger = logging.getLogger('http2')
 logger.setLevel(logging.INFO)
 
+TRACE_HEADERS_SENT = trace_point('stream.headers_sent')
+TRACE_HEADERS_RECEIVED = trace_point('stream.headers_received')
+TRACE_DATA_SENT = trace_point('stream.data_sent')
+TRACE_DATA_READ = trace_point('stream.data_read')
+TRACE_FLOW_BLOCKED = trace_point('stream.flow_blocked')
+TRACE_WINDOW_UPDATE_RECEIVED = trace_point('flow.window_update_received')
+
 
 # TODO(roasbeef): Change other Enums to IntEnums like this one.
 class StreamState(enum.IntEnum):
@@ -18,10 +31,88 @@ class StreamState(enum.IntEnum):
      HALF_CLOSED_REMOTE, HALF_CLOSED_LOCAL, CLOSED) = range(7)
 
 
+# State transitions, keyed by the state they apply to. Anything not listed is
+# left in the state it's in.
+HEADERS_SENT = {StreamState.IDLE: StreamState.OPEN,
+                StreamState.RESERVED_LOCAL: StreamState.HALF_CLOSED_REMOTE}
+HEADERS_RECEIVED = {StreamState.IDLE: StreamState.OPEN,
+                    StreamState.RESERVED_REMOTE: StreamState.HALF_CLOSED_LOCAL}
+END_STREAM_SENT = {StreamState.OPEN: StreamState.HALF_CLOSED_LOCAL,
+                   StreamState.HALF_CLOSED_REMOTE: StreamState.CLOSED}
+END_STREAM_RECEIVED = {StreamState.OPEN: StreamState.HALF_CLOSED_REMOTE,
+                       StreamState.HALF_CLOSED_LOCAL: StreamState.CLOSED}
+
+
+class DataChunkIterator(object):
+    """ Iterates over the body of a stream, see `Stream.iter_chunks`. """
+    __slots__ = ('_stream',)
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def __aiter__(self):
+        return self
+
+    @asyncio.coroutine
+    def __anext__(self):
+        chunk = yield from self._stream._next_data_chunk()
+        if chunk is None:
+            raise StopAsyncIteration
+        # Only credited once the chunk is handed over.
+        self._stream._data_consumed(len(chunk))
+        return chunk
+
+
+class StreamFrameQueue(object):
+    """
+    Frames received on a stream, waiting for whoever is consuming it. Much
+    lighter than an `asyncio.Queue`, as there's only ever a single consumer
+    and nothing ever waits to put a frame. Keeps count of the payload bytes
+    of the frames it holds.
+    """
+    __slots__ = ('_queue', '_waiter', 'buffered_bytes')
+
+    def __init__(self):
+        self._queue = collections.deque()
+        self._waiter = None
+        self.buffered_bytes = 0
+
+    def qsize(self):
+        return len(self._queue)
+
+    def empty(self):
+        return not self._queue
+
+    def put_nowait(self, frame):
+        self._queue.append(frame)
+        self.buffered_bytes += frame.length
+        if self._waiter is not None:
+            if not self._waiter.done():
+                self._waiter.set_result(None)
+            self._waiter = None
+
+    @asyncio.coroutine
+    def get(self):
+        while not self._queue:
+            self._waiter = asyncio.Future()
+            yield from self._waiter
+        frame = self._queue.popleft()
+        self.buffered_bytes -= frame.length
+        return frame
+
+
 # NEED TO STRONGLY CONSIDER MAKING THIS INTO TWO SUBCLASSES
 class Stream(object):
-
-    def __init__(self, stream_id, conn, header_codec, priority=DEFAULT_PRIORITY):
+    # Connections may go through a great many streams, keep them small. The
+    # frame queue, and the future for window updates, are only created once
+    # they're needed.
+    __slots__ = ('stream_id', 'state', 'priority', '_request_headers', '_response_headers',
+                 '_header_codec', '_conn', '_frames', '_promised_streams',
+                 '_outgoing_flow_control_window', '_window_waiter', '_receive_window',
+                 '_read_buffer', '_body_received', '_reset_code', 'metrics')
+
+    def __init__(self, stream_id, conn, header_codec, priority=DEFAULT_PRIORITY,
+                 receive_window=None, metrics=None):
         self.stream_id = stream_id
         self.state = StreamState.IDLE
         # Priority of a frame, lowest is the highest priority
@@ -34,18 +125,52 @@ class Stream(object):
 
         self._conn = conn
 
-        self._frame_queue = asyncio.Queue()
+        self._frames = None
         # A dictionary of Futures who's value will be the stream object
         # promised from this particular stream sometime in the future
-        self._promised_streams = {}
+        self._promised_streams = None
 
         self._outgoing_flow_control_window = 65535
 
-        self._outgoing_window_update = asyncio.Event()
+        # Set while `_send_data` waits on a window update.
+        self._window_waiter = None
+        # Credit for DATA the peer may send on this stream.
+        self._receive_window = receive_window if receive_window is not None else ReceiveWindow()
+        # What's left of a chunk only partly read, and whether the last frame
+        # of the body was read.
+        self._read_buffer = None
+        self._body_received = False
+        # Error code of the RST_STREAM received, if any.
+        self._reset_code = None
+        self.metrics = (metrics if metrics is not None else
+                        StreamMetrics(opened_at=0.0, response_inbound=False))
+
+    @property
+    def _frame_queue(self):
+        if self._frames is None:
+            self._frames = StreamFrameQueue()
+        return self._frames
+
+    def _transition(self, transitions):
+        new_state = transitions.get(self.state)
+        if new_state is not None:
+            self.state = new_state
+            if new_state == StreamState.CLOSED:
+                self._conn._stream_closed(self)
+
+    def _close(self):
+        if self.state != StreamState.CLOSED:
+            self.state = StreamState.CLOSED
+            self._conn._stream_closed(self)
 
+    def _window_updated(self):
+        """ Wake up `_send_data`, if it's waiting on a window update. """
+        if self._window_waiter is not None:
+            if not self._window_waiter.done():
+                self._window_waiter.set_result(None)
+            self._window_waiter = None
 
     def add_header(self, header_key, header_value, is_request_header):
-        logging.info('Adding header to stream: %s' % self.stream_id)
         if is_request_header:
             self._request_headers[header_key.lower()] = header_value
         else:
@@ -53,173 +178,412 @@ class Stream(object):
 
     def receive_promised_stream(self, stream):
         logger.info('got our promised stream')
-        self._promised_streams[stream.stream_id].set_result(stream)
+        self._promised_streams.pop(stream.stream_id).set_result(stream)
 
     def process_frame(self, frame):
-        if isinstance(frame, WindowUpdateFrame):
-            logger.info('GOT A WINDOW UPDATE FRAME FOR STREAM: %s, size increase: %s' % (frame.stream_id, frame.window_size_increment))
-            self._outgoing_flow_control_window += frame.window_size_increment
-            # Notify the task sending data of an update, as it might be waiting
-            # on one.
-            logger.info('Notifying tasks they can continue to write.')
-            self._outgoing_window_update.set()
-            self._outgoing_window_update.clear()
-        # TODO(Roasbeef): Should we also update the priority of frames that
-        # this stream has in the heapq?
-        elif isinstance(frame, PriorityFrame):
-            logger.info('Got a priority frame')
-            self.priority = frame.priority
-        elif isinstance(frame, RstStreamFrame):
-            # Either a client has rejected a push promise
-            # OR we just messed up somehow in regards to the defined stream
-            # semantics.
-            # Call self.close() ?
-            pass
+        handler = self._frame_handlers.get(frame.frame_type)
+        if handler is not None:
+            handler(self, frame)
         else:
-            logger.info('Frame sent to stream: %s' % frame)
-            self._frame_queue.put_nowait(frame)
+            self._buffer_frame(frame)
+
+    def _buffer_frame(self, frame):
+        """ Queue up a frame for whoever is consuming the stream. """
+        self._frame_queue.put_nowait(frame)
+        self._conn._frame_buffered(self, frame.length)
+
+    @asyncio.coroutine
+    def _next_frame(self):
+        frame = yield from self._frame_queue.get()
+        self._conn._frame_buffered(self, -frame.length)
+        return frame
+
+    def _handle_window_update(self, frame):
+        if TRACE_WINDOW_UPDATE_RECEIVED.enabled:
+            TRACE_WINDOW_UPDATE_RECEIVED.emit(stream_id=self.stream_id,
+                                              increment=frame.window_size_increment)
+        self._outgoing_flow_control_window += frame.window_size_increment
+        # Notify the task sending data of an update, as it might be waiting
+        # on one.
+        self._window_updated()
+
+    def _handle_priority(self, frame):
+        logger.info('Got a priority frame')
+        # Frames of this stream which are already queued up get re-keyed
+        # along with the stream itself.
+        self._conn.reprioritize_stream(self.stream_id, frame.priority)
+
+    def _handle_rst_stream(self, frame):
+        # Either a client has rejected a push promise
+        # OR we just messed up somehow in regards to the defined stream
+        # semantics.
+        self._reset_code = frame.error_code
+        self._conn._purge_stream(self.stream_id)
+        self._close()
+        # Wake up whoever is consuming or sending on the stream, to find out.
+        self._buffer_frame(frame)
+        self._window_updated()
+
+    def _handle_headers(self, frame):
+        self._transition(HEADERS_RECEIVED)
+        self._buffer_frame(frame)
+        if frame.end_stream:
+            self._transition(END_STREAM_RECEIVED)
+
+    def _handle_data(self, frame):
+        self._buffer_frame(frame)
+        if frame.end_stream:
+            self._transition(END_STREAM_RECEIVED)
+
+    # Frames handled as soon as they arrive, keyed by frame type. Anything
+    # else is queued up for whoever is consuming the stream.
+    _frame_handlers = {
+        FrameType.HEADERS: _handle_headers,
+        FrameType.DATA: _handle_data,
+        FrameType.WINDOW_UPDATE: _handle_window_update,
+        FrameType.PRIORITY: _handle_priority,
+        FrameType.RST_STREAM: _handle_rst_stream,
+    }
+
+    def _encode_headers(self, headers):
+        encoded_headers = self._header_codec.encode_headers(headers)
+        self._conn.metrics.headers_encoded(headers_size(headers), len(encoded_headers))
+        return encoded_headers
+
+    def _queue_header_block(self, first_frame, header_block):
+        """
+        Queue up an encoded header block, in `first_frame` followed by as many
+        CONTINUATION frames as it takes to keep within the max frame size.
+        Done right after encoding it, as blocks must reach the peer in the
+        order they were encoded in.
+        """
+        block_view = memoryview(header_block)
+        # Whatever room is left next to the first frame's own fields.
+        offset = MAX_FRAME_SIZE - len(first_frame)
+        first_frame.data = block_view[:offset]
+        frames = [first_frame]
+        while offset < len(block_view):
+            continuation = ContinuationFrame(self.stream_id)
+            continuation.data = block_view[offset:offset + MAX_FRAME_SIZE - 2]
+            offset += MAX_FRAME_SIZE - 2
+            frames.append(continuation)
+
+        # END_PUSH_PROMISE is the same bit as END_HEADERS.
+        frames[-1].flag_bits |= FLAG_END_HEADERS
+        for frame in frames:
+            self._conn._queue_frame(frame)
 
     @asyncio.coroutine
     def _send_headers(self, end_headers, end_stream, priority=DEFAULT_PRIORITY):
         """ Method used by response objects on the server side. """
-        logger.info('Sending headers to response')
+        # The block is always ended, in CONTINUATION frames if need be.
         headers = HeadersFrame(self.stream_id, priority=priority)
+        if end_stream:
+            headers.flag_bits |= FLAG_END_STREAM
 
         # Pending the API from Metehan.
-        headers.data = self._header_codec.encode_headers(self._response_headers)
-
-        if end_headers:
-            logger.info('Last header to be sent for stream: %s' % self.stream_id)
-            headers.flags.add(FrameFlag.END_HEADERS)
-        if end_stream:
-            logger.info('Last frame to be sent for stream: %s' % self.stream_id)
-            headers.flags.add(FrameFlag.END_STREAM)
+        header_block = self._encode_headers(self._response_headers)
 
-        logger.info('Sending last frame')
+        if TRACE_HEADERS_SENT.enabled:
+            TRACE_HEADERS_SENT.emit(stream_id=self.stream_id, length=len(header_block),
+                                    end_stream=end_stream)
         # Flow control?
-        yield from self._conn.write_frame(headers)
+        self._transition(HEADERS_SENT)
+        if end_stream:
+            self._transition(END_STREAM_SENT)
+        self._queue_header_block(headers, header_block)
 
     @asyncio.coroutine
-    def _consume_raw_headers(self):
-        logger.info('Getting all the headers on stream: %s' % self.stream_id)
-        raw_headers = bytearray()
-
-        while True:
-            # We should only be receiving headers frames at this point in the
-            # stream's life cycle. Either the client is attempting to consume a
-            # response, OR the server attempting to parse a request, and a
-            # possibly subsequent body of that request, in the case of a POST
-            # request.
-            logger.info('Blocking to get headers on stream: %s' % self.stream_id)
-            header_frame = yield from self._frame_queue.get()
-            logger.info('Stream got header frame: %s ' % self.stream_id)
-            raw_headers.extend(header_frame.data)
-
-            if FrameFlag.END_STREAM in header_frame.flags:
-                logger.info('Last frame on stream: %s' % self.stream_id)
-                self.state = StreamState.CLOSED
-
-            if FrameFlag.END_HEADERS in header_frame.flags:
-                logger.info('No more headers to be gat, breaking: %s' % self.stream_id)
-                break
-
-        logger.info('Done getting all raw headers for stream: %s' % self.stream_id)
-        return raw_headers
+    def _consume_headers(self):
+        """
+        Wait for the header block of the stream. The connection already
+        decoded it as it arrived, whether it came in one frame or several.
+        """
+        # We should only be receiving headers frames at this point in the
+        # stream's life cycle. Either the client is attempting to consume a
+        # response, OR the server attempting to parse a request, and a
+        # possibly subsequent body of that request, in the case of a POST
+        # request.
+        header_frame = yield from self._next_frame()
+        if header_frame.frame_type == FrameType.RST_STREAM:
+            raise StreamReset(header_frame.error_code)
+        if header_frame.headers is None:
+            raise HeaderListTooLarge()
+        return header_frame.headers
 
     @asyncio.coroutine
     def _promise_push(self, push_request_headers):
         logger.info('Trying to create new stream')
         promise_frame = PushPromise(self.stream_id)
         promise_frame.promised_stream_id = self._conn._get_next_stream_id()
-        promise_frame.data = self._header_codec.encode_headers(push_request_headers)
 
         # Create a new future to keep track of when the stream is 'ready' for
         # writing by the callee.
-        self._promised_streams[promise_frame.promised_stream_id] = asyncio.Future()
+        if self._promised_streams is None:
+            self._promised_streams = {}
+        promised_stream = self._promised_streams[promise_frame.promised_stream_id] = asyncio.Future()
 
-        yield from self._conn.write_frame(promise_frame)
+        self._queue_header_block(promise_frame, self._encode_headers(push_request_headers))
 
         # Return the newly created stream.
-        yield from self._promised_streams[promise_frame.promised_stream_id]
-        return self._promised_streams[promise_frame.promised_stream_id].result()
+        return (yield from promised_stream)
+
+    def _available_window(self):
+        """ Room for DATA on this stream, bounded by the connection's window. """
+        return min(self._outgoing_flow_control_window, self._conn._out_flow_control_window)
+
+    @asyncio.coroutine
+    def _wait_for_window(self):
+        """ Wait for a window update, on either the stream or the connection. """
+        if TRACE_FLOW_BLOCKED.enabled:
+            TRACE_FLOW_BLOCKED.emit(stream_id=self.stream_id,
+                                    stream_window=self._outgoing_flow_control_window,
+                                    connection_window=self._conn._out_flow_control_window)
+        stalled_at = self._conn._ev_loop.time()
+        self._window_waiter = asyncio.Future()
+        yield from self._window_waiter
+
+        stall_time = self._conn._ev_loop.time() - stalled_at
+        self.metrics.stall_time += stall_time
+        self._conn.metrics.flow_control_stall(stall_time)
+
+    @asyncio.coroutine
+    def _wait_for_credit(self):
+        """
+        Wait until at least one byte of DATA can be sent. Raises StreamReset
+        if the peer reset the stream in the meantime.
+        """
+        while self._available_window() <= 2 and self._reset_code is None:
+            yield from self._wait_for_window()
+        if self._reset_code is not None:
+            raise StreamReset(self._reset_code)
+
+    @asyncio.coroutine
+    def _send_body(self, body, end_stream):
+        """
+        Send a body, which is either bytes-like (or a str), an async iterable
+        of those, or a file object. Iterables and files are only pulled from
+        as the flow control windows make room, so a large body is never held
+        in memory as a whole.
+        """
+        if isinstance(body, (bytes, bytearray, memoryview, str)):
+            yield from self._send_data(body, end_stream)
+        elif hasattr(body, '__aiter__'):
+            yield from self._send_async_iterable(body, end_stream)
+        elif hasattr(body, 'read'):
+            yield from self._send_file(body, end_stream)
+        else:
+            raise TypeError('Unsupported body type: {}'.format(type(body).__name__))
+
+    @asyncio.coroutine
+    def _send_async_iterable(self, body, end_stream):
+        chunks = body.__aiter__()
+        while True:
+            # The next chunk is only asked for once there's room to send it.
+            yield from self._wait_for_credit()
+            try:
+                chunk = yield from chunks.__anext__()
+            except StopAsyncIteration:
+                break
+            if chunk:
+                yield from self._send_data(chunk, end_stream=False)
+
+        if end_stream:
+            yield from self._send_data(b'', end_stream=True)
+
+    @asyncio.coroutine
+    def _send_file(self, body, end_stream):
+        while True:
+            # Read no more than what can be sent right away, as a single frame.
+            yield from self._wait_for_credit()
+            if self.state == StreamState.CLOSED:
+                # Nobody is left to send the rest of the file to.
+                return
+            chunk = body.read(max(min(MAX_FRAME_SIZE, self._available_window()) - 2, 1))
+            # Files with a coroutine read(), like a StreamReader, work too.
+            if asyncio.iscoroutine(chunk) or isinstance(chunk, asyncio.Future):
+                chunk = yield from chunk
+            if not chunk:
+                break
+            yield from self._send_data(chunk, end_stream=False)
+
+        if end_stream:
+            yield from self._send_data(b'', end_stream=True)
 
-    # Call this using a task? In order for the window update wait to work?
     @asyncio.coroutine
     def _send_data(self, data, end_stream):
-        logger.info('Sending data on stream: %s' % self.stream_id)
-        logger.info('Data: %s' % data)
+        """
+        Send `data` as a series of DATA frames. The body is sliced up lazily,
+        each frame being as large as the max frame size and both flow control
+        windows allow, and queued up as soon as there's credit for it.
+        """
         # Need to handle padding also?
         # client case: post request
         # server case: sending back data for response
-        data_frame = DataFrame(self.stream_id)
-        data_frame.data = data if type(data) is bytes else data.encode('ascii')
-        if end_stream:
-            logger.info('DONE SENDING DATA FOR STREAM: %s' % self.stream_id)
-            data_frame.flags.add(FrameFlag.END_STREAM)
-
-        # Do the 'wait till have room to write' dance here.
-        while len(data_frame) > self._outgoing_flow_control_window:
-            logger.info('Waiting till we can send more data: %s' % stream_id)
-            yield from self._outgoing_window_update.wait()
-            logger.info('DONE waiting till we can send more data: %s' % stream_id)
-
-        # TODO(roasbeef): Either chop up the frames here, or do it on the
-        # PriorityQueueFrame level.
-        logger.info('SENDING FRAME ON STREAM: %s' % self.stream_id)
-        yield from self._conn.write_frame(data_frame)
-        self._outgoing_flow_control_window -= len(data_frame)
-
-        # Transition stream state
-        if end_stream:
-            self.state = (StreamState.HALF_CLOSED_LOCAL if self.state == StreamState.OPEN
-                          else StreamState.CLOSED)
+        # Any bytes-like object (bytearray, memoryview) is sent as is, the
+        # frames are views over it.
+        data_view = memoryview(data.encode('ascii') if isinstance(data, str) else data)
+        if data_view.ndim != 1 or data_view.itemsize != 1:
+            data_view = data_view.cast('B')
+
+        offset = 0
+        while True:
+            # Nothing more can be sent once the peer has reset the stream.
+            if self._reset_code is not None:
+                raise StreamReset(self._reset_code)
+            # The Pad High and Pad Low fields count against both the frame
+            # size and the windows.
+            chunk_size = min(len(data_view) - offset, MAX_FRAME_SIZE - 2,
+                             self._available_window() - 2)
+            if chunk_size < 0 or (chunk_size == 0 and offset < len(data_view)):
+                yield from self._wait_for_window()
+                continue
+
+            data_frame = DataFrame(self.stream_id)
+            data_frame.data = data_view[offset:offset + chunk_size]
+            offset += chunk_size
+
+            last_frame = offset == len(data_view)
+            if last_frame and end_stream:
+                data_frame.flag_bits |= FLAG_END_STREAM
+
+            # Take the credit now, so frames queued by other streams can't
+            # overdraw the connection window.
+            self._outgoing_flow_control_window -= len(data_frame)
+            self._conn._out_flow_control_window -= len(data_frame)
+
+            if TRACE_DATA_SENT.enabled:
+                TRACE_DATA_SENT.emit(stream_id=self.stream_id, length=chunk_size,
+                                     end_stream=data_frame.end_stream)
+            # Transition stream state
+            if data_frame.end_stream:
+                self._transition(END_STREAM_SENT)
+            yield from self._conn.write_frame(data_frame)
+
+            if last_frame:
+                break
+
+    def _data_consumed(self, size):
+        # Once the whole body has arrived only the connection needs its
+        # credit back, the stream won't be receiving any more.
+        if size:
+            self._conn.data_consumed(size, stream_id=0 if self._body_received else self.stream_id)
 
     @asyncio.coroutine
-    def _read_data(self, num_bytes=None):
-        logger.info('READING ALL THE DATA FOR STREAM: %s' % self.stream_id)
-        frame_data = bytearray()
+    def _next_data_chunk(self):
+        """
+        Next piece of the body, as a memoryview over the payload of a DATA
+        frame, or None once the body has been read. The flow control credit
+        for the data is only handed back by the caller, as it's consumed.
+        """
+        if self._read_buffer is not None:
+            chunk, self._read_buffer = self._read_buffer, None
+            return chunk
 
-        # Return nothing if the stream is 'closed'
-        if self.state == StreamState.CLOSED:
+        while True:
+            # Return nothing if the stream is 'closed', and everything
+            # received on it was already read.
+            if self._body_received or (
+                    self.state in (StreamState.HALF_CLOSED_REMOTE, StreamState.CLOSED) and
+                    self._frame_queue.empty()):
+                return None
+
+            frame = yield from self._next_frame()
+            if frame.frame_type == FrameType.RST_STREAM:
+                self._body_received = True
+                raise StreamReset(frame.error_code)
+            if TRACE_DATA_READ.enabled:
+                TRACE_DATA_READ.emit(stream_id=self.stream_id, length=frame.length,
+                                     end_stream=frame.end_stream)
+
+            # Last frame of the stream, we're done after this one. The state
+            # was already moved along as it was received.
+            self._body_received = frame.end_stream
+            if frame.frame_type != FrameType.DATA:
+                # Trailers aren't handed out.
+                continue
+
+            # Padding is consumed right away.
+            self._data_consumed(frame.length - len(frame.data))
+            if frame.data:
+                return frame.data
+
+    @asyncio.coroutine
+    def read(self, num_bytes=-1):
+        """
+        Read up to `num_bytes` of the body, or all of what's left of it if
+        `num_bytes` is negative. Returns as soon as there's any data, and
+        b'' once the end of the body is reached.
+        """
+        if num_bytes < 0:
+            return b''.join((yield from self._read_data_chunks()))
+
+        chunk = yield from self._next_data_chunk()
+        if chunk is None or num_bytes == 0:
+            # Not read after all.
+            self._read_buffer = chunk
             return b''
 
-        # TODO(roasbeef): Implement chunked reading via num_bytes
-        # TODO(roasbeef): Regulate incoming flow control also.
-        while num_bytes is None:
-            logger.info('reading some data on stream: %s' % self.stream_id)
-            frame = yield from self._frame_queue.get()
-            frame_data.extend(frame.data)
-
-            # assert isinstance(frame, DataFrame)
-
-            # Last frame of the stream, we're done here.
-            if FrameFlag.END_STREAM in frame.flags:
-                self.state = (
-                        StreamState.HALF_CLOSED_REMOTE if self.state == StreamState.OPEN
-                        else StreamState.CLOSED
-                )
-                logger.info('last bit of data sent read on stream: %s' % self.stream_id)
-                break
+        if len(chunk) > num_bytes:
+            chunk, self._read_buffer = chunk[:num_bytes], chunk[num_bytes:]
+        self._data_consumed(len(chunk))
+        return bytes(chunk)
 
-            # Only send a flow control update if we actually received data.
-            if len(frame):
-                logger.info('Read off a frame, sending the flow control update for it: %s' % frame)
-                yield from self._conn.update_incoming_flow_control(increment=len(frame),
-                                                                   stream_id=self.stream_id)
+    def iter_chunks(self):
+        """
+        The body as it arrives, for `async for`. Each chunk is a memoryview
+        over a received DATA frame.
+        """
+        return DataChunkIterator(self)
 
+    @asyncio.coroutine
+    def _read_data(self, num_bytes=None):
+        return (yield from self.read(-1 if num_bytes is None else num_bytes))
 
-        logger.info('data read: %s' % frame_data)
-        return frame_data
+    @asyncio.coroutine
+    def _read_data_chunks(self):
+        """
+        Read the rest of the body of the stream, returning a list of
+        memoryviews over the payloads of the received DATA frames. The chunks
+        are never copied or joined here, that's left to the caller.
+        """
+        data_chunks = []
+        while True:
+            chunk = yield from self._next_data_chunk()
+            if chunk is None:
+                return data_chunks
+            self._data_consumed(len(chunk))
+            data_chunks.append(chunk)
+
+    @asyncio.coroutine
+    def _discard_body(self):
+        """
+        Hand back the credit for whatever is left of the body, without
+        waiting for any more of it to arrive.
+        """
+        if self._read_buffer is not None:
+            self._data_consumed(len(self._read_buffer))
+            self._read_buffer = None
+        while not self._frame_queue.empty():
+            chunk = yield from self._next_data_chunk()
+            if chunk is None:
+                break
+            self._data_consumed(len(chunk))
 
 
     # Maybe should also create a BaseClass? But just override a few methods?
     @asyncio.coroutine
     def consume_request(self):
-        logger.info('Server consuming request, stream id: %s' % self.stream_id)
-        encoded_headers = yield from self._consume_raw_headers()
-        self.state = StreamState.OPEN
-        self._request_headers = self._header_codec.decode_headers(encoded_headers)
-        logger.info('Got these headers: %s, on stream %s' % (self._request_headers, self.stream_id))
+        logger.info('Server consuming request, stream id: %s', self.stream_id)
+        try:
+            self._request_headers = yield from self._consume_headers()
+        except HeaderListTooLarge:
+            # Request Header Fields Too Large.
+            self._response_headers[':status'] = '431'
+            yield from self._send_headers(end_headers=True, end_stream=True)
+            return
+        if TRACE_HEADERS_RECEIVED.enabled:
+            TRACE_HEADERS_RECEIVED.emit(stream_id=self.stream_id, headers=self._request_headers)
 
         # For now, we'll only deal with POST and GET requests...
         if self._request_headers[':method'] not in ('POST', 'GET'):
@@ -229,31 +593,38 @@ class Stream(object):
             # with multiple values?
             self._response_headers['allow'] = "GET, POST"
             # TODO(roasbeef): Should I do away with the partition of headers?
-            self._send_headers(end_headers=True, end_stream=True, is_request=False)
-
-            self.state = StreamState.CLOSED
+            yield from self._send_headers(end_headers=True, end_stream=True)
             return
 
-        # Possibly some request body.
-        if self._request_headers[':method'] == 'POST':
-            # TODO(roasbeef): Need to look at the content-type and handle accodingly
-            post_data = yield from self._read_data()
-        else:
-            post_data = None
+        # The request body, if any, is left for the handler to read, as it
+        # goes.
+        logger.info('Dispatching response for stream, %s', self.stream_id)
+        yield from self._conn.dispatch_response(request_stream=self)
 
-        logger.info('Dispatching response for stream, %s' % self.stream_id)
-        yield from self._conn.dispatch_response(request_stream=self, req_body=post_data)
+        yield from self._discard_body()
+        if self.state == StreamState.HALF_CLOSED_LOCAL:
+            # The response is complete, but the client is still sending its
+            # request body. Let it know nobody is going to read it, once the
+            # response has made it out.
+            self._conn._queue_frame(RstStreamFrame(self.stream_id, error_code=ErrorCode.NO_ERROR),
+                                    behind_stream=True)
+            self._close()
 
     @asyncio.coroutine
     def consume_response(self):
         # Wait till we have all the header block fragments and or continutation
         # frames
-        logger.info('Client is consuming responsef for stream, %s' % self.stream_id)
-        raw_headers = yield from self._consume_raw_headers()
-        self.state = StreamState.OPEN
-
-        response_headers = self._header_codec.decode_headers(raw_headers)
-        logger.info('Got these headers: %s , for stream %s' % (response_headers, self.stream_id))
+        logger.info('Client is consuming responsef for stream, %s', self.stream_id)
+        try:
+            response_headers = yield from self._consume_headers()
+        except HeaderListTooLarge:
+            # Nobody is going to read the rest of the response.
+            self._conn._queue_frame(RstStreamFrame(self.stream_id, error_code=ErrorCode.CANCEL))
+            self._close()
+            raise
+
+        if TRACE_HEADERS_RECEIVED.enabled:
+            TRACE_HEADERS_RECEIVED.emit(stream_id=self.stream_id, headers=response_headers)
 
         # Since we have the headers, we can return a response to the client,
         # the body of the response might still be on the way.
@@ -264,29 +635,30 @@ class Stream(object):
 
     @asyncio.coroutine
     def open_request(self, body=None, end_stream=True):
-        encoded_request_headers = self._header_codec.encode_headers(self._request_headers)
-        logger.info('Sending headers for request, and stream: %s %s' % (self._request_headers, self.stream_id))
+        encoded_request_headers = self._encode_headers(self._request_headers)
 
-        # TODO(roasbeef): Need to handle chunked sending of headers via
-        # CONTINUTATION frames.
         headers = HeadersFrame(self.stream_id)
-        headers.data = encoded_request_headers
-
-        # Since we're not supporting CONTINUATION frames for now, signal the
-        # end of HEADERS on this stream.
-        headers.flags.add(FrameFlag.END_HEADERS)
-
         if end_stream and body is None:
-            headers.flags.add(FrameFlag.END_STREAM)
-
-        # Send off the headers frame
-        logger.info('Sending headers frame for stream: %s' % self.stream_id)
-        yield from self._conn.write_frame(headers)
+            headers.flag_bits |= FLAG_END_STREAM
+
+        # Send off the headers frame, continued in CONTINUATION frames if the
+        # block doesn't fit in one.
+        if TRACE_HEADERS_SENT.enabled:
+            TRACE_HEADERS_SENT.emit(stream_id=self.stream_id, length=len(encoded_request_headers),
+                                    end_stream=headers.end_stream)
+        self._transition(HEADERS_SENT)
+        # If we're done sending data, then close off the stream locally.
+        if headers.end_stream:
+            self._transition(END_STREAM_SENT)
+        self._queue_header_block(headers, encoded_request_headers)
 
         # Possibly send over a POST body.
         if body is not None:
-            self._send_data(body, end_stream)
-
-
-        # If we're done sending data, then close off the stream locally.
-        self.state = StreamState.HALF_CLOSED_LOCAL if end_stream else StreamState.OPEN
+            try:
+                yield from self._send_body(body, end_stream)
+            except StreamReset as e:
+                # The server has sent a complete response without reading all
+                # of the body, and doesn't want the rest. The response can
+                # still be read.
+                if e.error_code != ErrorCode.NO_ERROR:
+                    raise
@@ -0,0 +1,123 @@
+"""
+Structured tracing for the connection hot paths.
+
+Code declares named trace points up front, and guards each use of one on its
+`enabled` attribute:
+
+    FRAME_RECEIVED = trace_point('frame.received')
+    ...
+    if FRAME_RECEIVED.enabled:
+        FRAME_RECEIVED.emit(stream_id=frame.stream_id, length=frame.length)
+
+With no sink attached that's a single attribute check, nothing is formatted
+or allocated. Emitted fields are captured as is, and only turned into text
+by a sink that needs it, like `JSONLinesSink`.
+"""
+import collections
+import json
+import time
+
+# Every trace point by name, and the attached sinks along with the names (or
+# name prefixes ending in '.') they're interested in. None is all of them.
+_trace_points = {}
+_sinks = []
+
+
+class TracePoint(object):
+    __slots__ = ('name', 'enabled', '_sinks')
+
+    def __init__(self, name):
+        self.name = name
+        self.enabled = False
+        self._sinks = ()
+
+    def __repr__(self):
+        return '<TracePoint {} enabled: {}>'.format(self.name, self.enabled)
+
+    def emit(self, **fields):
+        timestamp = time.time()
+        for sink in self._sinks:
+            sink.record(timestamp, self.name, fields)
+
+
+def _matches(name, names):
+    if names is None:
+        return True
+    return any(name == pattern or (pattern.endswith('.') and name.startswith(pattern))
+               for pattern in names)
+
+
+def _refresh(point):
+    point._sinks = tuple(sink for sink, names in _sinks if _matches(point.name, names))
+    point.enabled = bool(point._sinks)
+
+
+def trace_point(name):
+    """ Return the trace point called `name`, creating it on first use. """
+    point = _trace_points.get(name)
+    if point is None:
+        point = _trace_points[name] = TracePoint(name)
+        _refresh(point)
+    return point
+
+
+def add_sink(sink, names=None):
+    """
+    Start sending events to `sink`. If `names` is given, only the trace
+    points listed are enabled for it, a name ending in '.' enables every
+    point under that prefix.
+    """
+    _sinks.append((sink, frozenset(names) if names is not None else None))
+    for point in _trace_points.values():
+        _refresh(point)
+    return sink
+
+
+def remove_sink(sink):
+    _sinks[:] = [(attached, names) for attached, names in _sinks if attached is not sink]
+    for point in _trace_points.values():
+        _refresh(point)
+
+
+class RingBufferSink(object):
+    """ Keeps the last `capacity` events in memory, as they were emitted. """
+
+    def __init__(self, capacity=4096):
+        self._events = collections.deque(maxlen=capacity)
+
+    def __len__(self):
+        return len(self._events)
+
+    def record(self, timestamp, name, fields):
+        self._events.append((timestamp, name, fields))
+
+    def events(self, name=None):
+        """ The buffered events as dicts, optionally only those called `name`. """
+        return [dict(fields, ts=timestamp, event=event_name)
+                for timestamp, event_name, fields in self._events
+                if name is None or event_name == name]
+
+    def clear(self):
+        self._events.clear()
+
+
+class JSONLinesSink(object):
+    """
+    Writes each event as a line of JSON to `file`, either a path or an open
+    text file. Values JSON can't represent are written as their repr.
+    """
+
+    def __init__(self, file):
+        self._owns_file = isinstance(file, str)
+        self._file = open(file, 'a') if self._owns_file else file
+
+    def record(self, timestamp, name, fields):
+        self._file.write(json.dumps(dict(fields, ts=timestamp, event=name), default=repr))
+        self._file.write('\n')
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if self._owns_file:
+            self._file.close()
@@ -0,0 +1,44 @@
+import asyncio
+
+
+class FakeTransport(asyncio.Transport):
+    """ Keeps whatever is written to it, all of it in `written`, and every write apart in `writes`. """
+
+    def __init__(self):
+        super().__init__()
+        self.writes = []
+        self.written = bytearray()
+        self.buffer_size = 0
+        self.closed = False
+        self.reading = True
+
+    def write(self, data):
+        self.writes.append(bytes(data))
+        self.written.extend(data)
+
+    def writelines(self, list_of_data):
+        self.write(b''.join(list_of_data))
+
+    def write_eof(self):
+        pass
+
+    def can_write_eof(self):
+        return True
+
+    def get_write_buffer_size(self):
+        return self.buffer_size
+
+    def close(self):
+        self.closed = True
+
+    def is_closing(self):
+        return self.closed
+
+    def pause_reading(self):
+        self.reading = False
+
+    def resume_reading(self):
+        self.reading = True
+
+    def get_extra_info(self, name, default=None):
+        return default
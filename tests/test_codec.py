@@ -0,0 +1,128 @@
+import unittest
+import struct
+
+from satori.codec import (unpack_header, pack_header, decode_frame, frame_class,
+                          FRAME_DISPATCH, FRAME_HEADER_LENGTH, FrameEncoder)
+from satori.frame import (FrameType, FrameFlag, DataFrame, SettingsFrame,
+                          WindowUpdateFrame, ConnectionSetting, ProtocolError,
+                          PingFrame)
+
+from tests.support import FakeTransport
+
+
+class TestHeaderCodec(unittest.TestCase):
+
+    def test_unpack_header_at_offset(self):
+        header_bytes = b'junk' + b'\xc0\x08\x00\x01\x80\x00\x00\x01'
+        length, raw_type, raw_flags, stream_id = unpack_header(header_bytes, 4)
+
+        # Reserved bits of both the length and stream id are knocked off.
+        self.assertEqual(8, length)
+        self.assertEqual(FrameType.DATA.value, raw_type)
+        self.assertEqual(FrameFlag.END_STREAM.value, raw_flags)
+        self.assertEqual(1, stream_id)
+
+    def test_pack_header(self):
+        self.assertEqual(b'\x00\x08\x00\x01\x00\x00\x00\x01',
+                         pack_header(8, FrameType.DATA.value, 1, 1))
+
+
+class TestFrameDispatch(unittest.TestCase):
+
+    def test_all_frame_types_registered(self):
+        for frame_type in FrameType:
+            self.assertIs(frame_type, FRAME_DISPATCH[frame_type.value].frame_type)
+
+    def test_unknown_frame_type(self):
+        self.assertRaises(ProtocolError, frame_class, 0xFF)
+
+    def test_decode_consecutive_frames(self):
+        buf = (SettingsFrame(settings={ConnectionSetting.ENABLE_PUSH: 0}).serialize() +
+               WindowUpdateFrame(3, window_size_increment=100).serialize())
+
+        settings, offset = decode_frame(buf)
+        self.assertIsInstance(settings, SettingsFrame)
+        self.assertEqual({ConnectionSetting.ENABLE_PUSH: 0}, settings.settings)
+        self.assertEqual(FRAME_HEADER_LENGTH + 5, offset)
+
+        window_update, offset = decode_frame(buf, offset)
+        self.assertIsInstance(window_update, WindowUpdateFrame)
+        self.assertEqual(3, window_update.stream_id)
+        self.assertEqual(100, window_update.window_size_increment)
+        self.assertEqual(len(buf), offset)
+
+    def test_decode_data_frame(self):
+        buf = struct.pack('!HBBL', 7, 0, FrameFlag.END_STREAM.value, 5) + b'\x00\x00hello'
+        frame, offset = decode_frame(buf)
+
+        self.assertIsInstance(frame, DataFrame)
+        self.assertEqual(b'hello', frame.data)
+        self.assertIn(FrameFlag.END_STREAM, frame.flags)
+
+
+class TestFrameEncoder(unittest.TestCase):
+
+    def setUp(self):
+        self.transport = FakeTransport()
+
+    def test_batches_frames_into_single_write(self):
+        encoder = FrameEncoder(initial_size=8)
+        frames = [WindowUpdateFrame(1, window_size_increment=10), PingFrame(),
+                  SettingsFrame(flags=FrameFlag.END_STREAM.value)]
+        frames[1].opaque_data = b'12345678'
+        for frame in frames:
+            encoder.encode(frame)
+        self.assertEqual(3, len(encoder))
+
+        encoder.flush(self.transport)
+        self.assertEqual([b''.join(frame.serialize() for frame in frames)], self.transport.writes)
+        self.assertEqual(0, len(encoder))
+        self.assertEqual(3, encoder.last_flush_frames)
+
+    def test_large_payloads_not_copied(self):
+        encoder = FrameEncoder(copy_threshold=16)
+        data_frame = DataFrame(1)
+        data_frame.data = b'x' * 32
+        encoder.encode(data_frame)
+        encoder.encode(WindowUpdateFrame(0, window_size_increment=32))
+
+        # The payload went in as a view, between two regions of the buffer.
+        self.assertIs(data_frame.data, encoder._segments[1].obj)
+        encoder.flush(self.transport)
+        self.assertEqual(data_frame.serialize() + WindowUpdateFrame(0, window_size_increment=32).serialize(),
+                         self.transport.writes[0])
+
+    def test_buffer_reused_between_flushes(self):
+        encoder = FrameEncoder()
+        output_buffer = encoder._buffer
+        encoder.encode(PingFrame())
+        encoder.flush(self.transport)
+        self.assertIs(output_buffer, encoder._buffer)
+
+        # Still queued in the transport, so a fresh buffer has to be used.
+        self.transport.buffer_size = 10
+        encoder.encode(PingFrame())
+        encoder.flush(self.transport)
+        self.assertIsNot(output_buffer, encoder._buffer)
+        self.assertEqual(1.0, encoder.frames_per_flush)
+
+    def test_byte_counters(self):
+        encoder = FrameEncoder()
+        ping = PingFrame()
+        ping.opaque_data = b'12345678'
+        encoder.encode(ping)
+        encoder.encode(WindowUpdateFrame(0, window_size_increment=1))
+        self.assertEqual(16 + 12, encoder.pending_bytes)
+
+        encoder.flush(self.transport)
+        self.assertEqual(0, encoder.pending_bytes)
+        self.assertEqual(28, encoder.last_flush_bytes)
+        self.assertEqual(len(self.transport.writes[0]), encoder.bytes_flushed)
+
+        encoder.encode(ping)
+        encoder.flush(self.transport)
+        self.assertEqual(22.0, encoder.bytes_per_flush)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+
+from satori.flow import ReceiveWindow
+from satori.exceptions import FlowControlError
+
+
+class TestReceiveWindow(unittest.TestCase):
+
+    def test_updates_batched_until_threshold(self):
+        window = ReceiveWindow(initial_size=1000, update_threshold=0.5)
+        for _ in range(4):
+            window.data_received(100)
+            self.assertEqual(0, window.data_consumed(100))
+
+        window.data_received(100)
+        self.assertEqual(500, window.data_consumed(100))
+        self.assertEqual(1000, window.available)
+
+    def test_unconsumed_data_not_credited(self):
+        window = ReceiveWindow(initial_size=1000)
+        window.data_received(800)
+        self.assertEqual(0, window.data_consumed(300))
+        self.assertEqual(500, window.data_consumed(200))
+        self.assertEqual(700, window.available)
+
+    def test_overflow(self):
+        window = ReceiveWindow(initial_size=100)
+        window.data_received(100)
+        self.assertRaises(FlowControlError, window.data_received, 1)
+
+    def test_grows_to_bandwidth_delay_product(self):
+        window = ReceiveWindow(initial_size=1000, max_size=5000)
+        window.start_sample()
+        window.data_received(900)
+        window.data_consumed(900)
+        window.end_sample(0.1)
+
+        self.assertEqual(1800, window.size)
+        self.assertEqual(9000.0, window.consumption_rate)
+        # The growth is advertised by the very next update.
+        self.assertEqual(800, window.window_update())
+        self.assertEqual(1800, window.available)
+
+    def test_growth_capped(self):
+        window = ReceiveWindow(initial_size=1000, max_size=1500)
+        window.start_sample()
+        window.data_received(1000)
+        window.data_consumed(1000)
+        window.end_sample(0.1)
+        self.assertEqual(1500, window.size)
+
+    def test_slow_reader_doesnt_grow(self):
+        window = ReceiveWindow(initial_size=1000)
+        window.start_sample()
+        window.data_received(1000)
+        window.data_consumed(100)
+        window.end_sample(0.1)
+        self.assertEqual(1000, window.size)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -58,6 +58,68 @@ class TestFrame(unittest.TestCase):
         frame.parse_flags(FrameFlag.PAD_LOW.value | FrameFlag.PAD_HIGH.value | FrameFlag.END_STREAM.value)
         self.assertEqual(set(), frame.flags)
 
+    def test_parse_flags_drops_undefined_bits(self):
+        frame = DataFrame(stream_id=2)
+        frame.parse_flags(FrameFlag.END_STREAM.value | FrameFlag.END_HEADERS.value)
+        self.assertEqual(FrameFlag.END_STREAM.value, frame.flag_bits)
+        self.assertTrue(frame.end_stream)
+        self.assertFalse(frame.end_headers)
+
+    def test_flags_as_bitmask(self):
+        frame = HeadersFrame(stream_id=2, flags=FrameFlag.END_HEADERS.value)
+        frame.set_flag(FrameFlag.END_STREAM)
+        self.assertEqual({FrameFlag.END_HEADERS, FrameFlag.END_STREAM}, frame.flags)
+        frame.clear_flag(FrameFlag.END_HEADERS)
+        self.assertEqual(FrameFlag.END_STREAM.value, frame.flag_bits)
+
+    def test_flags_read_only(self):
+        frame = DataFrame(stream_id=2)
+        # The flags are only a view of the bitmask, changing them would do
+        # nothing.
+        with self.assertRaises(AttributeError):
+            frame.flags.add(FrameFlag.END_STREAM)
+
+    def test_frames_have_no_dict(self):
+        self.assertFalse(hasattr(HeadersFrame(stream_id=2), '__dict__'))
+
+
+class TestLazyFrame(unittest.TestCase):
+    def setUp(self):
+        self.payload = struct.pack('!BBL', 0, 0, 1000) + b'lazy headers'
+        self.flags = FrameFlag.PRIORITY.value | FrameFlag.END_HEADERS.value
+
+    def test_header_fields_without_decoding(self):
+        frame = Frame.lazy_from_raw(FrameType.HEADERS.value, self.flags, 3, self.payload)
+
+        self.assertIsInstance(frame, HeadersFrame)
+        self.assertEqual(3, frame.stream_id)
+        self.assertEqual(FrameType.HEADERS, frame.frame_type)
+        self.assertTrue(frame.end_headers)
+        self.assertEqual(len(self.payload), frame.length)
+        self.assertFalse(frame.is_decoded)
+
+    def test_payload_decoded_on_access(self):
+        frame = Frame.lazy_from_raw(FrameType.HEADERS.value, self.flags, 3, self.payload)
+
+        self.assertEqual(b'lazy headers', frame.data)
+        self.assertTrue(frame.is_decoded)
+        self.assertEqual(1000, frame.priority)
+        self.assertEqual(self.flags, frame.flag_bits)
+
+    def test_decode_errors_raised_on_access(self):
+        frame = Frame.lazy_from_raw(FrameType.PING.value, 0, 0, b'short')
+        self.assertRaises(FrameSizeError, getattr, frame, 'opaque_data')
+
+    def test_stream_id_checked_eagerly(self):
+        for frame_type, stream_id in ((FrameType.DATA, 0), (FrameType.HEADERS, 0),
+                                      (FrameType.RST_STREAM, 0), (FrameType.SETTINGS, 5),
+                                      (FrameType.PING, 3), (FrameType.GO_AWAY, 1)):
+            with self.assertRaises(ProtocolError):
+                Frame.lazy_from_raw(frame_type.value, 0, stream_id, b'')
+        # WINDOW_UPDATE is valid on both.
+        Frame.lazy_from_raw(FrameType.WINDOW_UPDATE.value, 0, 0, b'')
+        Frame.lazy_from_raw(FrameType.WINDOW_UPDATE.value, 0, 1, b'')
+
 
 class TestDataFrame(unittest.TestCase):
     def setUp(self):
@@ -87,6 +149,13 @@ class TestDataFrame(unittest.TestCase):
         data_frame.deserialize(self.payload_with_both_padding)
         self.assertEqual(data_frame.data, b'both padding')
 
+    def test_deserialize_is_zero_copy(self):
+        data_frame = DataFrame(stream_id=1, flags={FrameFlag.PAD_LOW})
+        data_frame.deserialize(self.payload_with_low_padding)
+
+        self.assertIsInstance(data_frame.data, memoryview)
+        self.assertIs(data_frame.data.obj, self.payload_with_low_padding)
+
     def test_deserialize_total_padding_incorrect(self):
         data_frame = DataFrame(stream_id=1, flags={FrameFlag.PAD_HIGH, FrameFlag.PAD_LOW})
         self.assertRaises(ProtocolError, data_frame.deserialize, self.payload_incorrect_padding_value)
@@ -105,6 +174,16 @@ class TestDataFrame(unittest.TestCase):
         frame_bytes = data_frame.serialize(pad_low=1)
         self.assertEqual(b'\x00\x14\x00\x00\x00\x00\x00\x01\x00\x01look ma no padding\x00', frame_bytes)
 
+    def test_serialize_parts_does_not_copy_data(self):
+        data_frame = DataFrame(stream_id=1)
+        data_frame.data = bytearray(b'look ma no copies')
+
+        header_bytes, data, padding = data_frame.serialize_parts()
+        self.assertEqual(b'\x00\x13\x00\x00\x00\x00\x00\x01\x00\x00', header_bytes)
+        self.assertIs(data.obj, data_frame.data)
+        self.assertEqual(b'', padding)
+        self.assertEqual(header_bytes + data + padding, data_frame.serialize())
+
 
 class TestHeadersFrame(unittest.TestCase):
     # TODO(roasbeef): Also add padding tests? Or redundant since inherited from
@@ -0,0 +1,117 @@
+import asyncio
+import unittest
+
+from satori.metrics import ConnectionMetrics, StreamMetrics, prometheus_text, headers_size
+from satori.protocol import HTTP2CommonProtocol
+from satori.frame import DataFrame, HeadersFrame, WindowUpdateFrame, FLAG_END_STREAM
+
+
+def data_frame(stream_id, size, end_stream=False):
+    frame = DataFrame(stream_id, flags=FLAG_END_STREAM if end_stream else 0)
+    frame.data = b'x' * size
+    frame.length = len(frame)
+    return frame
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestStreamMetrics(unittest.TestCase):
+
+    def test_client_time_to_first_and_last_byte(self):
+        clock = FakeClock()
+        metrics = StreamMetrics(opened_at=0.0, response_inbound=True)
+
+        # Frames we send don't count towards the response.
+        metrics.frame_sent(HeadersFrame(1), clock)
+        clock.now = 1.0
+        metrics.frame_received(WindowUpdateFrame(1, window_size_increment=1), clock)
+        clock.now = 2.0
+        metrics.frame_received(data_frame(1, 10), clock)
+        clock.now = 5.0
+        metrics.frame_received(data_frame(1, 10, end_stream=True), clock)
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(2.0, snapshot['time_to_first_byte'])
+        self.assertEqual(5.0, snapshot['time_to_last_byte'])
+        self.assertEqual(3, snapshot['frames_in'])
+        self.assertEqual(1, snapshot['frames_out'])
+
+    def test_server_response_is_outbound(self):
+        clock = FakeClock()
+        metrics = StreamMetrics(opened_at=1.0, response_inbound=False)
+        metrics.frame_received(data_frame(1, 10, end_stream=True), clock)
+        self.assertIsNone(metrics.snapshot()['time_to_first_byte'])
+
+        clock.now = 1.5
+        metrics.frame_sent(data_frame(1, 10, end_stream=True), clock)
+        self.assertEqual(0.5, metrics.snapshot()['time_to_last_byte'])
+
+
+class TestConnectionMetrics(unittest.TestCase):
+
+    def test_counts_by_frame_type(self):
+        metrics = ConnectionMetrics()
+        metrics.frame_received(data_frame(1, 10))
+        metrics.frame_received(data_frame(1, 20))
+        metrics.frame_sent(WindowUpdateFrame(0, window_size_increment=1))
+
+        snapshot = metrics.snapshot()
+        self.assertEqual({'DATA': 2}, snapshot['frames_in'])
+        self.assertEqual({'DATA': 2 * 8 + 34}, snapshot['bytes_in'])
+        self.assertEqual({'WINDOW_UPDATE': 12}, snapshot['bytes_out'])
+
+    def test_hpack_ratio(self):
+        metrics = ConnectionMetrics()
+        self.assertIsNone(metrics.snapshot()['hpack_compression_ratio'])
+
+        headers = {':status': '200', 'content-type': 'text/html'}
+        self.assertEqual(31, headers_size(headers))
+        metrics.headers_encoded(headers_size(headers), 10)
+        metrics.headers_decoded(29, 10)
+        self.assertEqual(3.0, metrics.snapshot()['hpack_compression_ratio'])
+
+
+class TestConnectionSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.conn = HTTP2CommonProtocol(is_client=True, loop=self.loop)
+
+    def tearDown(self):
+        self.conn._reader_task.cancel()
+        self.conn._writer_task.cancel()
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def test_snapshot_and_prometheus_text(self):
+        self.conn._new_stream(stream_id=3)
+        self.conn._dispatch_frame(data_frame(3, 100))
+        self.conn._dispatch_frame(data_frame(3, 100, end_stream=True))
+
+        snapshot = self.conn.metrics_snapshot()
+        self.assertEqual({'DATA': 2}, snapshot['frames_in'])
+        self.assertEqual(2, snapshot['streams'][3]['queue_depth'])
+        self.assertIsNotNone(snapshot['streams'][3]['time_to_last_byte'])
+        # The RTT sampling PING is waiting to be written.
+        self.assertEqual(1, snapshot['outgoing_queue_depth'])
+        # Dispatched right away, nothing is left waiting.
+        self.assertEqual(0, snapshot['inbound_queue_depth'])
+
+        text = prometheus_text(snapshot, labels={'peer': 'a"b'})
+        self.assertIn('# TYPE satori_frames_in_total counter\n', text)
+        self.assertIn('satori_frames_in_total{peer="a\\"b",type="DATA"} 2\n', text)
+        self.assertIn('satori_stream_queue_depth{peer="a\\"b",stream="3"} 2\n', text)
+        self.assertIn('satori_inbound_queue_depth{peer="a\\"b"} 0\n', text)
+        self.assertNotIn('hpack_compression_ratio{', text)
+
+
+if __name__ == "__main__":
+    unittest.main()
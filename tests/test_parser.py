@@ -0,0 +1,188 @@
+import unittest
+
+from satori.parser import FrameBuffer, PriorityFrameQueue, InboundFrameScheduler
+from satori.frame import DataFrame, WindowUpdateFrame, FrameFlag
+
+
+def data_frame(stream_id, data, end_stream=False):
+    frame = DataFrame(stream_id, flags=(FrameFlag.END_STREAM.value if end_stream else 0))
+    frame.data = data
+    return frame
+
+
+class TestFrameBuffer(unittest.TestCase):
+
+    def setUp(self):
+        self.frames = [data_frame(1, b'first'),
+                       WindowUpdateFrame(0, window_size_increment=100),
+                       data_frame(3, b'x' * 300, end_stream=True)]
+        self.wire_bytes = b''.join(frame.serialize() for frame in self.frames)
+
+    def test_many_frames_from_one_chunk(self):
+        frame_buffer = FrameBuffer()
+        frames = list(frame_buffer.feed(self.wire_bytes))
+
+        self.assertEqual([DataFrame, WindowUpdateFrame, DataFrame], [type(frame) for frame in frames])
+        self.assertEqual(b'first', frames[0].data)
+        self.assertEqual(100, frames[1].window_size_increment)
+        self.assertEqual(b'x' * 300, frames[2].data)
+        self.assertTrue(frames[2].end_stream)
+        self.assertEqual(0, len(frame_buffer))
+
+    def test_frames_split_across_chunks(self):
+        frame_buffer = FrameBuffer()
+        frames = []
+        # Worst case, a byte at a time.
+        for i in range(len(self.wire_bytes)):
+            frames.extend(frame_buffer.feed(self.wire_bytes[i:i + 1]))
+
+        self.assertEqual(3, len(frames))
+        self.assertEqual(b'first', frames[0].data)
+        self.assertEqual(b'x' * 300, frames[2].data)
+
+    def test_partial_frame_held(self):
+        frame_buffer = FrameBuffer()
+        frames = list(frame_buffer.feed(self.wire_bytes[:-10]))
+
+        self.assertEqual(2, len(frames))
+        self.assertEqual(len(self.frames[2].serialize()) - 10, len(frame_buffer))
+
+        frames = list(frame_buffer.feed(self.wire_bytes[-10:]))
+        self.assertEqual(1, len(frames))
+        self.assertEqual(3, frames[0].stream_id)
+
+    def test_payloads_are_views_of_the_chunk(self):
+        frame_buffer = FrameBuffer()
+        frames = list(frame_buffer.feed(self.wire_bytes))
+
+        self.assertIs(self.wire_bytes, frames[0].data.obj)
+
+    def test_only_straddling_frame_copied(self):
+        frame_buffer = FrameBuffer()
+        first_length = len(self.frames[0].serialize())
+        list(frame_buffer.feed(self.wire_bytes[:first_length - 2]))
+
+        chunk = self.wire_bytes[first_length - 2:]
+        frames = list(frame_buffer.feed(chunk))
+        self.assertEqual(3, len(frames))
+        self.assertEqual(b'first', frames[0].data)
+        # The frame after it is still a view of the chunk it arrived in.
+        self.assertEqual(b'x' * 300, frames[2].data)
+        self.assertIs(chunk, frames[2].data.obj)
+        self.assertEqual(0, len(frame_buffer))
+
+
+class TestPriorityFrameQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.queue = PriorityFrameQueue(compact_threshold=2)
+
+    def drain(self):
+        frames = []
+        while self.queue:
+            frames.append(self.queue.pop_frame())
+        return frames
+
+    def test_lowest_priority_number_first(self):
+        low, high = data_frame(1, b'low'), data_frame(3, b'high')
+        self.queue.push_frame(low, 100)
+        self.queue.push_frame(high, 1)
+
+        self.assertIs(high, self.queue.peek_frame())
+        self.assertEqual([high, low], self.drain())
+
+    def test_stream_order_preserved(self):
+        frames = [data_frame(1, b'a'), data_frame(1, b'b'), data_frame(1, b'c')]
+        for frame in frames:
+            self.queue.push_frame(frame, 10)
+        self.assertEqual(frames, self.drain())
+
+    def test_ties_broken_by_arrival(self):
+        first, second = data_frame(5, b'a'), data_frame(3, b'b')
+        self.queue.push_frame(first, 10)
+        self.queue.push_frame(second, 10)
+        self.assertEqual([first, second], self.drain())
+
+    def test_reprioritize_queued_frames(self):
+        bulk = [data_frame(1, b'bulk'), data_frame(1, b'more bulk')]
+        interactive = data_frame(3, b'interactive')
+        for frame in bulk:
+            self.queue.push_frame(frame, 1)
+        self.queue.push_frame(interactive, 50)
+
+        self.queue.reprioritize_stream(1, 100)
+        self.assertEqual([interactive] + bulk, self.drain())
+
+    def test_delete_frame(self):
+        frames = [data_frame(1, b'a'), data_frame(3, b'b'), data_frame(5, b'c')]
+        for priority, frame in enumerate(frames):
+            self.queue.push_frame(frame, priority)
+
+        self.queue.delete_frame(frames[0])
+        self.queue.delete_stream(5)
+        self.assertEqual(1, len(self.queue))
+        self.assertEqual([frames[1]], self.drain())
+        self.assertIsNone(self.queue.pop_frame())
+
+    def test_compaction(self):
+        for stream_id in range(1, 21, 2):
+            self.queue.push_frame(data_frame(stream_id, b'x'), 100 - stream_id)
+        for stream_id in range(3, 21, 2):
+            self.queue.reprioritize_stream(stream_id, 1000)
+
+        self.assertLessEqual(len(self.queue._stream_heap), 15)
+        self.assertEqual([1] + list(range(3, 21, 2)), [frame.stream_id for frame in self.drain()])
+
+
+class TestInboundFrameScheduler(unittest.TestCase):
+
+    def setUp(self):
+        # Stream 1 is a bulk upload, stream 3 is interactive.
+        self.priorities = {0: -1, 1: 100, 3: 1}
+
+    def scheduler(self, depth=64):
+        return InboundFrameScheduler(lambda frame: self.priorities[frame.stream_id], depth=depth)
+
+    def drain(self, scheduler):
+        frames = []
+        while scheduler:
+            frames.append(scheduler.pop_frame())
+        return frames
+
+    def test_single_stream_in_arrival_order(self):
+        scheduler = self.scheduler()
+        frames = [data_frame(1, bytes([i])) for i in range(10)]
+        scheduler.push_frames(frames)
+        self.assertEqual(frames, self.drain(scheduler))
+
+    def test_high_priority_stream_delivered_first(self):
+        scheduler = self.scheduler()
+        bulk = [data_frame(1, b'bulk') for _ in range(5)]
+        interactive = [data_frame(3, b'interactive') for _ in range(2)]
+        scheduler.push_frames(bulk + interactive)
+
+        self.assertEqual(interactive + bulk, self.drain(scheduler))
+
+    def test_depth_bounds_reordering(self):
+        scheduler = self.scheduler(depth=2)
+        bulk = [data_frame(1, b'bulk') for _ in range(5)]
+        interactive = data_frame(3, b'interactive')
+        scheduler.push_frames(bulk + [interactive])
+
+        # The interactive frame can only jump over the frames within the
+        # scheduling window.
+        delivered = self.drain(scheduler)
+        self.assertEqual(4, delivered.index(interactive))
+        self.assertEqual(bulk, [frame for frame in delivered if frame is not interactive])
+
+    def test_reprioritize(self):
+        scheduler = self.scheduler()
+        bulk, interactive = data_frame(1, b'bulk'), data_frame(3, b'interactive')
+        scheduler.push_frames([bulk, interactive])
+
+        scheduler.reprioritize_stream(1, 0)
+        self.assertEqual([bulk, interactive], self.drain(scheduler))
+
+
+if __name__ == "__main__":
+    unittest.main()
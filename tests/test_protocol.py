@@ -0,0 +1,571 @@
+import asyncio
+import unittest
+
+from satori.protocol import HTTP2CommonProtocol, HTTP2DirectProtocolMixin, HANDSHAKE_CODE
+from satori.stream import StreamState
+from satori.frame import (Frame, DataFrame, WindowUpdateFrame, PingFrame, SettingsFrame,
+                          PriorityFrame, HeadersFrame, ContinuationFrame, ConnectionSetting,
+                          GoAwayFrame, RstStreamFrame, FrameType, ErrorCode, FLAG_ACK,
+                          FLAG_END_STREAM, FLAG_END_HEADERS)
+from satori.codec import unpack_header
+from satori.hpack import HTTP2Codec
+from satori.exceptions import ProtocolError
+
+from tests.support import FakeTransport
+
+
+def written_frames(transport):
+    frames = []
+    data = bytes(transport.written)
+    while data:
+        length, raw_type, raw_flags, stream_id = unpack_header(data[:8])
+        frame = Frame.from_raw_header(raw_type, raw_flags, stream_id)
+        frame.deserialize(data[8:8 + length])
+        frames.append(frame)
+        data = data[8 + length:]
+    return frames
+
+
+class ProtocolTestCase(unittest.TestCase):
+    """ A connection on an event loop of its own, with nobody on the other end. """
+
+    protocol_class = HTTP2CommonProtocol
+    is_client = False
+    # Have the loop's clock stand still at `self.now`, for the test to move.
+    fake_clock = False
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        if self.fake_clock:
+            self.now = 100.0
+            self.loop.time = lambda: self.now
+        self.conn = self.protocol_class(is_client=self.is_client, loop=self.loop)
+
+    def tearDown(self):
+        self.conn._reader_task.cancel()
+        self.conn._writer_task.cancel()
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def connect_transport(self):
+        """ Hand the connection a transport, which keeps what's written to it. """
+        self.transport = FakeTransport()
+        self.conn.connection_made(self.transport)
+
+
+def on_stream(frame, stream_id):
+    """ `frame` serialized with its stream id replaced, even with an invalid one. """
+    data = bytearray(frame.serialize())
+    data[4:8] = stream_id.to_bytes(4, 'big')
+    return bytes(data)
+
+
+def data_frame(stream_id, size, end_stream=False):
+    frame = DataFrame(stream_id, flags=FLAG_END_STREAM if end_stream else 0)
+    frame.data = b'x' * size
+    # As if it came off the wire, payload length and all.
+    frame.length = len(frame)
+    return frame
+
+
+class TestInboundFlowControl(ProtocolTestCase):
+
+    def window_updates(self):
+        # Let the end of loop cycle flush happen.
+        self.loop.run_until_complete(asyncio.sleep(0))
+        return [(frame.stream_id, frame.window_size_increment)
+                for frame in self.conn._outgoing_control_frames
+                if isinstance(frame, WindowUpdateFrame)]
+
+    def test_updates_coalesced_per_cycle(self):
+        stream = self.conn._new_stream(stream_id=1)
+        for _ in range(4):
+            self.conn._dispatch_frame(data_frame(1, 10000))
+        for frame in list(stream._frame_queue._queue):
+            self.conn.data_consumed(frame.length, stream_id=1)
+
+        # A single update for each window, covering all four frames.
+        self.assertEqual([(0, 40008), (1, 40008)], self.window_updates())
+        self.assertEqual(2, self.conn.flow_control_stats()['window_updates_sent'])
+
+    def test_unknown_stream_data_credited(self):
+        for _ in range(4):
+            self.conn._dispatch_frame(data_frame(7, 10000))
+
+        self.assertEqual([(0, 40008)], self.window_updates())
+        self.assertEqual(65535, self.conn._receive_window.available)
+
+    def test_control_cost_reported(self):
+        stream = self.conn._new_stream(stream_id=1)
+        self.conn._dispatch_frame(data_frame(1, 40000))
+        self.conn.data_consumed(40002, stream_id=1)
+        self.window_updates()
+
+        stats = self.conn.flow_control_stats()
+        self.assertEqual(40002, stats['data_bytes_received'])
+        # Two WINDOW_UPDATEs, and the PING sampling the RTT.
+        self.assertEqual(2 * 12 + 16, stats['control_bytes_sent'])
+        self.assertAlmostEqual(40 / 40002, stats['control_bytes_per_body_byte'])
+
+
+class TestFrameDispatch(ProtocolTestCase):
+
+    def test_connection_frames_handled_inline(self):
+        tasks_before = len(asyncio.Task.all_tasks(self.loop))
+
+        ping = PingFrame()
+        ping.opaque_data = b'12345678'
+        self.conn._dispatch_frame(ping)
+        self.conn._dispatch_frame(SettingsFrame(settings={ConnectionSetting.ENABLE_PUSH: 0}))
+        self.conn._dispatch_frame(WindowUpdateFrame(0, window_size_increment=100))
+
+        # Handled without running the loop, and without any new tasks.
+        pong, settings_ack = self.conn._outgoing_control_frames
+        self.assertTrue(pong.flag_bits & FLAG_ACK)
+        self.assertEqual(b'12345678', pong.opaque_data)
+        self.assertTrue(settings_ack.is_ack)
+        self.assertEqual(0, self.conn._settings[ConnectionSetting.ENABLE_PUSH])
+        self.assertEqual(65635, self.conn._out_flow_control_window)
+        self.assertEqual(tasks_before, len(asyncio.Task.all_tasks(self.loop)))
+
+    def test_stream_frames(self):
+        stream = self.conn._new_stream(stream_id=1)
+        self.conn._dispatch_frame(WindowUpdateFrame(1, window_size_increment=100))
+        priority = PriorityFrame(1)
+        priority.priority = 5
+        self.conn._dispatch_frame(priority)
+        self.conn._dispatch_frame(data_frame(1, 10))
+
+        self.assertEqual(65635, stream._outgoing_flow_control_window)
+        self.assertEqual(5, stream.priority)
+        self.assertEqual(1, stream._frame_queue.qsize())
+
+
+class TestPing(ProtocolTestCase):
+    fake_clock = True
+
+    def ack(self, ping):
+        return PingFrame.pong_from_ping(ping)
+
+    def test_ping_measures_rtt(self):
+        waiter = self.loop.create_task(self.conn.ping())
+        self.loop.run_until_complete(asyncio.sleep(0))
+        ping = self.conn._outgoing_control_frames.pop()
+
+        self.now += 0.25
+        self.conn._dispatch_frame(self.ack(ping))
+        self.assertEqual(0.25, self.loop.run_until_complete(waiter))
+        self.assertEqual(0.25, self.conn.rtt.srtt)
+        self.assertEqual({}, self.conn._outstanding_pings)
+
+        # An ACK for a PING which was never sent is ignored.
+        self.conn._dispatch_frame(self.ack(ping))
+        self.assertEqual(1, self.conn.rtt.samples)
+
+    def test_new_streams_start_at_bdp(self):
+        self.conn._receive_window.consumption_rate = 10 * 2 ** 20
+        self.conn.rtt.sample(0.1)
+        stream = self.conn._new_stream(stream_id=1)
+        self.assertEqual(2 ** 20, stream._receive_window.size)
+
+    def test_keepalive(self):
+        self.conn.keepalive_interval = 10.0
+        self.conn.keepalive_timeout = 5.0
+        self.conn._connection_header_exchanged.set_result(True)
+
+        self.conn._keepalive()
+        ping = self.conn._outgoing_control_frames.pop()
+        self.now += 1.0
+        self.conn._dispatch_frame(self.ack(ping))
+        self.assertEqual(1.0, self.conn.rtt.srtt)
+
+        # Unanswered for longer than the timeout, the peer is given up on.
+        self.conn._keepalive()
+        self.now += 6.0
+        self.conn.close_connection = asyncio.coroutine(lambda: None)
+        self.conn._keepalive()
+        self.assertTrue(self.conn._connection_closed.done())
+        self.assertIsNone(self.conn._keepalive_handle)
+
+
+class TestAdmission(ProtocolTestCase):
+
+    def test_refused_over_limit(self):
+        self.conn._max_concurrent_streams = 1
+        self.assertTrue(self.conn._admit_stream())
+
+        headers = HeadersFrame(3, flags=FLAG_END_HEADERS)
+        headers.data = b''
+        self.conn._dispatch_frame(headers)
+
+        rst, = self.conn._outgoing_control_frames
+        self.assertEqual((3, ErrorCode.REFUSED_STREAM), (rst.stream_id, rst.error_code))
+        self.assertNotIn(3, self.conn._streams)
+        self.assertEqual(1, self.conn.metrics.streams_refused)
+
+        # Once the request in flight is done, there's room again.
+        self.conn._request_done(None)
+        self.assertTrue(self.conn._admit_stream())
+
+
+class TestClientAdmission(ProtocolTestCase):
+    is_client = True
+
+    def test_queued_over_peer_limit(self):
+        self.conn._settings[ConnectionSetting.MAX_CONCURRENT_STREAMS] = 1
+
+        self.loop.run_until_complete(self.conn._acquire_stream_slot())
+        self.conn._slot_streams.add(1)
+        waiting = self.loop.create_task(self.conn._acquire_stream_slot())
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertFalse(waiting.done())
+
+        # The END_STREAM of the first response frees up its slot.
+        self.conn._new_stream(stream_id=1)
+        self.conn._dispatch_frame(data_frame(1, 0, end_stream=True))
+        self.loop.run_until_complete(waiting)
+        self.assertEqual(1, self.conn._stream_slots_held)
+
+
+class TestStreamEviction(ProtocolTestCase):
+    fake_clock = True
+
+    def test_closed_streams_evicted(self):
+        stream = self.conn._new_stream(stream_id=1)
+        headers = HeadersFrame(1, flags=FLAG_END_HEADERS | FLAG_END_STREAM)
+        headers.data = b''
+        stream.process_frame(headers)
+        self.assertEqual(StreamState.HALF_CLOSED_REMOTE, stream.state)
+
+        self.loop.run_until_complete(stream._send_data(b'ok', end_stream=True))
+        self.assertEqual(StreamState.CLOSED, stream.state)
+
+        # Still around within the timeout.
+        self.now += self.conn.closed_stream_timeout / 2
+        self.conn._evict_closed_streams()
+        self.assertIn(1, self.conn._streams)
+
+        self.now += self.conn.closed_stream_timeout
+        self.conn._evict_closed_streams()
+        self.assertEqual({}, self.conn._streams)
+        self.assertIsNone(self.conn._evict_handle)
+
+    def test_headers_on_closed_stream(self):
+        self.conn._last_peer_stream_id = 5
+        headers = HeadersFrame(3, flags=FLAG_END_HEADERS)
+        headers.data = b''
+        self.conn._dispatch_frame(headers)
+
+        rst, = self.conn._outgoing_control_frames
+        self.assertEqual((3, ErrorCode.STREAM_CLOSED), (rst.stream_id, rst.error_code))
+        self.assertNotIn(3, self.conn._streams)
+
+
+class TestReadBackpressure(ProtocolTestCase):
+    is_client = True
+    fake_clock = True
+
+    def setUp(self):
+        super().setUp()
+        self.conn.max_stream_buffer = 1000
+        self.conn.max_connection_buffer = 4000
+
+    def test_stream_over_budget(self):
+        stream = self.conn._new_stream(stream_id=3)
+        stream.state = StreamState.HALF_CLOSED_LOCAL
+        self.conn._dispatch_frame(data_frame(3, 600))
+        self.assertFalse(self.conn._reading_paused)
+        self.conn._dispatch_frame(data_frame(3, 600))
+        self.assertTrue(self.conn._reading_paused)
+        self.assertFalse(self.conn._reading_resumed.is_set())
+
+        # Still more than half the budget is buffered after the first frame.
+        self.loop.run_until_complete(stream.read(600))
+        self.assertTrue(self.conn._reading_paused)
+        snapshot = self.conn.metrics_snapshot()
+        self.assertEqual(602, snapshot['inbound_buffered_bytes'])
+        self.assertEqual(602, snapshot['streams'][3]['buffered_bytes'])
+        self.assertEqual(1, snapshot['read_pauses'])
+
+        self.loop.run_until_complete(stream.read(600))
+        self.assertFalse(self.conn._reading_paused)
+        self.assertTrue(self.conn._reading_resumed.is_set())
+
+    def test_connection_over_budget(self):
+        for stream_id in (3, 5, 7, 9, 11):
+            self.conn._new_stream(stream_id=stream_id)
+            self.conn._dispatch_frame(data_frame(stream_id, 900))
+        self.assertTrue(self.conn._reading_paused)
+        self.assertEqual(set(), self.conn._overbuffered_streams)
+
+        # Streams which go away unread no longer count.
+        for stream_id in (3, 5, 7):
+            self.conn._streams[stream_id]._close()
+        self.now += self.conn.closed_stream_timeout
+        self.conn._evict_closed_streams()
+        self.assertEqual(2 * 902, self.conn._inbound_buffered)
+        self.assertFalse(self.conn._reading_paused)
+
+    def test_outgoing_frames_count(self):
+        self.conn._queue_frame(data_frame(3, 4000))
+        self.assertTrue(self.conn._reading_paused)
+        self.assertEqual(8 + 4002, self.conn.metrics_snapshot()['outgoing_buffered_bytes'])
+
+    def test_reset_stream_purged(self):
+        stream = self.conn._new_stream(stream_id=3)
+        self.conn._out_flow_control_window -= 4002
+        self.conn._queue_frame(data_frame(3, 4000))
+        stream.process_frame(RstStreamFrame(3, error_code=ErrorCode.CANCEL))
+
+        # Nothing is left to be sent, and the window it took is back.
+        self.assertEqual(0, len(self.conn._write_scheduler))
+        self.assertEqual(0, self.conn._outgoing_buffered)
+        self.assertEqual(65535, self.conn._out_flow_control_window)
+        self.assertFalse(self.conn._reading_paused)
+
+
+class TestSentReset(ProtocolTestCase):
+
+    def test_reset_purges_stream(self):
+        self.conn._queue_frame(data_frame(3, 100))
+        self.conn._queue_frame(data_frame(5, 100))
+        self.conn._queue_frame(RstStreamFrame(3, error_code=ErrorCode.CANCEL))
+
+        self.assertEqual(5, self.conn._write_scheduler.pop_frame().stream_id)
+        self.assertIsNone(self.conn._write_scheduler.pop_frame())
+
+    def test_reset_behind_stream(self):
+        self.conn._queue_frame(data_frame(3, 100))
+        self.conn._queue_frame(RstStreamFrame(3, error_code=ErrorCode.NO_ERROR),
+                               behind_stream=True)
+
+        data, rst = self.conn._write_scheduler.pop_frame(), self.conn._write_scheduler.pop_frame()
+        self.assertEqual((FrameType.DATA, FrameType.RST_STREAM), (data.frame_type, rst.frame_type))
+
+
+class TestHeaderBlocks(ProtocolTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.encoder = HTTP2Codec()
+
+    def header_block_frames(self, stream_id, headers, fragment_size):
+        header_block = bytes(self.encoder.encode_headers(headers))
+        fragments = [header_block[i:i + fragment_size]
+                     for i in range(0, len(header_block), fragment_size)]
+        frames = [HeadersFrame(stream_id)]
+        frames.extend(ContinuationFrame(stream_id) for _ in fragments[1:])
+        for frame, fragment in zip(frames, fragments):
+            frame.data = fragment
+        frames[-1].flag_bits |= FLAG_END_HEADERS
+        return frames
+
+    def test_continuation_decoded_as_it_arrives(self):
+        headers = {':method': 'GET', ':path': '/', 'user-agent': 'satori ' * 20}
+        first, *continuations = self.header_block_frames(3, headers, fragment_size=7)
+
+        self.assertIsNone(self.conn._frame_arrived(first))
+        # Whatever was complete in the first fragment is decoded already.
+        self.assertTrue(self.conn._header_codec.decoded_headers)
+        for frame in continuations[:-1]:
+            self.assertIsNone(self.conn._frame_arrived(frame))
+
+        self.assertIs(first, self.conn._frame_arrived(continuations[-1]))
+        self.assertTrue(first.end_headers)
+        self.assertEqual(headers, first.headers)
+
+        # The next block is decoded against the updated table.
+        first, = self.header_block_frames(5, headers, fragment_size=1000)
+        self.assertIs(first, self.conn._frame_arrived(first))
+        self.assertEqual(headers, first.headers)
+
+    def test_interleaved_frame(self):
+        first, *continuations = self.header_block_frames(3, {'x-a': 'b' * 20}, fragment_size=8)
+        self.conn._frame_arrived(first)
+        with self.assertRaises(ProtocolError):
+            self.conn._frame_arrived(data_frame(3, 10))
+
+    def test_header_list_too_large(self):
+        self.conn.max_header_list_size = 200
+        first, *continuations = self.header_block_frames(
+            3, {'x-{}'.format(i): 'v' * 10 for i in range(10)}, fragment_size=20)
+        for frame in [first] + continuations:
+            self.conn._frame_arrived(frame)
+        self.assertIsNone(first.headers)
+
+        # The request is turned away with a 431.
+        self.conn._dispatch_frame(first)
+        self.loop.run_until_complete(asyncio.sleep(0))
+        response, = self.conn._outgoing_control_frames
+        self.assertTrue(response.end_stream)
+        self.assertEqual({':status': '431'}, HTTP2Codec().decode_headers(bytes(response.data)))
+
+        # The table is still in sync for the blocks after it.
+        headers = {'x-1': 'v' * 10, ':method': 'GET'}
+        first, = self.header_block_frames(5, headers, fragment_size=1000)
+        self.conn._frame_arrived(first)
+        self.assertEqual(headers, first.headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
+class TestConnectionErrors(ProtocolTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.connect_transport()
+        self.conn._connection_header_exchanged.set_result(True)
+
+    def test_malformed_payload(self):
+        # A WINDOW_UPDATE with a 3 byte payload is only found out about as
+        # it's dispatched.
+        self.conn.data_received(bytes.fromhex('0003080000000000') + b'\x00\x00\x01')
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+
+        go_away = written_frames(self.transport)[-1]
+        self.assertIsInstance(go_away, GoAwayFrame)
+        self.assertEqual(ErrorCode.PROTOCOL_ERROR, go_away.error_code)
+        self.assertTrue(self.transport.closed)
+        self.assertTrue(self.conn._reader_task.done())
+
+    def test_flow_control_error(self):
+        # More DATA than the connection's receive window has room for.
+        self.conn._new_stream(stream_id=1)
+        self.conn.data_received(b''.join(data_frame(1, 16000).serialize() for _ in range(5)))
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+
+        go_away = written_frames(self.transport)[-1]
+        self.assertEqual(ErrorCode.FLOW_CONTROL_ERROR, go_away.error_code)
+        self.assertTrue(self.transport.closed)
+
+    def assert_protocol_error(self, data):
+        self.conn.data_received(data)
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+
+        go_away = written_frames(self.transport)[-1]
+        self.assertIsInstance(go_away, GoAwayFrame)
+        self.assertEqual(ErrorCode.PROTOCOL_ERROR, go_away.error_code)
+        self.assertTrue(self.transport.closed)
+
+    def test_data_on_connection(self):
+        self.assert_protocol_error(on_stream(data_frame(1, 6), 0))
+        # Turned away before it counted against the window.
+        self.assertEqual(65535, self.conn._receive_window.available)
+
+    def test_settings_on_stream(self):
+        self.assert_protocol_error(on_stream(SettingsFrame(), 5))
+
+    def test_ping_on_stream(self):
+        ping = PingFrame()
+        ping.opaque_data = b'12345678'
+        self.assert_protocol_error(on_stream(ping, 3))
+
+
+class DirectProtocol(HTTP2DirectProtocolMixin, HTTP2CommonProtocol):
+
+    def _complete_handshake(self, settings_frame):
+        self.update_settings(settings_frame)
+        self._connection_header_exchanged.set_result(True)
+
+
+class TestDirectProtocol(ProtocolTestCase):
+    protocol_class = DirectProtocol
+
+    def setUp(self):
+        super().setUp()
+        self.connect_transport()
+
+    def handshake(self):
+        settings = SettingsFrame(settings={ConnectionSetting.MAX_CONCURRENT_STREAMS: 7})
+        self.conn.data_received(bytes(HANDSHAKE_CODE) + settings.serialize())
+
+    def test_handshake_split_up(self):
+        settings = SettingsFrame(settings={ConnectionSetting.MAX_CONCURRENT_STREAMS: 7})
+        data = bytes(HANDSHAKE_CODE) + settings.serialize()
+        # The preface and the frame after it come in a few bytes at a time.
+        for i in range(0, len(data), 5):
+            self.assertFalse(self.conn._connection_header_exchanged.done())
+            self.conn.data_received(data[i:i + 5])
+
+        self.assertTrue(self.conn._connection_header_exchanged.done())
+        self.assertEqual(7, self.conn._settings[ConnectionSetting.MAX_CONCURRENT_STREAMS])
+
+    def test_frames_split_across_reads(self):
+        self.handshake()
+        ping = PingFrame()
+        ping.opaque_data = b'12345678'
+        data = ping.serialize()
+        other_ping = PingFrame()
+        other_ping.opaque_data = b'abcdefgh'
+        data += other_ping.serialize()
+
+        self.conn.data_received(data[:10])
+        self.assertNotIn(PingFrame, [type(frame) for frame in self.conn._outgoing_control_frames])
+        # The rest of the first frame, and part of the second one.
+        self.conn.data_received(data[10:20])
+        self.conn.data_received(data[20:])
+
+        pongs = [frame.opaque_data for frame in self.conn._outgoing_control_frames
+                 if isinstance(frame, PingFrame)]
+        self.assertEqual([b'12345678', b'abcdefgh'], pongs)
+
+    def test_invalid_preface(self):
+        self.conn.data_received(b'GET / HTTP/1.1\r\n\r\n')
+        self.loop.run_until_complete(asyncio.sleep(0))
+
+        go_away, = written_frames(self.transport)
+        self.assertEqual(ErrorCode.PROTOCOL_ERROR, go_away.error_code)
+        self.assertTrue(self.transport.closed)
+
+    def test_settings_first(self):
+        ping = PingFrame()
+        ping.opaque_data = b'12345678'
+        self.conn.data_received(bytes(HANDSHAKE_CODE) + ping.serialize())
+        self.loop.run_until_complete(asyncio.sleep(0))
+
+        go_away, = written_frames(self.transport)
+        self.assertEqual(ErrorCode.PROTOCOL_ERROR, go_away.error_code)
+        # The PING was never answered.
+        self.assertFalse(self.conn._outgoing_control_frames)
+
+    def test_malformed_payload(self):
+        self.handshake()
+        self.conn.data_received(bytes.fromhex('0003080000000000') + b'\x00\x00\x01')
+        self.loop.run_until_complete(asyncio.sleep(0))
+
+        go_away, = written_frames(self.transport)
+        self.assertEqual(ErrorCode.PROTOCOL_ERROR, go_away.error_code)
+        self.assertTrue(self.transport.closed)
+
+    def test_nothing_dispatched_after_error(self):
+        self.handshake()
+        ping = PingFrame()
+        ping.opaque_data = b'12345678'
+        bad_frame = bytes.fromhex('0003080000000000') + b'\x00\x00\x01'
+        self.conn.data_received(bad_frame + ping.serialize())
+        # More comes in before the connection is actually closed.
+        self.conn.data_received(ping.serialize())
+        self.loop.run_until_complete(asyncio.sleep(0))
+
+        self.assertFalse(self.conn._outgoing_control_frames)
+        go_away, = written_frames(self.transport)
+        self.assertEqual(ErrorCode.PROTOCOL_ERROR, go_away.error_code)
+
+    def test_data_on_connection(self):
+        self.handshake()
+        self.conn.data_received(on_stream(data_frame(1, 6), 0))
+        self.loop.run_until_complete(asyncio.sleep(0))
+
+        go_away, = written_frames(self.transport)
+        self.assertEqual(ErrorCode.PROTOCOL_ERROR, go_away.error_code)
+        self.assertTrue(self.transport.closed)
+
+    def test_eof_closes(self):
+        self.handshake()
+        self.conn.eof_received()
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertTrue(self.transport.closed)
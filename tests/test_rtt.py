@@ -0,0 +1,68 @@
+import asyncio
+import unittest
+
+from satori.rtt import RttEstimator
+from satori.client import select_connection
+
+
+class TestRttEstimator(unittest.TestCase):
+
+    def test_first_sample(self):
+        rtt = RttEstimator()
+        self.assertEqual(5.0, rtt.timeout(5.0))
+
+        rtt.sample(0.1)
+        self.assertEqual(0.1, rtt.srtt)
+        self.assertEqual(0.05, rtt.rttvar)
+        self.assertAlmostEqual(0.3, rtt.timeout(0.0))
+
+    def test_smoothing(self):
+        rtt = RttEstimator()
+        rtt.sample(0.1)
+        rtt.sample(0.9)
+
+        # A single slow sample only moves the estimate by an eighth.
+        self.assertAlmostEqual(0.2, rtt.srtt)
+        self.assertAlmostEqual(0.05 + (0.8 - 0.05) / 4, rtt.rttvar)
+        self.assertEqual(0.1, rtt.min_rtt)
+        self.assertEqual(0.9, rtt.latest_rtt)
+        self.assertEqual(2, rtt.samples)
+
+
+class FakeConnection(object):
+    def __init__(self, loop, srtt, streams=0, closed=False):
+        self.rtt = RttEstimator()
+        if srtt is not None:
+            self.rtt.sample(srtt)
+        self._streams = dict.fromkeys(range(streams))
+        self._connection_closed = asyncio.Future(loop=loop)
+        if closed:
+            self._connection_closed.set_result(True)
+
+
+class TestSelectConnection(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+
+    def connection(self, srtt, **kwargs):
+        return FakeConnection(self.loop, srtt, **kwargs)
+
+    def test_lowest_expected_latency(self):
+        near_busy = self.connection(0.01, streams=9)
+        far_idle = self.connection(0.05)
+        self.assertIs(far_idle, select_connection([near_busy, far_idle]))
+
+    def test_unmeasured_first(self):
+        unmeasured = self.connection(None, streams=3)
+        self.assertIs(unmeasured, select_connection([self.connection(0.01), unmeasured]))
+
+    def test_closed_skipped(self):
+        self.assertIsNone(select_connection([self.connection(0.01, closed=True)]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,105 @@
+import unittest
+import collections
+
+from satori.scheduler import (DeficitRoundRobinScheduler, priority_weight,
+                              is_control_frame, SCHEDULED_FRAME_TYPES)
+from satori.frame import (DataFrame, HeadersFrame, ContinuationFrame, WindowUpdateFrame,
+                          RstStreamFrame, SettingsFrame, FrameType, DEFAULT_PRIORITY)
+
+
+def data_frame(stream_id, size):
+    frame = DataFrame(stream_id)
+    frame.data = b'x' * size
+    return frame
+
+
+class TestPriorityWeight(unittest.TestCase):
+
+    def test_weight_range(self):
+        self.assertEqual(256, priority_weight(0))
+        self.assertEqual(1, priority_weight(2 ** 31 - 1))
+        self.assertEqual(128, priority_weight(DEFAULT_PRIORITY))
+
+    def test_control_frames(self):
+        self.assertTrue(is_control_frame(SettingsFrame()))
+        self.assertTrue(is_control_frame(WindowUpdateFrame(1, window_size_increment=5)))
+        self.assertTrue(is_control_frame(RstStreamFrame(1)))
+        self.assertFalse(is_control_frame(HeadersFrame(1)))
+        self.assertFalse(is_control_frame(ContinuationFrame(1)))
+        self.assertFalse(is_control_frame(data_frame(1, 10)))
+
+    def test_only_data_scheduled(self):
+        # Header blocks aren't control frames, but skip the scheduler too.
+        self.assertEqual(frozenset([FrameType.DATA]), SCHEDULED_FRAME_TYPES)
+
+
+class TestDeficitRoundRobinScheduler(unittest.TestCase):
+
+    def setUp(self):
+        self.scheduler = DeficitRoundRobinScheduler()
+
+    def drain(self, num_frames):
+        return [self.scheduler.pop_frame() for _ in range(num_frames)]
+
+    def test_stream_order_kept(self):
+        frames = [data_frame(1, size) for size in (10, 20, 30)]
+        for frame in frames:
+            self.scheduler.push_frame(frame)
+
+        self.assertEqual(3, len(self.scheduler))
+        self.assertEqual(frames, self.drain(3))
+        self.assertIsNone(self.scheduler.pop_frame())
+        self.assertEqual(0, len(self.scheduler))
+
+    def test_equal_weights_share_bandwidth(self):
+        # Stream 1 was queued first and sends large frames, yet stream 3
+        # still gets its turns.
+        for _ in range(10):
+            self.scheduler.push_frame(data_frame(1, 16000))
+            self.scheduler.push_frame(data_frame(3, 16000))
+
+        stream_ids = [frame.stream_id for frame in self.drain(10)]
+        self.assertEqual(5, stream_ids.count(1))
+        self.assertEqual(5, stream_ids.count(3))
+
+    def test_bandwidth_follows_weight(self):
+        for _ in range(200):
+            self.scheduler.push_frame(data_frame(1, 1000), priority=0)
+            self.scheduler.push_frame(data_frame(3, 1000), priority=DEFAULT_PRIORITY)
+
+        sent = collections.Counter(frame.stream_id for frame in self.drain(150))
+        self.assertAlmostEqual(2.0, sent[1] / sent[3], delta=0.25)
+
+    def test_starvation_protection(self):
+        scheduler = DeficitRoundRobinScheduler(max_skips=4)
+        for _ in range(100):
+            scheduler.push_frame(data_frame(1, 16000), priority=0)
+        scheduler.push_frame(data_frame(3, 16000), priority=2 ** 31 - 1)
+
+        stream_ids = [scheduler.pop_frame().stream_id for _ in range(10)]
+        self.assertIn(3, stream_ids)
+
+    def test_reprioritize_stream(self):
+        for _ in range(200):
+            self.scheduler.push_frame(data_frame(1, 1000))
+            self.scheduler.push_frame(data_frame(3, 1000))
+        self.scheduler.reprioritize_stream(3, 0)
+
+        sent = collections.Counter(frame.stream_id for frame in self.drain(150))
+        self.assertGreater(sent[3], sent[1])
+
+    def test_delete_stream(self):
+        self.scheduler.push_frame(data_frame(1, 10))
+        self.scheduler.push_frame(data_frame(3, 10))
+        self.scheduler.push_frame(data_frame(3, 20))
+        deleted = self.scheduler.delete_stream(3)
+
+        self.assertEqual([10, 20], [len(frame.data) for frame in deleted])
+        self.assertEqual([], self.scheduler.delete_stream(5))
+        self.assertEqual(1, len(self.scheduler))
+        self.assertEqual(1, self.scheduler.pop_frame().stream_id)
+        self.assertIsNone(self.scheduler.pop_frame())
+
+
+if __name__ == "__main__":
+    unittest.main()
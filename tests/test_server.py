@@ -0,0 +1,171 @@
+import asyncio
+import unittest
+
+from satori.server import serve
+from satori.client import connect
+
+
+@asyncio.coroutine
+def echo(request, response, context):
+    response.headers[':status'] = '200'
+    yield from response.end_headers()
+    if request[':method'] == 'POST':
+        body = yield from request.read_body()
+    else:
+        body = request[':path'].encode('ascii')
+    yield from response.write(body, end_stream=True)
+
+
+@asyncio.coroutine
+def ignore_body(request, response, context):
+    response.headers[':status'] = '200'
+    yield from response.end_headers()
+    yield from response.write(b'ignored', end_stream=True)
+
+
+@asyncio.coroutine
+def read_body(request, response, context):
+    body = yield from request.read_body()
+    response.headers[':status'] = '200'
+    yield from response.end_headers()
+    yield from response.write(str(len(body)), end_stream=True)
+
+
+class StalledBody(object):
+    """ Async iterable body which sends a first chunk, and never ends. """
+
+    def __init__(self):
+        self.sent = False
+
+    def __aiter__(self):
+        return self
+
+    @asyncio.coroutine
+    def __anext__(self):
+        if self.sent:
+            yield from asyncio.Future()
+        self.sent = True
+        return b'first'
+
+
+class RoundTripTestCase(unittest.TestCase):
+    """ A server and a client talking to it over a local socket. """
+
+    direct = False
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = None
+
+    def tearDown(self):
+        if self.server is not None:
+            self.server.close()
+            self.loop.run_until_complete(self.server.wait_closed())
+        # Whatever the connections left running.
+        tasks = asyncio.Task.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def run_until_complete(self, coro, timeout=5):
+        return self.loop.run_until_complete(asyncio.wait_for(coro, timeout))
+
+    @asyncio.coroutine
+    def serve(self, handler, **kwargs):
+        self.server = yield from serve(handler, {}, 0, '127.0.0.1', direct=self.direct,
+                                       **kwargs)
+        return self.server.sockets[0].getsockname()[1]
+
+    @asyncio.coroutine
+    def connect(self, port):
+        return (yield from connect('127.0.0.1:%d' % port, direct=self.direct))
+
+
+class TestRoundTrip(RoundTripTestCase):
+
+    def test_requests(self):
+        @asyncio.coroutine
+        def run():
+            port = yield from self.serve(echo)
+            conn = yield from self.connect(port)
+            results = []
+            response = yield from conn.request('GET', '/hello')
+            body = yield from response.read_body()
+            results.append((response.status_code, bytes(body)))
+
+            # Larger than the windows and the max frame size.
+            upload = bytes(range(256)) * 1000
+            response = yield from conn.request('POST', '/', body=upload)
+            chunks = yield from response.read_body_chunks()
+            results.append((response.status_code, b''.join(chunks) == upload))
+
+            # Several at once, over the same connection.
+            responses = yield from asyncio.gather(
+                *[conn.request('GET', '/%d' % i) for i in range(10)])
+            bodies = yield from asyncio.gather(*[response.read_body() for response in responses])
+            results.append([bytes(body) for body in bodies])
+            return results
+
+        self.assertEqual(self.run_until_complete(run()), [
+            (200, b'/hello'),
+            (200, True),
+            [('/%d' % i).encode('ascii') for i in range(10)],
+        ])
+
+
+class TestDirectRoundTrip(TestRoundTrip):
+    direct = True
+
+
+class TestRequestBody(RoundTripTestCase):
+
+    def test_unread_request_body(self):
+        @asyncio.coroutine
+        def run():
+            port = yield from self.serve(ignore_body)
+            conn = yield from self.connect(port)
+            # More than the initial window, the upload can't be done before
+            # the response is.
+            response = yield from conn.request('POST', '/', body=b'x' * 200000)
+            body = yield from response.read_body()
+            return response.status_code, bytes(body)
+
+        self.assertEqual(self.run_until_complete(run()), (200, b'ignored'))
+
+
+class TestDirectRequestBody(TestRequestBody):
+    direct = True
+
+
+class TestStreamBudget(RoundTripTestCase):
+
+    def test_released_on_disconnect(self):
+        @asyncio.coroutine
+        def run():
+            port = yield from self.serve(read_body, max_streams_in_flight=1)
+            conn = yield from self.connect(port)
+            stalled = asyncio.async(conn.request('POST', '/', body=StalledBody()))
+            yield from asyncio.sleep(0.05)
+
+            # Gone in the middle of sending the request body.
+            conn.writer.transport.abort()
+            stalled.cancel()
+            yield from asyncio.sleep(0.05)
+
+            conn = yield from self.connect(port)
+            response = yield from conn.request('POST', '/', body=b'again')
+            body = yield from response.read_body()
+            return response.status_code, bytes(body)
+
+        self.assertEqual(self.run_until_complete(run()), (200, b'5'))
+
+
+class TestDirectStreamBudget(TestStreamBudget):
+    direct = True
+
+
+if __name__ == '__main__':
+    unittest.main()
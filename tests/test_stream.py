@@ -0,0 +1,357 @@
+import asyncio
+import io
+import unittest
+
+from satori.stream import (Stream, StreamState, HEADERS_SENT, HEADERS_RECEIVED,
+                           END_STREAM_SENT, END_STREAM_RECEIVED)
+from satori.frame import (WindowUpdateFrame, RstStreamFrame, DataFrame, PushPromise,
+                          FrameType, ErrorCode, MAX_FRAME_SIZE, FLAG_END_STREAM)
+from satori.hpack import HTTP2Codec
+from satori.exceptions import StreamReset
+from satori.metrics import ConnectionMetrics, StreamMetrics
+from satori.flow import ReceiveWindow
+
+
+class FakeConnection(object):
+    def __init__(self, loop, window=65535):
+        self._ev_loop = loop
+        self._out_flow_control_window = window
+        self.metrics = ConnectionMetrics()
+        self.frames = []
+        self.closed = []
+        self.purged = []
+        self.consumed = []
+        self.buffered = 0
+
+    def data_consumed(self, consumed, stream_id=0):
+        self.consumed.append((stream_id, consumed))
+
+    def _frame_buffered(self, stream, size):
+        self.buffered += size
+
+    def _stream_closed(self, stream):
+        self.closed.append(stream.stream_id)
+
+    def _queue_frame(self, frame, behind_stream=False):
+        self.frames.append(frame)
+
+    def _purge_stream(self, stream_id):
+        self.purged.append(stream_id)
+
+    def _get_next_stream_id(self):
+        return 2
+
+    @asyncio.coroutine
+    def write_frame(self, frame):
+        self.frames.append(frame)
+
+
+class StreamTestCase(unittest.TestCase):
+    """ Streams of a `FakeConnection`, on an event loop of their own. """
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.conn = FakeConnection(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def new_stream(self, conn=None, state=StreamState.OPEN, header_codec=None):
+        stream = Stream(1, conn or self.conn, header_codec)
+        stream.state = state
+        return stream
+
+
+class TestSendData(StreamTestCase):
+
+    def test_split_on_max_frame_size(self):
+        conn = FakeConnection(self.loop)
+        stream = self.new_stream(conn)
+        body = bytes(range(256)) * 160
+
+        self.loop.run_until_complete(stream._send_data(body, end_stream=True))
+
+        self.assertEqual([MAX_FRAME_SIZE] * 2 + [len(body) - 2 * (MAX_FRAME_SIZE - 2) + 2],
+                         [len(frame) for frame in conn.frames])
+        self.assertEqual(body, b''.join(bytes(frame.data) for frame in conn.frames))
+        self.assertEqual([False, False, True], [frame.end_stream for frame in conn.frames])
+        # Every frame is a view of the body, nothing was copied.
+        self.assertTrue(all(frame.data.obj is body for frame in conn.frames))
+
+        sent = sum(len(frame) for frame in conn.frames)
+        self.assertEqual(65535 - sent, stream._outgoing_flow_control_window)
+        self.assertEqual(65535 - sent, conn._out_flow_control_window)
+        self.assertEqual(StreamState.HALF_CLOSED_LOCAL, stream.state)
+
+    def test_waits_for_window(self):
+        conn = FakeConnection(self.loop, window=1002)
+        stream = self.new_stream(conn)
+        send_task = self.loop.create_task(stream._send_data(b'x' * 3000, end_stream=True))
+        self.loop.run_until_complete(asyncio.sleep(0))
+
+        # Only as much as the connection window allows went out.
+        self.assertEqual([1002], [len(frame) for frame in conn.frames])
+        self.assertFalse(send_task.done())
+
+        conn._out_flow_control_window += 5000
+        stream.process_frame(WindowUpdateFrame(1, window_size_increment=5000))
+        self.loop.run_until_complete(send_task)
+
+        self.assertEqual([1002, 2002], [len(frame) for frame in conn.frames])
+        self.assertTrue(conn.frames[-1].end_stream)
+        self.assertEqual(1, conn.metrics.flow_control_stalls)
+
+    def test_empty_body(self):
+        conn = FakeConnection(self.loop)
+        stream = self.new_stream(conn)
+        self.loop.run_until_complete(stream._send_data(b'', end_stream=True))
+
+        self.assertEqual(1, len(conn.frames))
+        self.assertTrue(conn.frames[0].end_stream)
+
+
+class TestStreamState(StreamTestCase):
+
+    def test_request_response(self):
+        stream = self.new_stream(state=StreamState.IDLE)
+        stream._transition(HEADERS_SENT)
+        stream._transition(END_STREAM_SENT)
+        self.assertEqual(StreamState.HALF_CLOSED_LOCAL, stream.state)
+
+        # Not closed until the response has ended too.
+        stream._transition(HEADERS_RECEIVED)
+        self.assertEqual([], self.conn.closed)
+        stream._transition(END_STREAM_RECEIVED)
+        self.assertEqual(StreamState.CLOSED, stream.state)
+        self.assertEqual([1], self.conn.closed)
+
+    def test_reset_wakes_reader(self):
+        stream = self.new_stream()
+        reader = self.loop.create_task(stream._read_data_chunks())
+        self.loop.run_until_complete(asyncio.sleep(0))
+
+        stream.process_frame(RstStreamFrame(1, error_code=ErrorCode.CANCEL))
+        with self.assertRaises(StreamReset):
+            self.loop.run_until_complete(reader)
+        self.assertEqual([1], self.conn.closed)
+
+    def test_lazy_allocation(self):
+        stream = self.new_stream()
+        self.assertIsNone(stream._frames)
+        self.assertIsNone(stream._window_waiter)
+        with self.assertRaises(AttributeError):
+            stream.unknown = None
+
+    def test_window_and_metrics_handed_in(self):
+        receive_window = ReceiveWindow(max_size=1 << 20)
+        metrics = StreamMetrics(12.5, response_inbound=True)
+        stream = Stream(1, self.conn, None, receive_window=receive_window, metrics=metrics)
+        self.assertIs(receive_window, stream._receive_window)
+        self.assertIs(metrics, stream.metrics)
+
+
+class ChunkSource(object):
+    """ Async iterable over `chunks`, counting how many were pulled. """
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.pulled = 0
+
+    def __aiter__(self):
+        return self
+
+    @asyncio.coroutine
+    def __anext__(self):
+        if self.pulled == len(self.chunks):
+            raise StopAsyncIteration
+        self.pulled += 1
+        return self.chunks[self.pulled - 1]
+
+
+class TestSendBody(StreamTestCase):
+
+    def test_async_iterable_pulled_lazily(self):
+        conn = FakeConnection(self.loop, window=1002)
+        stream = self.new_stream(conn)
+        source = ChunkSource([b'a' * 1000, b'', b'b' * 1000])
+        send_task = self.loop.create_task(stream._send_body(source, end_stream=True))
+        self.loop.run_until_complete(asyncio.sleep(0))
+
+        # Out of credit after the first chunk, nothing more is pulled.
+        self.assertEqual(1, source.pulled)
+        self.assertEqual([1002], [len(frame) for frame in conn.frames])
+
+        conn._out_flow_control_window += 5000
+        stream._window_updated()
+        self.loop.run_until_complete(send_task)
+        self.assertEqual([1002, 1002, 2], [len(frame) for frame in conn.frames])
+        self.assertTrue(conn.frames[-1].end_stream)
+
+    def test_file_read_within_window(self):
+        conn = FakeConnection(self.loop, window=1002)
+        stream = self.new_stream(conn)
+        body = io.BytesIO(b'x' * 3000)
+        send_task = self.loop.create_task(stream._send_body(body, end_stream=True))
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertEqual(1000, body.tell())
+
+        conn._out_flow_control_window += MAX_FRAME_SIZE
+        stream._window_updated()
+        self.loop.run_until_complete(send_task)
+        self.assertEqual(b'x' * 3000, b''.join(bytes(frame.data) for frame in conn.frames))
+        self.assertTrue(conn.frames[-1].end_stream)
+
+    def test_reset_stops_sending(self):
+        conn = FakeConnection(self.loop, window=1002)
+        stream = self.new_stream(conn)
+        send_task = self.loop.create_task(stream._send_body(b'x' * 3000, end_stream=True))
+        self.loop.run_until_complete(asyncio.sleep(0))
+
+        stream.process_frame(RstStreamFrame(1, error_code=ErrorCode.REFUSED_STREAM))
+        with self.assertRaises(StreamReset):
+            self.loop.run_until_complete(send_task)
+        self.assertEqual(1, len(conn.frames))
+        # Whatever is still queued up on the stream is dropped.
+        self.assertEqual([1], conn.purged)
+
+    def test_reset_stops_reading_file(self):
+        conn = FakeConnection(self.loop, window=1002)
+        stream = self.new_stream(conn)
+        body = io.BytesIO(b'x' * 3000)
+        send_task = self.loop.create_task(stream._send_body(body, end_stream=True))
+        self.loop.run_until_complete(asyncio.sleep(0))
+
+        stream.process_frame(RstStreamFrame(1, error_code=ErrorCode.CANCEL))
+        with self.assertRaises(StreamReset):
+            self.loop.run_until_complete(send_task)
+        # Nothing more was read once the window ran out.
+        self.assertEqual(1000, body.tell())
+        self.assertEqual(1, len(conn.frames))
+
+    def test_unsupported_body(self):
+        stream = self.new_stream()
+        with self.assertRaises(TypeError):
+            self.loop.run_until_complete(stream._send_body(42, end_stream=True))
+
+
+class TestSendHeaders(StreamTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.stream = self.new_stream(state=StreamState.IDLE, header_codec=HTTP2Codec())
+
+    def test_single_frame(self):
+        self.stream.add_header(':method', 'GET', is_request_header=True)
+        self.loop.run_until_complete(self.stream.open_request())
+
+        headers, = self.conn.frames
+        self.assertTrue(headers.end_headers)
+        self.assertTrue(headers.end_stream)
+        self.assertEqual(StreamState.HALF_CLOSED_LOCAL, self.stream.state)
+
+    def test_continued_over_max_frame_size(self):
+        for i in range(400):
+            self.stream.add_header('x-header-{}'.format(i), 'value {}'.format(i) * 10,
+                                   is_request_header=False)
+        self.loop.run_until_complete(self.stream._send_headers(end_headers=True,
+                                                               end_stream=False))
+
+        first, *continuations = self.conn.frames
+        self.assertEqual(FrameType.HEADERS, first.frame_type)
+        self.assertTrue(continuations)
+        self.assertTrue(all(frame.frame_type == FrameType.CONTINUATION
+                            for frame in continuations))
+        self.assertTrue(all(len(frame) <= MAX_FRAME_SIZE for frame in self.conn.frames))
+        self.assertEqual([False] * len(continuations) + [True],
+                         [frame.end_headers for frame in self.conn.frames])
+
+        header_block = b''.join(bytes(frame.data) for frame in self.conn.frames)
+        self.assertEqual(self.stream._response_headers,
+                         HTTP2Codec().decode_headers(header_block))
+
+    def test_push_promise_ends_block(self):
+        self.stream.state = StreamState.OPEN
+        push_task = self.loop.create_task(self.stream._promise_push({':path': '/style.css'}))
+        self.loop.run_until_complete(asyncio.sleep(0))
+
+        promise, = self.conn.frames
+        self.assertIsInstance(promise, PushPromise)
+        self.assertEqual(2, promise.promised_stream_id)
+        self.assertTrue(promise.end_headers)
+
+        promised_stream = Stream(2, self.conn, None)
+        self.stream.receive_promised_stream(promised_stream)
+        self.assertIs(promised_stream, self.loop.run_until_complete(push_task))
+
+
+def data_frame(stream_id, data, end_stream=False):
+    frame = DataFrame(stream_id, flags=FLAG_END_STREAM if end_stream else 0)
+    frame.data = memoryview(data)
+    frame.length = len(frame)
+    return frame
+
+
+class TestReadData(StreamTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.stream = self.new_stream(state=StreamState.HALF_CLOSED_LOCAL)
+
+    def read(self, num_bytes):
+        return self.loop.run_until_complete(self.stream.read(num_bytes))
+
+    def test_bounded_read(self):
+        self.stream.process_frame(data_frame(1, b'abcdef'))
+        self.stream.process_frame(data_frame(1, b'gh', end_stream=True))
+
+        self.assertEqual(b'abcd', self.read(4))
+        # Credit is only handed back for what was read, padding aside.
+        self.assertEqual([(1, 2), (1, 4)], self.conn.consumed)
+
+        # Never more than what's left of the current chunk.
+        self.assertEqual(b'ef', self.read(10))
+        self.assertEqual(b'gh', self.read(10))
+        self.assertEqual(b'', self.read(10))
+        self.assertEqual([(1, 2), (1, 4), (1, 2), (0, 2), (0, 2)], self.conn.consumed)
+
+    def test_read_waits_for_data(self):
+        reader = self.loop.create_task(self.stream.read(4))
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.assertFalse(reader.done())
+
+        self.stream.process_frame(data_frame(1, b'ab'))
+        self.assertEqual(b'ab', self.loop.run_until_complete(reader))
+
+    def test_iter_chunks(self):
+        self.stream.process_frame(data_frame(1, b'ab'))
+        self.stream.process_frame(data_frame(1, b'', end_stream=False))
+        self.stream.process_frame(data_frame(1, b'cd', end_stream=True))
+
+        chunks = self.stream.iter_chunks().__aiter__()
+        first = self.loop.run_until_complete(chunks.__anext__())
+        self.assertIsInstance(first, memoryview)
+        self.assertEqual(b'ab', bytes(first))
+        self.assertEqual(b'cd', bytes(self.loop.run_until_complete(chunks.__anext__())))
+        with self.assertRaises(StopAsyncIteration):
+            self.loop.run_until_complete(chunks.__anext__())
+
+    def test_buffered_bytes(self):
+        self.stream.process_frame(data_frame(1, b'abcdef'))
+        self.stream.process_frame(data_frame(1, b'gh', end_stream=True))
+        self.assertEqual(12, self.stream._frames.buffered_bytes)
+        self.assertEqual(12, self.conn.buffered)
+
+        # Counted off as frames are taken off the queue, not as they're read.
+        self.read(2)
+        self.assertEqual(4, self.stream._frames.buffered_bytes)
+        self.assertEqual(4, self.conn.buffered)
+
+    def test_end_stream_on_headers(self):
+        self.stream.state = StreamState.HALF_CLOSED_REMOTE
+        self.assertEqual(b'', self.read(-1))
+        self.assertEqual([], self.conn.consumed)
+
+
+if __name__ == "__main__":
+    unittest.main()
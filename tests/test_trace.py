@@ -0,0 +1,77 @@
+import io
+import json
+import unittest
+
+from satori.trace import (trace_point, add_sink, remove_sink, RingBufferSink,
+                          JSONLinesSink)
+
+
+class TestTracing(unittest.TestCase):
+
+    def setUp(self):
+        self.sinks = []
+
+    def tearDown(self):
+        for sink in self.sinks:
+            remove_sink(sink)
+
+    def attach(self, sink, names=None):
+        self.sinks.append(sink)
+        return add_sink(sink, names)
+
+    def test_disabled_without_sink(self):
+        self.assertFalse(trace_point('test.disabled').enabled)
+
+    def test_same_point_per_name(self):
+        self.assertIs(trace_point('test.shared'), trace_point('test.shared'))
+
+    def test_ring_buffer(self):
+        point = trace_point('test.ring')
+        ring = self.attach(RingBufferSink(capacity=2))
+        self.assertTrue(point.enabled)
+
+        for i in range(3):
+            point.emit(i=i)
+
+        events = ring.events()
+        self.assertEqual([1, 2], [event['i'] for event in events])
+        self.assertEqual('test.ring', events[0]['event'])
+        self.assertIn('ts', events[0])
+
+        remove_sink(ring)
+        self.assertFalse(point.enabled)
+
+    def test_fields_captured_as_is(self):
+        point = trace_point('test.lazy')
+        ring = self.attach(RingBufferSink())
+        headers = {':status': '200'}
+        point.emit(headers=headers)
+        self.assertIs(headers, ring.events()[0]['headers'])
+
+    def test_names_and_prefixes(self):
+        wanted = trace_point('test.prefix.wanted')
+        exact = trace_point('test.exact')
+        other = trace_point('test.other')
+        self.attach(RingBufferSink(), names=['test.prefix.', 'test.exact'])
+
+        self.assertTrue(wanted.enabled)
+        self.assertTrue(exact.enabled)
+        self.assertFalse(other.enabled)
+        # Points created later pick up the sink too.
+        self.assertTrue(trace_point('test.prefix.later').enabled)
+
+    def test_json_lines(self):
+        output = io.StringIO()
+        point = trace_point('test.json')
+        self.attach(JSONLinesSink(output), names=['test.json'])
+        point.emit(stream_id=1, data=b'\x00')
+
+        event = json.loads(output.getvalue().splitlines()[0])
+        self.assertEqual('test.json', event['event'])
+        self.assertEqual(1, event['stream_id'])
+        # Not representable in JSON, so written as its repr.
+        self.assertEqual(repr(b'\x00'), event['data'])
+
+
+if __name__ == "__main__":
+    unittest.main()